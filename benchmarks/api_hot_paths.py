@@ -0,0 +1,235 @@
+"""
+Load-test the API hot paths in-process: discover_services, provider listing,
+request listing and place_details. Seeds a synthetic, spatially clustered
+dataset, stubs Google Places, Nominatim and ipinfo with local fake servers,
+and reports p50/p95/p99 latency, throughput and queries per request as JSON.
+
+    python -m benchmarks.api_hot_paths [--providers 10000] [--requests 500] [--output results.json]
+    python -m benchmarks.api_hot_paths --baseline last-release.json   # exit 1 on regressions
+
+Client and upstream rate limits are lifted for the run, since every request comes
+from a handful of tokens and the upstreams are local stubs. Any failed request
+exits with status 1, as the latencies would not describe the real code path.
+
+Concurrency above 1 needs a shared database: set BENCH_DATABASE_URL to a Postgres
+instance (each thread opens its own connection, and ':memory:' is per connection).
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import percentiles, seed_dataset, setup_django
+
+SCENARIOS = ('discover-services', 'provider-list', 'request-list', 'place-details')
+
+
+def fake_ipinfo(lat, lng):
+    def handler(query):
+        return 200, {'loc': f'{lat},{lng}'}
+    return handler
+
+
+def build_urls(name, dataset, provider_ids, rng, count):
+    """Request paths for one scenario, drawn with a fixed seed so runs are comparable"""
+    if name == 'discover-services':
+        return [
+            f"/api/discover/?service={rng.choice(dataset['categories'])}"
+            f"&address={rng.randrange(len(dataset['clusters']))}+Bench+Road"
+            f"&radius={rng.choice((1000, 3000, 5000))}&sort={rng.choice(('distance', 'rating'))}"
+            for _ in range(count)
+        ]
+    if name == 'provider-list':
+        return [f"/api/providers/?ordering={rng.choice(('-rating', 'rating'))}" for _ in range(count)]
+    if name == 'request-list':
+        return ['/api/requests/'] * count
+    # Half local providers, half Google places
+    return [
+        f"/api/places/{rng.choice(provider_ids)}/" if rng.random() < 0.5 else f"/api/places/stub-{rng.randrange(50)}/"
+        for _ in range(count)
+    ]
+
+
+def run_scenario(urls, tokens, concurrency, warmup):
+    """Issue every URL with `concurrency` client threads; returns the scenario summary"""
+    from django.db import connection
+    from django.test import Client
+    from services.querybudget import count_queries
+
+    local = threading.local()
+    lock = threading.Lock()
+    timings, queries, errors = [], [], 0
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = Client(HTTP_AUTHORIZATION=f"Bearer {random.choice(tokens)}")
+        return local.client
+
+    def request(url, record=True):
+        nonlocal errors
+        with count_queries() as counter:
+            start = time.perf_counter()
+            response = client().get(url)
+            elapsed = (time.perf_counter() - start) * 1000
+        if not record:
+            return
+        with lock:
+            timings.append(elapsed)
+            queries.append(counter.count)
+            if response.status_code >= 400:
+                errors += 1
+
+    def worker(batch):
+        try:
+            for url in batch:
+                request(url)
+        finally:
+            connection.close()
+
+    for url in urls[:warmup]:
+        request(url, record=False)
+    batches = [urls[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    if concurrency == 1:
+        for url in urls:
+            request(url)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, batches))
+    wall = time.perf_counter() - start
+    return {
+        'requests': len(urls),
+        'errors': errors,
+        'concurrency': concurrency,
+        'throughput_rps': round(len(urls) / wall, 1),
+        **percentiles(timings),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """List scenarios whose p95 latency or max query count regressed against `baseline`"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append(f"{name}: queries {previous['queries_max']} -> {current['queries_max']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--providers', type=int, default=10000)
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON results here as well as to stdout')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown, as a fraction')
+    args = parser.parse_args()
+
+    setup_django()
+    import django
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from rest_framework_simplejwt.tokens import AccessToken
+    from services.cache import reset_caches
+    from services.geocoding import reset_geocoder
+    from services.ratelimit import reset_rate_limits
+    from services.models import ServiceProvider
+    from services.registry import category_registry
+    from services.testing import FakeNominatim, StubServer, fake_nearby_search, fake_place_details
+    from services.upstream import reset_upstreams
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    concurrency = args.concurrency
+    if concurrency > 1 and connection.vendor == 'sqlite':
+        print("SQLite databases are per connection here; running with --concurrency 1", file=sys.stderr)
+        concurrency = 1
+
+    seed_start = time.perf_counter()
+    dataset = seed_dataset(args.providers, clusters=args.clusters, customers=args.customers, seed=args.seed)
+    seed_seconds = round(time.perf_counter() - seed_start, 1)
+    provider_ids = list(ServiceProvider.objects.values_list('pk', flat=True))
+    tokens = [str(AccessToken.for_user(user)) for user in User.objects.filter(pk__in=dataset['customers'])]
+
+    addresses = {f'{n} Bench Road': center for n, center in enumerate(dataset['clusters'])}
+    ip_lat, ip_lng = dataset['clusters'][0]
+    with StubServer({
+        '/nearbysearch/json': fake_nearby_search,
+        '/details/json': fake_place_details,
+        '/search': FakeNominatim(addresses),
+        '/ipinfo': fake_ipinfo(ip_lat, ip_lng),
+    }) as server:
+        settings.ALLOWED_HOSTS = ['testserver']
+        settings.GOOGLE_PLACES_API_URL = server.url
+        settings.IPINFO_URL = f'{server.url}/ipinfo'
+        settings.NOMINATIM_DOMAIN = server.url.split('://')[1]
+        settings.NOMINATIM_SCHEME = 'http'
+        settings.QUERY_BUDGET_ACTION = 'log'
+        settings.CLIENT_RATE_LIMITS = {}
+        settings.UPSTREAM_RATE_LIMITS = {}
+        reset_rate_limits()
+        reset_upstreams()
+        reset_geocoder()
+        reset_caches()
+        category_registry.load()
+
+        rng = random.Random(args.seed)
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'providers': args.providers,
+                'clusters': args.clusters,
+                'customers': args.customers,
+                'seed': args.seed,
+                'seed_seconds': seed_seconds,
+            },
+            'scenarios': {},
+        }
+        for name in scenarios:
+            urls = build_urls(name, dataset, provider_ids, rng, args.requests)
+            results['scenarios'][name] = run_scenario(urls, tokens, concurrency, args.warmup)
+        results['meta']['upstream_calls'] = len(server.requests)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    failed = [f"{name}: {summary['errors']} of {summary['requests']} requests failed"
+              for name, summary in results['scenarios'].items() if summary['errors']]
+    for line in failed:
+        print(f"ERRORS {line}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
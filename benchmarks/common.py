@@ -0,0 +1,154 @@
+import os
+import random
+import statistics
+import time
+# benchmarks/common.py
+
+
+def setup_django():
+    """
+    Configure Django against a throwaway database and apply migrations.
+    Set DATABASE_URL to benchmark against a real Postgres instance instead.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nearmeconnect.settings')
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite://:memory:')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+
+def seed_providers(count, category_name='electrician', center=(31.5204, 74.3587), spread=0.5, seed=42):
+    """Create `count` providers scattered around `center` with bulk inserts"""
+    from django.contrib.auth.models import User
+    from services.models import ServiceCategory, ServiceProvider
+    from services.spatial import encode_geohash
+
+    rng = random.Random(seed)
+    category, _ = ServiceCategory.objects.get_or_create(name=category_name)
+    start = User.objects.count()
+    users = User.objects.bulk_create(
+        [User(username=f'bench{start + i}') for i in range(count)], batch_size=5000
+    )
+    providers = []
+    for user in users:
+        lat = center[0] + rng.uniform(-spread, spread)
+        lng = center[1] + rng.uniform(-spread, spread)
+        providers.append(ServiceProvider(
+            user=user, category=category, bio='', phone='0', address='',
+            latitude=lat, longitude=lng, geohash=encode_geohash(lat, lng),
+            rating=round(rng.uniform(1, 5), 1),
+        ))
+    ServiceProvider.objects.bulk_create(providers, batch_size=5000)
+    analyze()
+    return category
+
+
+def analyze():
+    """Refresh planner statistics, as autovacuum would on a live database"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def timeit(func, repeat=20):
+    """Run `func` `repeat` times and return timings in milliseconds"""
+    func()  # warm caches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def percentiles(timings):
+    """p50/p95/p99, mean and max of timings in milliseconds"""
+    if len(timings) < 2:
+        timings = list(timings) * 2
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def seed_dataset(providers, categories=('electrician', 'plumber', 'carpenter', 'painter'), clusters=20,
+                 customers=200, requests_per_customer=20, reviews_per_provider=3,
+                 center=(31.5204, 74.3587), spread=0.3, seed=42, batch_size=5000):
+    """
+    Create categories, spatially clustered providers with profiles, and customers
+    with service requests and reviews, all with bulk inserts. Providers gather
+    around `clusters` random centers, as they do around real neighbourhoods.
+    Returns {'categories': [...], 'customers': [user ids], 'clusters': [(lat, lng), ...]}.
+    """
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from services.models import Review, ServiceCategory, ServiceProvider, ServiceRequest, UserProfile
+    from services.ratings import rebuild_aggregates
+    from services.spatial import encode_geohash
+
+    rng = random.Random(seed)
+    category_objs = [ServiceCategory.objects.get_or_create(name=name)[0] for name in categories]
+    centers = [(center[0] + rng.uniform(-spread, spread), center[1] + rng.uniform(-spread, spread))
+               for _ in range(clusters)]
+
+    start = User.objects.count()
+    customer_users = User.objects.bulk_create(
+        [User(username=f'customer{start + i}') for i in range(customers)], batch_size=batch_size
+    )
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in customer_users], batch_size=batch_size)
+
+    created = 0
+    provider_ids = []
+    while created < providers:
+        count = min(batch_size, providers - created)
+        users = User.objects.bulk_create(
+            [User(username=f'provider{start + customers + created + i}', first_name='Bench') for i in range(count)]
+        )
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, phone='0300', is_service_provider=True) for user in users]
+        )
+        batch = []
+        for user in users:
+            cluster_lat, cluster_lng = rng.choice(centers)
+            lat, lng = rng.gauss(cluster_lat, 0.02), rng.gauss(cluster_lng, 0.02)
+            batch.append(ServiceProvider(
+                user=user, category=rng.choice(category_objs), bio='Benchmark provider', phone='0300',
+                address='', latitude=lat, longitude=lng, geohash=encode_geohash(lat, lng),
+                bayesian_rating=settings.RATING_PRIOR_MEAN,
+            ))
+        provider_ids.extend(p.pk for p in ServiceProvider.objects.bulk_create(batch))
+        created += count
+
+    ServiceRequest.objects.bulk_create([
+        ServiceRequest(customer=customer, provider_id=rng.choice(provider_ids), message='Need help')
+        for customer in customer_users for _ in range(requests_per_customer)
+    ], batch_size=batch_size)
+    reviews = []
+    for provider_id in provider_ids:
+        for _ in range(rng.randint(0, 2 * reviews_per_provider)):
+            reviews.append(Review(customer=rng.choice(customer_users), provider_id=provider_id,
+                                  rating=rng.randint(1, 5), comment='ok'))
+        if len(reviews) >= batch_size:
+            Review.objects.bulk_create(reviews)
+            reviews = []
+    Review.objects.bulk_create(reviews)
+    rebuild_aggregates(batch_size=batch_size)
+    analyze()
+    return {
+        'categories': [c.name for c in category_objs],
+        'customers': [user.pk for user in customer_users],
+        'clusters': centers,
+    }
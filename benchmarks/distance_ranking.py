@@ -0,0 +1,63 @@
+"""
+Compare nearest-10 provider ranking over 100k providers: the old
+Euclidean ORM expression against the geohash + haversine pipeline.
+
+    python -m benchmarks.distance_ranking [--providers 100000]
+"""
+import argparse
+import json
+
+from .common import seed_providers, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--providers', type=int, default=100000)
+    parser.add_argument('--radius', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    import numpy as np
+    from django.db.models import ExpressionWrapper, F, FloatField
+    from django.db.models.functions import Power, Sqrt
+    from services.distance import rank_by_distance
+    from services.models import ServiceProvider
+    from services.spatial import nearest_providers
+
+    category = seed_providers(args.providers)
+    lat, lng = 31.5204, 74.3587
+    queryset = ServiceProvider.objects.filter(category=category)
+
+    def orm_expression():
+        return list(queryset.annotate(
+            distance=ExpressionWrapper(
+                Sqrt(Power(F('latitude') - lat, 2) + Power(F('longitude') - lng, 2)),
+                output_field=FloatField()
+            )
+        ).order_by('distance')[:10])
+
+    def full_scan_vectorized():
+        rows = np.array(list(queryset.values_list('pk', 'latitude', 'longitude')))
+        indices, _ = rank_by_distance(lat, lng, rows[:, 1], rows[:, 2], args.radius, 10)
+        return ServiceProvider.objects.in_bulk(rows[indices, 0].astype(int).tolist())
+
+    def spatial_index():
+        return nearest_providers(queryset, lat, lng, args.radius, limit=10)
+
+    lats = np.random.default_rng(0).uniform(lat - 0.5, lat + 0.5, args.providers)
+    lngs = np.random.default_rng(1).uniform(lng - 0.5, lng + 0.5, args.providers)
+
+    results = {
+        'providers': args.providers,
+        'radius_m': args.radius,
+        'orm_expression': timeit(orm_expression, args.repeat),
+        'full_scan_vectorized': timeit(full_scan_vectorized, args.repeat),
+        'spatial_index': timeit(spatial_index, args.repeat),
+        'haversine_only': timeit(lambda: rank_by_distance(lat, lng, lats, lngs, args.radius, 10), args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compare serializing providers with the nested ServiceProviderSerializer
+against the flat ProviderReadSerializer over .values() rows.
+
+    python -m benchmarks.provider_serialization [--providers 10000]
+"""
+import argparse
+import json
+
+from .common import seed_providers, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--providers', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory
+    from services.models import ServiceProvider, UserProfile
+    from services.serializers import ProviderReadSerializer, ServiceProviderSerializer
+
+    category = seed_providers(args.providers)
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id, is_service_provider=True)
+         for user_id in ServiceProvider.objects.values_list('user_id', flat=True)],
+        batch_size=5000,
+    )
+    queryset = ServiceProvider.objects.filter(category=category).order_by('id')
+    context = {'request': RequestFactory().get('/api/providers/')}
+    instances = list(queryset.select_related('user__userprofile', 'category'))
+    rows = list(queryset.values(*ProviderReadSerializer.values))
+
+    results = {
+        'providers': args.providers,
+        # Serialization alone, rows already in memory
+        'model_serializer': timeit(lambda: ServiceProviderSerializer(instances, many=True, context=context).data,
+                                   args.repeat),
+        'flat_serializer': timeit(lambda: ProviderReadSerializer(rows, many=True, context=context).data,
+                                  args.repeat),
+        # Fetch plus serialization, as a list request pays it
+        'model_serializer_with_fetch': timeit(lambda: ServiceProviderSerializer(
+            queryset.select_related('user__userprofile', 'category'), many=True, context=context).data, args.repeat),
+        'flat_serializer_with_fetch': timeit(lambda: ProviderReadSerializer(
+            queryset.values(*ProviderReadSerializer.values), many=True, context=context).data, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
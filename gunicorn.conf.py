@@ -0,0 +1,83 @@
+"""
+Production server settings for gunicorn, read from the environment.
+
+    gunicorn -c gunicorn.conf.py
+
+GUNICORN_WORKER_CLASS picks how requests are served:
+  sync     one request per process; simplest, for CPU-bound traffic
+  gthread  GUNICORN_THREADS requests per process (default); suits views that
+           wait on Postgres, Google Places and Nominatim
+  uvicorn  ASGI event loop (nearmeconnect.asgi); needed for the async discover
+           endpoint's parallel upstream calls and the /api/feed/ event stream,
+           which the WSGI worker classes answer with 501
+"""
+import multiprocessing
+import os
+import sys
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn_worker.UvicornWorker',
+}
+
+worker_type = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_type not in WORKER_CLASSES:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be one of: {', '.join(WORKER_CLASSES)}")
+worker_class = WORKER_CLASSES[worker_type]
+wsgi_app = 'nearmeconnect.asgi:application' if worker_type == 'uvicorn' else 'nearmeconnect.wsgi:application'
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4 if worker_type == 'gthread' else 1))
+# Feeds hold connections open; keep-alive comments stop the worker being killed as idle
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks cannot accumulate; jitter avoids restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+# Import Django once in the master so workers fork with the code already loaded
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+warmup = os.getenv('GUNICORN_WARMUP', 'True') == 'True'
+# With several workers, 'require' refuses to boot while caches or rate limits are per process
+shared_state = os.getenv('GUNICORN_SHARED_STATE', 'warn')
+if shared_state not in ('warn', 'require'):
+    raise ValueError("GUNICORN_SHARED_STATE must be 'warn' or 'require'")
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    # Connections opened while preloading must not be shared between processes
+    if preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    """Runs in each worker after the app is loaded and before it accepts connections"""
+    if workers > 1:
+        from services.warmup import per_process_state
+
+        problems = per_process_state()
+        for problem in problems:
+            worker.log.warning("%s; set a shared backend such as Redis when running %s workers", problem, workers)
+        if problems and shared_state == 'require':
+            raise RuntimeError("Shared cache and rate limit backends are required with several workers")
+    if warmup:
+        from services.warmup import warm_up
+
+        elapsed = warm_up()
+        worker.log.info("Worker %s warmed up in %.0fms", worker.pid, elapsed * 1000)
+
+
+def worker_exit(server, worker):
+    """Write buffered GPS positions before the worker goes; uvicorn workers skip atexit handlers"""
+    locations = sys.modules.get('services.locations')
+    if locations is not None:
+        written = locations.location_buffer.flush()
+        if written:
+            worker.log.info("Worker %s flushed %s buffered locations on exit", worker.pid, written)
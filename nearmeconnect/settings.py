@@ -12,6 +12,60 @@ load_dotenv(BASE_DIR / '.env')
 SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-placeholder')
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+GOOGLE_PLACES_API_URL = os.getenv('GOOGLE_PLACES_API_URL', 'https://maps.googleapis.com/maps/api/place')
+PLACE_DETAILS_TTL = int(os.getenv('PLACE_DETAILS_TTL', 60 * 60 * 24))  # served as fresh
+PLACE_DETAILS_STALE_TTL = int(os.getenv('PLACE_DETAILS_STALE_TTL', 60 * 60 * 24 * 7))  # served while refreshing
+IPINFO_URL = os.getenv('IPINFO_URL', 'https://ipinfo.io/json')
+
+# Outbound HTTP clients (services/upstream.py), one pooled session per upstream
+UPSTREAM_DEFAULTS = {
+    'CONNECT_TIMEOUT': float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+    'READ_TIMEOUT': float(os.getenv('UPSTREAM_READ_TIMEOUT', 10)),
+    'RETRIES': int(os.getenv('UPSTREAM_RETRIES', 2)),
+    'BACKOFF': float(os.getenv('UPSTREAM_BACKOFF', 0.2)),  # seconds, doubled per retry with jitter
+    'FAILURE_THRESHOLD': int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', 5)),
+    'RESET_TIMEOUT': float(os.getenv('UPSTREAM_RESET_TIMEOUT', 30)),
+    'POOL_SIZE': int(os.getenv('UPSTREAM_POOL_SIZE', 20)),
+}
+UPSTREAMS = {
+    'google_places': {},
+    'ipinfo': {'READ_TIMEOUT': 2, 'RETRIES': 0},
+}
+
+# Token buckets ({'RATE': tokens per second, 'BURST': bucket size}) for paid or
+# rate-limited upstreams, and for each client of the endpoints that call them.
+# Use 'services.ratelimit.CacheBucketStore' to share the buckets across workers.
+RATE_LIMIT_STORE = {
+    'BACKEND': os.getenv('RATE_LIMIT_STORE_BACKEND', 'services.ratelimit.LocalBucketStore'),
+    'CACHE_ALIAS': 'default',
+}
+UPSTREAM_RATE_LIMITS = {
+    'google_places': {'RATE': float(os.getenv('GOOGLE_RATE_LIMIT', 20)), 'BURST': int(os.getenv('GOOGLE_RATE_BURST', 40))},
+    # The public Nominatim allows one request per second
+    'nominatim': {'RATE': float(os.getenv('NOMINATIM_RATE_LIMIT', 1)), 'BURST': int(os.getenv('NOMINATIM_RATE_BURST', 1))},
+}
+CLIENT_RATE_LIMITS = {
+    'discover': {'RATE': float(os.getenv('DISCOVER_RATE_LIMIT', 1)), 'BURST': int(os.getenv('DISCOVER_RATE_BURST', 30))},
+    'place_details': {'RATE': float(os.getenv('PLACE_DETAILS_RATE_LIMIT', 2)),
+                      'BURST': int(os.getenv('PLACE_DETAILS_RATE_BURST', 60))},
+}
+
+# Per-upstream budgets (seconds) for the async discover endpoint
+DISCOVER_TIMEOUTS = {
+    'geocode': float(os.getenv('DISCOVER_GEOCODE_TIMEOUT', 3)),
+    'google': float(os.getenv('DISCOVER_GOOGLE_TIMEOUT', 2)),
+    'local': float(os.getenv('DISCOVER_LOCAL_TIMEOUT', 2)),
+}
+
+# Nominatim geocoding
+NOMINATIM_DOMAIN = os.getenv('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+NOMINATIM_SCHEME = os.getenv('NOMINATIM_SCHEME', 'https')
+NOMINATIM_TIMEOUT = float(os.getenv('NOMINATIM_TIMEOUT', 5))
+NOMINATIM_MIN_DELAY = float(os.getenv('NOMINATIM_MIN_DELAY', 1))  # seconds between batch lookups
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 60 * 60 * 24 * 30))
+GEOCODE_NEGATIVE_TTL = int(os.getenv('GEOCODE_NEGATIVE_TTL', 60 * 60 * 24))
+# Parallel lookups for batch geocoding; keep at 1 for the public Nominatim (one request per second)
+GEOCODE_WORKERS = int(os.getenv('GEOCODE_WORKERS', 1))
 
 # Host Configuration
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',') if os.getenv('ALLOWED_HOSTS') else []
@@ -43,6 +97,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'services.instrumentation.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -51,6 +106,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'services.querybudget.QueryBudgetMiddleware',
+    'services.routers.ReplicaRoutingMiddleware',
 ]
 
 # CORS Settings
@@ -81,10 +138,46 @@ TEMPLATES = [
 WSGI_APPLICATION = 'nearmeconnect.wsgi.application'
 
 # Database Configuration (EXACTLY AS YOU HAD IT)
+# Each worker thread keeps its connection for DB_CONN_MAX_AGE seconds ('None' for no limit)
+# and checks it is still alive before reusing it. DB_POOL=True switches to psycopg 3's
+# connection pool instead (Postgres only); Django requires CONN_MAX_AGE=0 with a pool.
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_CONN_MAX_AGE = 0 if DB_POOL else (
+    None if os.getenv('DB_CONN_MAX_AGE', '').lower() == 'none' else int(os.getenv('DB_CONN_MAX_AGE', 60))
+)
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_POOL_OPTIONS = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),  # seconds to wait for a free connection
+}
+
+
+def database_config(url):
+    config = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS)
+    if DB_POOL and 'postgresql' in config['ENGINE']:
+        config.setdefault('OPTIONS', {})['pool'] = DB_POOL_OPTIONS
+    return config
+
+
 DATABASES = {
-    'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
+    'default': database_config(os.getenv('DATABASE_URL')) if os.getenv('DATABASE_URL') else {}
 }
 
+# Optional read replicas (comma-separated URLs). services.routers sends the GETs named in
+# REPLICA_READ_URL_NAMES to a replica; everything else, and every write, uses default.
+# Views behind services.httpcache.ConditionalGetMixin read from default regardless.
+DATABASE_REPLICAS = []
+for index, url in enumerate(u for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u):
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {**database_config(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['services.routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+REPLICA_READ_URL_NAMES = os.getenv(
+    'REPLICA_READ_URL_NAMES',
+    'discover-services,discover-services-async,provider-list,request-list'
+).split(',')
+
 # Media Files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -122,8 +215,13 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'services.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('PAGE_SIZE', 50)),
 }
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv('PAGINATION_MAX_PAGE_SIZE', 200))
+# Rows fetched per database round trip when a list is streamed with ?stream=1
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 2000))
 
 # JWT Settings
 from datetime import timedelta
@@ -133,4 +231,106 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
-}    
\ No newline at end of file
+}
+
+# GET query budgets per URL name, checked by services.querybudget.QueryBudgetMiddleware.
+# Counts include the JWT user lookup; over-budget requests raise in DEBUG, log otherwise.
+QUERY_BUDGETS = {
+    'discover-services': 6,
+    'provider-list': 3,
+    'provider-detail': 2,
+    'place-details': 3,
+    'request-list': 3,
+    'review-list': 2,
+}
+QUERY_BUDGET_ACTION = os.getenv('QUERY_BUDGET_ACTION', 'raise' if DEBUG else 'log')
+
+# Request metrics (services.instrumentation) are served in Prometheus format at /metrics.
+# Each worker process keeps its own histograms. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" from the scraper.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Profile one request in every PROFILE_SAMPLE_RATE with cProfile (0 disables)
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+
+# Provider rating aggregates: Bayesian prior used to rank providers by rating
+RATING_PRIOR_MEAN = float(os.getenv('RATING_PRIOR_MEAN', 3.5))
+RATING_PRIOR_WEIGHT = float(os.getenv('RATING_PRIOR_WEIGHT', 5))
+
+# Provider GPS ping ingestion (services.locations): pings are coalesced per provider
+# and written together when the window closes or the buffer fills
+LOCATION_FLUSH_INTERVAL = float(os.getenv('LOCATION_FLUSH_INTERVAL', 2))
+LOCATION_BUFFER_MAX = int(os.getenv('LOCATION_BUFFER_MAX', 1000))
+LOCATION_MAX_PINGS = int(os.getenv('LOCATION_MAX_PINGS', 500))  # per request
+
+# Live provider feed (/api/feed/, server-sent events). The in-process broker only
+# reaches clients connected to the worker that saw the change; with several workers
+# on Postgres use services.feed.PostgresBroker (LISTEN/NOTIFY on CHANNEL).
+PROVIDER_FEED = {
+    'BACKEND': os.getenv('PROVIDER_FEED_BACKEND', 'services.feed.InProcessBroker'),
+    'CHANNEL': 'provider_feed',
+    'QUEUE_SIZE': 256,  # buffered events per client before it is told to resync
+    'HEARTBEAT': 15,  # seconds between keep-alive comments
+    'RETRY_MS': 3000,  # client reconnect delay
+    'SNAPSHOT_LIMIT': 100,
+}
+
+# Background jobs (services.jobs), run by `manage.py run_jobs`
+JOB_THREADS = int(os.getenv('JOB_THREADS', 4))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 300))  # seconds before a stuck job is re-run
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BACKOFF = int(os.getenv('JOB_RETRY_BACKOFF', 30))  # seconds, doubled per attempt
+
+# Cache framework; point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached so
+# workers share cached responses and invalidation signals
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'nearmeconnect'),
+    }
+}
+
+# Seconds a worker trusts its category registry before re-checking the shared version
+CATEGORY_REGISTRY_CHECK_INTERVAL = float(os.getenv('CATEGORY_REGISTRY_CHECK_INTERVAL', 1))
+# Reload regardless of the version key, which a per-process cache does not share between workers
+CATEGORY_REGISTRY_MAX_AGE = float(os.getenv('CATEGORY_REGISTRY_MAX_AGE', 60))
+
+# Google Places response cache
+# Use 'services.cache.DjangoCacheBackend' to share entries across workers
+PLACES_CACHE = {
+    'BACKEND': os.getenv('PLACES_CACHE_BACKEND', 'services.cache.LocMemTTLCache'),
+    'TTL': int(os.getenv('PLACES_CACHE_TTL', 300)),
+    'MAX_ENTRIES': int(os.getenv('PLACES_CACHE_MAX_ENTRIES', 2048)),
+    'CELL_PRECISION': int(os.getenv('PLACES_CACHE_CELL_PRECISION', 7)),  # ~150m cells
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'nmc:',
+}
+
+# Rendered GET responses for categories, provider details, review lists and place details.
+# Keys carry per-model versions bumped on write, so the TTL only bounds memory.
+RESPONSE_CACHE = {
+    'BACKEND': os.getenv('RESPONSE_CACHE_BACKEND', 'services.cache.LocMemTTLCache'),
+    'TTL': int(os.getenv('RESPONSE_CACHE_TTL', 600)),
+    'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 4096)),
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'nmc:',
+}
+
+# Columnar provider snapshot written by `manage.py build_provider_snapshot` and
+# memory-mapped by every worker for discover; unset (or missing) reads the database
+PROVIDER_SNAPSHOT_PATH = os.getenv('PROVIDER_SNAPSHOT_PATH', '')
+# Seconds a worker trusts its mapped snapshot before checking for a newly published one
+PROVIDER_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('PROVIDER_SNAPSHOT_CHECK_INTERVAL', 5))
+# Older snapshots are ignored in favour of the database, e.g. while the job worker is down
+PROVIDER_SNAPSHOT_MAX_AGE = float(os.getenv('PROVIDER_SNAPSHOT_MAX_AGE', 900))
+# Provider writes queue a rebuild job this many seconds out; writes meanwhile share it
+PROVIDER_SNAPSHOT_REBUILD_DELAY = int(os.getenv('PROVIDER_SNAPSHOT_REBUILD_DELAY', 30))
+
+# Seconds a worker trusts a cached user is_active flag when authenticating cached GETs.
+# User writes drop it at once, but other processes only see that with a shared CACHE_BACKEND.
+USER_ACTIVE_CACHE_TTL = int(os.getenv('USER_ACTIVE_CACHE_TTL', 60))
+
+# Paths requested anonymously by services.warmup before a server worker takes traffic
+# (see gunicorn.conf.py); they should be answered without touching an upstream
+WARMUP_PATHS = [p for p in os.getenv('WARMUP_PATHS', '/api/categories/,/api/discover/').split(',') if p]
@@ -3,11 +3,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from services.views import metrics
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('services.urls')),  # Include services URLs
+    path('metrics', metrics, name='metrics'),
     path('', TemplateView.as_view(template_name='index.html')),
    
 ]
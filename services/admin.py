@@ -1,10 +1,10 @@
 
 from django.contrib import admin
-from .models import ServiceCategory, ServiceProvider, ServiceRequest, Review
-from .google_api import geocode_address 
+from .models import ServiceCategory, ServiceProvider, ServiceRequest, Review, GeocodeCache, PlaceDetails, Job
+from .tasks import queue_geocoding
 @admin.register(ServiceCategory)
 class ServiceCategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'google_type')
     search_fields = ('name',)
 
 
@@ -15,13 +15,10 @@ class ServiceProviderAdmin(admin.ModelAdmin):
     exclude = ('latitude', 'longitude')  # 👈 Hide from admin form
 
     def save_model(self, request, obj, form, change):
-        # Auto-fill lat/lng from address
-        if obj.address:
-            lat, lng = geocode_address(obj.address)
-            if lat and lng:
-                obj.latitude = lat
-                obj.longitude = lng
         super().save_model(request, obj, form, change)
+        # Auto-fill lat/lng from address in the job worker so the save returns at once
+        if obj.address and (not change or 'address' in form.changed_data or not obj.has_location):
+            queue_geocoding(obj)
 
 
 @admin.register(ServiceRequest)
@@ -33,3 +30,22 @@ class ServiceRequestAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'provider', 'rating', 'created_at')
     list_filter = ('rating',)
+
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ('query', 'latitude', 'longitude', 'updated_at')
+    search_fields = ('query',)
+
+
+@admin.register(PlaceDetails)
+class PlaceDetailsAdmin(admin.ModelAdmin):
+    list_display = ('place_id', 'fetched_at')
+    search_fields = ('place_id',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('dedupe_key', 'last_error')
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ServicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'services'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals, tasks  # noqa: F401
+        from .querybudget import install_query_counter
+
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from .httpcache import USER_ACTIVE_PREFIX
+# services/authentication.py
+
+
+class ActiveUserStatelessAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticate from the token, rejecting users who were deactivated or deleted.
+    Their is_active flag is cached for USER_ACTIVE_CACHE_TTL seconds and dropped
+    on every user write, so repeat requests make no database query.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        key = f'{USER_ACTIVE_PREFIX}{user.id}'
+        active = cache.get(key)
+        if active is None:
+            active = User.objects.filter(pk=user.id, is_active=True).exists()
+            cache.set(key, active, settings.USER_ACTIVE_CACHE_TTL)
+        if not active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return user
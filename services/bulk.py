@@ -0,0 +1,218 @@
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from .geocoding import geocode_addresses
+from .google_api import validate_coordinates
+from .httpcache import bump_version
+from .models import ServiceProvider, UserProfile
+from .registry import category_registry
+from .spatial import encode_geohash
+from .tasks import queue_bulk_geocoding, queue_snapshot_rebuild
+# services/bulk.py
+
+FORMATS = ('csv', 'jsonl')
+GEOCODE_MODES = ('queue', 'inline')
+IMPORT_FIELDS = ('username', 'email', 'first_name', 'last_name', 'phone', 'category', 'address', 'bio',
+                 'latitude', 'longitude')
+REQUIRED_FIELDS = ('username', 'category')
+# bulk_create skips model validation, so column limits are checked up front
+LENGTH_CHECKS = (('username', User), ('email', User), ('first_name', User), ('last_name', User),
+                 ('phone', ServiceProvider), ('address', ServiceProvider))
+EXPORT_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'phone', 'category', 'address', 'bio',
+                 'latitude', 'longitude', 'rating', 'review_count')
+# Lookups feeding EXPORT_FIELDS, in the same order
+EXPORT_COLUMNS = ('id', 'user__username', 'user__email', 'user__first_name', 'user__last_name', 'phone',
+                  'category__name', 'address', 'bio', 'latitude', 'longitude', 'rating', 'review_count')
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    last_line: int = 0
+    errors: list = field(default_factory=list)  # [(line, message), ...]
+
+
+def detect_format(filename, default='csv'):
+    """Guess the file format from its extension"""
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(lines, fmt='csv'):
+    """
+    Lazily yield (line number, row) from an iterable of text lines.
+    Undecodable JSONL lines are yielded with row=None so they are reported, not fatal.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def _coordinate(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} must be a number")
+
+
+def clean_row(row):
+    """Validate one import row; returns a dict of IMPORT_FIELDS plus 'category_id', or raises RowError"""
+    if row is None:
+        raise RowError("not a JSON object")
+    cleaned = {name: str(row.get(name) or '').strip() for name in IMPORT_FIELDS}
+    missing = [name for name in REQUIRED_FIELDS if not cleaned[name]]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    too_long = [name for name, model in LENGTH_CHECKS
+                if len(cleaned[name]) > model._meta.get_field(name).max_length]
+    if too_long:
+        raise RowError(f"too long: {', '.join(too_long)}")
+    category = category_registry.get(cleaned['category'])
+    if category is None:
+        raise RowError(f"unknown category {cleaned['category']!r}")
+    cleaned['category_id'] = category.id
+
+    if cleaned['latitude'] or cleaned['longitude']:
+        lat = _coordinate(cleaned['latitude'], 'latitude')
+        lng = _coordinate(cleaned['longitude'], 'longitude')
+        if not validate_coordinates(lat, lng):
+            raise RowError("coordinates out of range")
+        cleaned['latitude'], cleaned['longitude'] = lat, lng
+    elif cleaned['address']:
+        cleaned['latitude'] = cleaned['longitude'] = None
+    else:
+        raise RowError("address or latitude/longitude is required")
+    return cleaned
+
+
+def _import_chunk(chunk, geocode, geocode_workers, errors):
+    """Validate, geocode and insert one chunk of (line, row) pairs; returns the number created"""
+    valid, usernames = {}, set()
+    for line, row in chunk:
+        try:
+            cleaned = clean_row(row)
+        except RowError as e:
+            errors.append((line, str(e)))
+            continue
+        if cleaned['username'] in usernames:
+            errors.append((line, f"duplicate username {cleaned['username']!r} in file"))
+            continue
+        usernames.add(cleaned['username'])
+        valid[line] = cleaned
+
+    # Usernames already present (including rows from an earlier, interrupted run)
+    taken = set(User.objects.filter(
+        username__in=usernames
+    ).values_list('username', flat=True))
+    for line, row in list(valid.items()):
+        if row['username'] in taken:
+            errors.append((line, f"username {row['username']!r} already exists"))
+            del valid[line]
+
+    pending = [row['address'] for row in valid.values() if row['latitude'] is None]
+    if pending and geocode == 'inline':
+        coordinates = geocode_addresses(pending, workers=geocode_workers)
+        for line, row in list(valid.items()):
+            if row['latitude'] is None:
+                row['latitude'], row['longitude'] = coordinates[row['address']]
+                if row['latitude'] is None:
+                    errors.append((line, f"could not geocode {row['address']!r}"))
+                    del valid[line]
+
+    if not valid:
+        return 0
+    rows = list(valid.values())
+    unusable_password = make_password(None)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=row['username'], email=row['email'], first_name=row['first_name'],
+                 last_name=row['last_name'], password=unusable_password)
+            for row in rows
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, phone=row['phone'], is_service_provider=True)
+            for user, row in zip(users, rows)
+        ])
+        # bulk_create skips save(), so fill in what it would have set
+        providers = ServiceProvider.objects.bulk_create([
+            ServiceProvider(
+                user=user, category_id=row['category_id'], bio=row['bio'], phone=row['phone'],
+                address=row['address'], latitude=row['latitude'], longitude=row['longitude'],
+                geohash=encode_geohash(row['latitude'], row['longitude']) if row['latitude'] is not None else '',
+                bayesian_rating=settings.RATING_PRIOR_MEAN,
+            )
+            for user, row in zip(users, rows)
+        ])
+        bump_version(User, UserProfile, ServiceProvider)
+        queue_snapshot_rebuild()
+        ungeocoded = [p.pk for p in providers if not p.has_location]
+        if ungeocoded:
+            queue_bulk_geocoding(ungeocoded)
+    return len(rows)
+
+
+def import_providers(rows, chunk_size=500, start_after=0, geocode='queue', geocode_workers=None, on_chunk=None):
+    """
+    Create users, profiles and providers from (line, row) pairs, `chunk_size` rows per transaction.
+    Addresses without coordinates are geocoded by background jobs (`geocode='queue'`)
+    or before insert (`geocode='inline'`, rejecting rows that do not resolve).
+    Rows up to line `start_after` are skipped so an interrupted import can resume;
+    `on_chunk(result)` runs after each committed chunk with result.last_line up to date.
+    """
+    result = ImportResult(last_line=start_after)
+    rows = ((line, row) for line, row in rows if line > start_after)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return result
+        errors = []
+        result.created += _import_chunk(chunk, geocode, geocode_workers, errors)
+        result.errors.extend(sorted(errors))
+        result.last_line = chunk[-1][0]
+        if on_chunk:
+            on_chunk(result)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer in generators"""
+
+    def write(self, value):
+        return value
+
+
+def export_providers(queryset=None, fmt='csv', chunk_size=2000):
+    """Yield providers as CSV or JSONL text, one row at a time"""
+    if queryset is None:
+        queryset = ServiceProvider.objects.all()
+    rows = queryset.order_by('pk').values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
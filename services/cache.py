@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+# services/cache.py
+
+
+class LocMemTTLCache:
+    """In-process cache with per-entry TTL and LRU eviction"""
+
+    def __init__(self, ttl=300, max_entries=1024, **options):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Store entries in a Django cache alias so every worker shares them"""
+
+    def __init__(self, ttl=300, cache_alias='default', key_prefix='', **options):
+        from django.core.cache import caches
+
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self._cache = caches[cache_alias]
+
+    def get(self, key):
+        return self._cache.get(self.key_prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self._cache.set(self.key_prefix + key, value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self._cache.delete(self.key_prefix + key)
+
+    def clear(self):
+        # Clearing the alias would also drop model versions, rate limits and the like;
+        # shared entries cannot be listed by prefix, so they expire with their TTL instead
+        pass
+
+
+class ResponseCache:
+    """Wrap a cache backend and count hits and misses"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def build_cache(config):
+    """Instantiate a ResponseCache from a settings dict with a BACKEND path"""
+    options = {k.lower(): v for k, v in config.items() if k != 'BACKEND'}
+    backend_class = import_string(config.get('BACKEND', 'services.cache.LocMemTTLCache'))
+    return ResponseCache(backend_class(**options))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """Return the process-wide cache configured by settings.<name>"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = build_cache(getattr(settings, name, {}))
+        return _caches[name]
+
+
+def all_caches():
+    with _caches_lock:
+        return dict(_caches)
+
+
+def reset_caches():
+    """Drop configured caches so they are rebuilt from current settings"""
+    with _caches_lock:
+        _caches.clear()
@@ -0,0 +1,71 @@
+from .feed import location_event
+from .models import ServiceProvider
+from .registry import category_registry
+from .snapshot import provider_snapshot
+from .spatial import nearest_providers
+# services/discovery.py
+
+MAX_RADIUS_M = 50000
+SORT_OPTIONS = ('distance', 'rating')
+
+
+def valid_service_types():
+    """Return the lowercased names of every service category"""
+    return category_registry.names()
+
+
+def resolve_category(service_type):
+    """Return the registry entry for a service type, or None if it is not a category"""
+    return category_registry.get(service_type)
+
+
+def parse_radius(radius):
+    """Return the radius in meters, raising ValueError outside (0, MAX_RADIUS_M]"""
+    radius = int(radius)
+    if radius <= 0 or radius > MAX_RADIUS_M:
+        raise ValueError
+    return radius
+
+
+def parse_sort(sort):
+    """Return the local provider ordering, raising ValueError for unknown options"""
+    sort = (sort or 'distance').lower()
+    if sort not in SORT_OPTIONS:
+        raise ValueError
+    return sort
+
+
+def find_local_providers(category, lat, lng, radius, limit=10, sort='distance'):
+    """
+    Serialize the nearest (or best rated) providers of a category within the radius.
+    Candidates come from the memory-mapped provider snapshot when a fresh one is
+    published, otherwise from a geohash range scan of the database.
+    """
+    queryset = ServiceProvider.objects.select_related('user').filter(category_id=category.id)
+    snapshot = provider_snapshot.get()
+    if snapshot is not None:
+        nearest = snapshot.nearest_providers(queryset, category.id, lat, lng, radius, limit=limit, order_by=sort)
+    else:
+        nearest = nearest_providers(queryset, lat, lng, radius, limit=limit, order_by=sort)
+    return [{
+        'name': f"{p.user.get_full_name() or p.user.username} (NearMeConnect)",
+        'address': p.address,
+        'location': {'lat': p.latitude, 'lng': p.longitude},
+        'distance_km': round(distance / 1000, 2),
+        'maps_link': f"https://www.google.com/maps/search/?api=1&query={p.latitude},{p.longitude}",
+        'phone': p.phone,
+        'rating': p.rating,
+        'review_count': p.review_count,
+        'bayesian_rating': round(p.bayesian_rating, 2),
+        'is_local': True,
+        'provider_id': p.id
+    } for p, distance in nearest]
+
+
+def region_snapshot(category, lat, lng, radius, limit):
+    """Current positions of a category's providers in the region, nearest first, as feed events"""
+    nearest = nearest_providers(
+        ServiceProvider.objects.filter(category_id=category.id).only('pk', 'category_id', 'latitude', 'longitude'),
+        lat, lng, radius, limit=limit
+    )
+    return [location_event(p.pk, p.category_id, p.latitude, p.longitude) for p, _ in nearest]
@@ -0,0 +1,72 @@
+import numpy as np
+from django.db.models import Q
+# services/distance.py
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat, lng, lats, lngs):
+    """
+    Great-circle distance in meters from (lat, lng) to each of (lats, lngs).
+    Accepts scalars or array-likes and computes everything in one NumPy pass.
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64) - lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters between two points"""
+    return float(haversine_m(lat1, lng1, lat2, lng2))
+
+
+def bounding_box(lat, lng, radius_m):
+    """
+    Return (min_lat, min_lng, max_lat, max_lng) enclosing a circle.
+    Longitudes may fall outside [-180, 180] when the box crosses the antimeridian.
+    """
+    dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = np.cos(np.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-9:
+        return min_lat, -180.0, max_lat, 180.0
+    dlng = min(dlat / cos_lat, 180.0)
+    return float(min_lat), float(lng - dlng), float(max_lat), float(lng + dlng)
+
+
+def bounding_box_filter(lat, lng, radius_m, prefix=''):
+    """
+    Build a Q object the database can evaluate against indexed
+    latitude/longitude columns before any exact distance is computed.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_m)
+    lat_q = Q(**{f'{prefix}latitude__range': (min_lat, max_lat)})
+    if max_lng - min_lng >= 360:
+        return lat_q
+    if min_lng < -180:
+        lng_q = (Q(**{f'{prefix}longitude__gte': min_lng + 360})
+                 | Q(**{f'{prefix}longitude__lte': max_lng}))
+    elif max_lng > 180:
+        lng_q = (Q(**{f'{prefix}longitude__gte': min_lng})
+                 | Q(**{f'{prefix}longitude__lte': max_lng - 360}))
+    else:
+        lng_q = Q(**{f'{prefix}longitude__range': (min_lng, max_lng)})
+    return lat_q & lng_q
+
+
+def rank_by_distance(lat, lng, lats, lngs, radius_m=None, limit=None):
+    """
+    Return (indices, distances) of the points nearest to (lat, lng),
+    nearest first, optionally restricted to `radius_m` and truncated to `limit`.
+    """
+    distances = haversine_m(lat, lng, lats, lngs)
+    indices = np.arange(distances.size)
+    if radius_m is not None:
+        indices = indices[distances <= radius_m]
+    if limit is not None and indices.size > limit:
+        indices = indices[np.argpartition(distances[indices], limit - 1)[:limit]]
+    indices = indices[np.argsort(distances[indices], kind='stable')]
+    return indices, distances[indices]
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+from .distance import distance_m
+# services/feed.py
+
+logger = logging.getLogger(__name__)
+
+# Event types sent to subscribers
+LOCATION = 'location'  # provider is at this position inside the region
+LEFT = 'left'          # provider moved out of the region
+REMOVED = 'removed'    # provider was deleted
+RESYNC = 'resync'      # events were dropped; the client should reload the region
+
+
+def location_event(provider_id, category_id, lat, lng):
+    return {'type': LOCATION, 'provider_id': provider_id, 'category_id': category_id,
+            'latitude': lat, 'longitude': lng}
+
+
+def removed_event(provider_id, category_id):
+    return {'type': REMOVED, 'provider_id': provider_id, 'category_id': category_id}
+
+
+class Subscription:
+    """
+    One client's view of a (category, center, radius) region. Events are filtered
+    in the publishing thread and handed to the subscriber's event loop queue.
+    """
+
+    def __init__(self, category_id, lat, lng, radius_m, queue_size=256, known=()):
+        self.category_id = category_id
+        self.lat, self.lng, self.radius_m = lat, lng, radius_m
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.known = set(known)  # providers the client currently has in the region
+        self.lagged = False
+
+    def contains(self, lat, lng):
+        return lat is not None and lng is not None and distance_m(self.lat, self.lng, lat, lng) <= self.radius_m
+
+    def translate(self, event):
+        """Return the event as this subscriber should see it, or None"""
+        if event['category_id'] != self.category_id:
+            return None
+        provider_id = event['provider_id']
+        if event['type'] == LOCATION and self.contains(event['latitude'], event['longitude']):
+            self.known.add(provider_id)
+            return event
+        if provider_id in self.known:
+            self.known.discard(provider_id)
+            return event if event['type'] == REMOVED else {**event, 'type': LEFT}
+        return None
+
+    def offer(self, event):
+        event = self.translate(event)
+        if event is not None:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow client gets a resync instead of unbounded buffering
+            self.lagged = True
+
+    async def get(self):
+        if self.lagged and self.queue.empty():
+            self.lagged = False
+            return {'type': RESYNC}
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Fans events out to subscriptions in this process only"""
+
+    def __init__(self, queue_size=256, **options):
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, category_id, lat, lng, radius_m, known=()):
+        subscription = Subscription(category_id, lat, lng, radius_m, self.queue_size, known)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def wants_events(self):
+        """False when publishing would reach nobody, so callers can skip building events"""
+        return self.has_subscribers()
+
+    def dispatch(self, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            for subscription in subscriptions:
+                try:
+                    subscription.offer(event)
+                except RuntimeError:
+                    # The subscriber's loop has closed; the stream's cleanup will unsubscribe it
+                    pass
+
+    def publish(self, events):
+        self.dispatch(events)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Relays events between processes with Postgres LISTEN/NOTIFY on `channel`,
+    so a ping written by one worker reaches feeds held open by another.
+    Each process listens on a dedicated connection once it has a subscriber.
+    """
+    # NOTIFY payloads must stay under 8000 bytes
+    MAX_PAYLOAD = 7500
+
+    def __init__(self, queue_size=256, channel='provider_feed', **options):
+        super().__init__(queue_size)
+        self.channel = channel
+        self._listener = None
+
+    def wants_events(self):
+        return True
+
+    def subscribe(self, *args, **kwargs):
+        subscription = super().subscribe(*args, **kwargs)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='feed-listener', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def publish(self, events):
+        batches, batch = [], []
+        for event in events:
+            if batch and len(json.dumps(batch + [event])) > self.MAX_PAYLOAD:
+                batches.append(batch)
+                batch = []
+            batch.append(event)
+        if batch:
+            batches.append(batch)
+        with connection.cursor() as cursor:
+            for batch in batches:
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps(batch)])
+
+    def _listen(self):
+        import psycopg
+
+        params = listener_params(connections['default'].settings_dict)
+        while True:
+            try:
+                with psycopg.connect(**params, autocommit=True) as conn:
+                    conn.execute(f'LISTEN "{self.channel}"')
+                    while True:
+                        # The timeout bounds how long a dead connection goes unnoticed
+                        for notify in conn.notifies(timeout=30):
+                            self.dispatch(json.loads(notify.payload))
+                        conn.execute('SELECT 1')
+            except Exception:
+                logger.exception("Provider feed listener lost its connection; reconnecting")
+                threading.Event().wait(1)
+
+
+# OPTIONS consumed by Django's postgresql backend rather than libpq
+DJANGO_ONLY_OPTIONS = {'pool', 'server_side_binding', 'isolation_level', 'assume_role', 'cursor_factory',
+                       'context', 'prepare_threshold'}
+
+
+def listener_params(settings_dict):
+    """
+    psycopg.connect() keyword arguments for a plain autocommit connection to the
+    database in a Django DATABASES entry, leaving out backend-only options.
+    """
+    params = {
+        key: settings_dict[name]
+        for key, name in (('dbname', 'NAME'), ('user', 'USER'), ('password', 'PASSWORD'), ('host', 'HOST'), ('port', 'PORT'))
+        if settings_dict.get(name)
+    }
+    params.update({k: v for k, v in settings_dict.get('OPTIONS', {}).items() if k not in DJANGO_ONLY_OPTIONS})
+    return params
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by settings.PROVIDER_FEED"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = settings.PROVIDER_FEED
+            options = {k.lower(): v for k, v in config.items() if k != 'BACKEND'}
+            _broker = import_string(config.get('BACKEND', 'services.feed.InProcessBroker'))(**options)
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(events):
+    """Publish events once the surrounding transaction commits"""
+    events = list(events)
+    if events and get_broker().wants_events():
+        transaction.on_commit(lambda: get_broker().publish(events))
+
+
+def format_sse(event):
+    """Encode an event as a server-sent events message"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,175 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from geopy.exc import GeopyError
+from geopy.extra.rate_limiter import RateLimiter
+from geopy.geocoders import Nominatim
+from .instrumentation import timed_upstream
+from .models import GeocodeCache
+from .ratelimit import RateLimitedError, acquire_upstream
+from .singleflight import SingleFlight
+# services/geocoding.py
+
+logger = logging.getLogger(__name__)
+
+
+
+class GeocodingUnavailable(Exception):
+    """Nominatim could not be asked about some addresses; raised once the rest are cached"""
+
+    def __init__(self, addresses):
+        super().__init__(f"Nominatim unavailable for {len(addresses)} addresses")
+        self.addresses = addresses
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+# Concurrent requests geocoding the same address share one lookup
+_flights = SingleFlight()
+
+
+def normalize_address(address):
+    """Canonical cache key for an address: lowercased, single-spaced, tidy commas"""
+    address = re.sub(r'\s*,\s*', ', ', address.strip().lower())
+    address = re.sub(r'\s+', ' ', address)
+    return address.strip(' ,.')
+
+
+def get_geocoder():
+    """Return the process-wide Nominatim client"""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Nominatim(
+                user_agent="nearmeconnect",
+                domain=settings.NOMINATIM_DOMAIN,
+                scheme=settings.NOMINATIM_SCHEME,
+                timeout=settings.NOMINATIM_TIMEOUT,
+            )
+        return _geocoder
+
+
+def reset_geocoder():
+    """Drop the shared client so it is rebuilt from current settings"""
+    global _geocoder
+    with _geocoder_lock:
+        _geocoder = None
+
+
+def _is_fresh(entry, now):
+    ttl = settings.GEOCODE_CACHE_TTL if entry.latitude is not None else settings.GEOCODE_NEGATIVE_TTL
+    return entry.updated_at >= now - timedelta(seconds=ttl)
+
+
+def _lookup(geocode, address):
+    """Call the geocoder; returns (lat, lng), (None, None) for no match, or raises GeopyError"""
+    with timed_upstream('nominatim'):
+        location = geocode(address)
+    if location:
+        return location.latitude, location.longitude
+    return None, None
+
+
+def _store(results):
+    """Upsert {normalized address: (lat, lng)} into the cache table"""
+    GeocodeCache.objects.bulk_create(
+        [GeocodeCache(query=query, latitude=lat, longitude=lng) for query, (lat, lng) in results.items()],
+        update_conflicts=True,
+        unique_fields=['query'],
+        update_fields=['latitude', 'longitude', 'updated_at'],
+    )
+
+
+def geocode_address(address):
+    """
+    Convert address to coordinates, consulting the geocode cache first.
+    Raises RateLimitedError when Nominatim's bucket stays empty, so callers can tell
+    throttling apart from an address with no match.
+    """
+    if not address:
+        return None, None
+    return _flights.do(
+        normalize_address(address),
+        lambda: geocode_addresses([address], min_delay_seconds=0, raise_rate_limited=True)[address]
+    )
+
+
+def _lookup_batch(addresses, min_delay_seconds, raise_rate_limited=False):
+    """Look up addresses one by one, spaced by `min_delay_seconds`; returns {address: (lat, lng) or None}"""
+    geocode = RateLimiter(get_geocoder().geocode, min_delay_seconds=min_delay_seconds, max_retries=0, swallow_exceptions=False)
+    results = {}
+    for address in addresses:
+        try:
+            # Nominatim allows one request per second across all our workers
+            acquire_upstream('nominatim', max_wait=settings.NOMINATIM_TIMEOUT)
+            results[address] = _lookup(geocode, address)
+        except RateLimitedError as e:
+            if raise_rate_limited:
+                raise
+            logger.warning("Geocoding failed for %r: %s", address, e)
+            results[address] = None
+        except GeopyError as e:
+            logger.warning("Geocoding failed for %r: %s", address, e)
+            results[address] = None
+    return results
+
+
+def geocode_addresses(addresses, min_delay_seconds=None, workers=None, raise_rate_limited=False,
+                      raise_unavailable=False):
+    """
+    Geocode many addresses, e.g. for bulk provider imports.
+    Cached entries are read in one query; misses go to Nominatim at most once per
+    normalized address, spaced by `min_delay_seconds` to respect its rate limit.
+    With `workers` > 1 misses are split across that many threads, each keeping
+    its own spacing; only do that against a self-hosted Nominatim.
+    Addresses with no match are cached negatively for GEOCODE_NEGATIVE_TTL.
+    Returns {address: (lat, lng)} with (None, None) for failures; with
+    `raise_rate_limited` a lookup refused by the Nominatim bucket raises RateLimitedError;
+    with `raise_unavailable` any transient failure raises GeocodingUnavailable after the
+    other results are cached, so a retry only looks up the failed addresses again.
+    """
+    if min_delay_seconds is None:
+        min_delay_seconds = settings.NOMINATIM_MIN_DELAY
+    workers = max(1, workers or settings.GEOCODE_WORKERS)
+    keys = {address: normalize_address(address) for address in addresses}
+    cacheable = {key for key in keys.values() if len(key) <= GeocodeCache._meta.get_field('query').max_length}
+
+    now = timezone.now()
+    resolved = {
+        entry.query: (entry.latitude, entry.longitude)
+        for entry in GeocodeCache.objects.filter(query__in=cacheable)
+        if _is_fresh(entry, now)
+    }
+
+    misses = {}
+    for address, key in keys.items():
+        if key not in resolved:
+            misses.setdefault(key, address)
+    shards = [list(misses.values())[i::workers] for i in range(min(workers, len(misses)))]
+    if len(shards) > 1:
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            batches = list(pool.map(lambda shard: _lookup_batch(shard, min_delay_seconds, raise_rate_limited), shards))
+    else:
+        batches = [_lookup_batch(shard, min_delay_seconds, raise_rate_limited) for shard in shards]
+
+    fetched, unavailable = {}, []
+    for batch in batches:
+        for address, value in batch.items():
+            # Transient upstream failures (None) are not cached
+            if value is None:
+                resolved[normalize_address(address)] = (None, None)
+                unavailable.append(address)
+            else:
+                fetched[normalize_address(address)] = value
+
+    if fetched:
+        _store({key: value for key, value in fetched.items() if key in cacheable})
+    if unavailable and raise_unavailable:
+        raise GeocodingUnavailable(unavailable)
+    resolved.update(fetched)
+    return {address: resolved[key] for address, key in keys.items()}
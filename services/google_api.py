@@ -1,8 +1,21 @@
+import httpx
 import requests
 from django.conf import settings
-from geopy.geocoders import Nominatim
+from .cache import get_cache
+from .spatial import encode_geohash
+from .registry import category_registry
+from .ratelimit import RateLimitedError
+from .singleflight import SingleFlight
+from .upstream import CircuitOpenError, get_upstream
 # services/google_api.py
 
+# Google statuses whose responses are safe to replay from the cache
+CACHEABLE_STATUSES = {'OK', 'ZERO_RESULTS'}
+# Identical Places calls in flight at the same time are made once
+_flights = SingleFlight()
+# Raised as-is, without a network call, while Places is rate limited or its breaker is open
+UNAVAILABLE_ERRORS = (CircuitOpenError, RateLimitedError)
+
 def validate_coordinates(lat, lng):
     """Validate that coordinates are within valid ranges"""
     return (-90 <= lat <= 90) and (-180 <= lng <= 180)
@@ -11,7 +24,7 @@ def validate_coordinates(lat, lng):
 def get_current_location():
     """Get location with coordinate validation"""
     try:
-        response = requests.get('https://ipinfo.io/json')
+        response = get_upstream('ipinfo').get(settings.IPINFO_URL)
         if response.status_code == 200:
             data = response.json()
             loc = data.get('loc', '').split(',')
@@ -22,40 +35,18 @@ def get_current_location():
     except Exception:
         pass
     return None, None
-def geocode_address(address):
-    """Convert address to coordinates"""
-    geolocator = Nominatim(user_agent="nearmeconnect")
-    location = geolocator.geocode(address)
-    if location:
-        return location.latitude, location.longitude
-    return None, None
 
-def get_nearby_services(latitude, longitude, service_type, radius=5000):
+
+def build_nearby_request(latitude, longitude, service_type, radius=5000, google_type=None):
     """
-    Fetch nearby services using Google Places API.
-    Uses `type` for known categories, falls back to `keyword` for custom ones.
+    Return (url, params, cache_key) for a Places nearby search.
+    Uses the category's `google_type` when it has one, falls back to `keyword` otherwise.
+    Pass `google_type` ('' for none) to skip the category registry lookup.
     """
-    base_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-
-    # Mapping known service names to official Google Place types
-    SERVICE_TYPE_MAP = {
-        "plumber": "plumber",
-        "electrician": "electrician",
-        "mechanic": "car_repair",
-        "doctor": "doctor",
-        "tailor": "clothing_store",
-        "carpenter": None,  # Google doesn’t support this as a type
-        "ac technician": "hvac_contractor",
-        "barber": "hair_care",
-        "salon": "beauty_salon",
-        "painter": None,
-        "mover": "moving_company",
-        "tutor": None,
-        "laundry": "laundry"
-        # Add more mappings as needed
-    }
-
-    google_type = SERVICE_TYPE_MAP.get(service_type.lower())
+    base_url = f"{settings.GOOGLE_PLACES_API_URL}/nearbysearch/json"
+    if google_type is None:
+        category = category_registry.get(service_type)
+        google_type = category.google_type if category else None
     
     params = {
         'location': f"{latitude},{longitude}",
@@ -69,23 +60,74 @@ def get_nearby_services(latitude, longitude, service_type, radius=5000):
     else:
         params['keyword'] = service_type  # fallback to custom keyword
 
+    cache_key = nearby_cache_key(latitude, longitude, google_type, service_type, radius)
+    return base_url, params, cache_key
+
+
+def finish_nearby_response(data, cache_key):
+    """Add Google Maps links to results and cache successful responses"""
+    if data.get('results'):
+        for place in data['results']:
+            place['maps_link'] = generate_maps_link(
+                place.get('geometry', {}).get('location', {}),
+                place.get('place_id')
+            )
+
+    if data.get('status') in CACHEABLE_STATUSES:
+        get_cache('PLACES_CACHE').set(cache_key, data)
+    return data
+
+
+def get_nearby_services(latitude, longitude, service_type, radius=5000, google_type=None):
+    """
+    Fetch nearby services using Google Places API.
+    Responses are cached per quantized location cell, type/keyword and radius.
+    """
+    base_url, params, cache_key = build_nearby_request(latitude, longitude, service_type, radius, google_type)
+    cached = get_cache('PLACES_CACHE').get(cache_key)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        response = get_upstream('google_places').get(base_url, params=params)
+        response.raise_for_status()
+        return finish_nearby_response(response.json(), cache_key)
+
     try:
-        response = requests.get(base_url, params=params)
+        return _flights.do(cache_key, fetch)
+    except UNAVAILABLE_ERRORS:
+        raise
+    except requests.exceptions.RequestException as e:
+        raise requests.exceptions.RequestException(f"Google Places API error: {str(e)}") from e
+
+
+async def aget_nearby_services(latitude, longitude, service_type, radius=5000, google_type=None):
+    """
+    Async variant of get_nearby_services over the shared httpx connection pool.
+    Callers should resolve `google_type` up front since the registry may need the database.
+    """
+    base_url, params, cache_key = build_nearby_request(latitude, longitude, service_type, radius, google_type)
+    cached = get_cache('PLACES_CACHE').get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        response = await get_upstream('google_places').aget(base_url, params=params)
         response.raise_for_status()
-        data = response.json()
+        return finish_nearby_response(response.json(), cache_key)
 
-        # Add Google Maps links to results
-        if data.get('results'):
-            for place in data['results']:
-                place['maps_link'] = generate_maps_link(
-                    place.get('geometry', {}).get('location', {}),
-                    place.get('place_id')
-                )
+    try:
+        return await _flights.ado(cache_key, fetch)
+    except httpx.HTTPError as e:
+        raise requests.exceptions.RequestException(f"Google Places API error: {str(e)}") from e
 
-        return data
 
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Google Places API error: {str(e)}")
+def nearby_cache_key(latitude, longitude, google_type, service_type, radius):
+    """Build the Places cache key from a quantized location cell"""
+    precision = settings.PLACES_CACHE.get('CELL_PRECISION', 7)
+    cell = encode_geohash(latitude, longitude, precision)
+    term = f"type={google_type}" if google_type else f"keyword={service_type.lower()}"
+    return f"places:nearby:{cell}:{term}:{int(radius)}"
 
 
 def generate_maps_link(location, place_id=None):
@@ -100,21 +142,29 @@ def generate_maps_link(location, place_id=None):
     return f"{base_url}&{query}"
 
 
-def get_place_details(place_id):
+PLACE_DETAILS_FIELDS = ('name', 'formatted_address', 'geometry', 'rating', 'user_ratings_total', 'photos', 'website')
+
+
+def get_place_details(place_id, fields=PLACE_DETAILS_FIELDS):
     """
-    Get detailed information about a specific place
+    Get detailed information about a specific place, limited to `fields`
     """
-    base_url = "https://maps.googleapis.com/maps/api/place/details/json"
+    base_url = f"{settings.GOOGLE_PLACES_API_URL}/details/json"
     
     params = {
         'place_id': place_id,
-        'fields': 'name,formatted_address,geometry,rating,user_ratings_total,photos,website',
+        'fields': ','.join(fields),
         'key': settings.GOOGLE_API_KEY
     }
     
-    try:
-        response = requests.get(base_url, params=params)
+    def fetch():
+        response = get_upstream('google_places').get(base_url, params=params)
         response.raise_for_status()
         return response.json()
+
+    try:
+        return _flights.do(f"details:{place_id}:{params['fields']}", fetch)
+    except UNAVAILABLE_ERRORS:
+        raise
     except requests.exceptions.RequestException as e:
-        raise Exception(f"Google Places Details API error: {str(e)}")
\ No newline at end of file
+        raise requests.exceptions.RequestException(f"Google Places Details API error: {str(e)}") from e
\ No newline at end of file
@@ -0,0 +1,135 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from .cache import get_cache
+from .routers import replica_reads
+# services/httpcache.py
+
+VERSION_PREFIX = 'model_version:'
+
+
+def _version_key(model):
+    return VERSION_PREFIX + model._meta.label_lower
+
+
+def model_versions(models):
+    """
+    Current version of each model, read from the shared Django cache in one call.
+    A version lost to eviction restarts from the clock, never from a number used before.
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def _bump(key):
+    if not cache.add(key, time.time_ns(), timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_version(*models):
+    """
+    Invalidate cached responses built from `models`. Inside a transaction the
+    versions are bumped again on commit, so a response cached from another
+    connection before the commit is not served afterwards.
+    """
+    keys = [_version_key(model) for model in models]
+    for key in keys:
+        _bump(key)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: [_bump(key) for key in keys])
+
+
+def etag_for(body):
+    """Strong validator for a response body"""
+    return quote_etag(hashlib.sha1(body).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    candidates = parse_etags(if_none_match)
+    return '*' in candidates or etag in (c.removeprefix('W/') for c in candidates)
+
+
+USER_ACTIVE_PREFIX = 'user_active:'
+
+
+def forget_user_active(user_id):
+    """Drop the cached is_active flag after the user is saved or deleted"""
+    cache.delete(f'{USER_ACTIVE_PREFIX}{user_id}')
+
+
+class ConditionalGetMixin:
+    """
+    Cache rendered JSON GET responses for DRF views, keyed by the host, full path,
+    negotiated media type and the versions of `cache_dependencies`. Responses carry
+    a strong ETag; a matching If-None-Match gets a 304 without running the view.
+    GETs authenticate from the token and a cached is_active flag, so a cache hit
+    usually makes no database query. Misses always read from the primary.
+    """
+    cache_dependencies = ()
+
+    def get_authenticators(self):
+        if self.request.method in ('GET', 'HEAD'):
+            # Imported here: simplejwt reads SECRET_KEY on import, and this module loads with the app
+            from .authentication import ActiveUserStatelessAuthentication
+
+            return [ActiveUserStatelessAuthentication()]
+        return super().get_authenticators()
+
+    def is_cacheable(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def get_cache_key(self, request):
+        versions = model_versions(self.cache_dependencies)
+        # Serialized image URLs are absolute, so the host is part of the body
+        raw = f"{request.get_host()}|{request.get_full_path()}|{request.accepted_media_type}|{versions}"
+        return 'response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+        responses = get_cache('RESPONSE_CACHE')
+        key = self.get_cache_key(request)
+        entry = responses.get(key)
+        if entry is None:
+            # A lagging replica could put pre-write rows under the post-write version key
+            token = replica_reads.set(False)
+            try:
+                response = super().get(request, *args, **kwargs)
+            finally:
+                replica_reads.reset(token)
+            if response.status_code != 200 or response.streaming:
+                return response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            entry = {'body': response.content, 'content_type': response['Content-Type'],
+                     'etag': etag_for(response.content)}
+            responses.set(key, entry)
+        return self.cached_response(request, entry)
+
+    def cached_response(self, request, entry):
+        if etag_matches(entry['etag'], request.headers.get('If-None-Match')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry['body'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        patch_vary_headers(response, ['Accept'])
+        # Clients may keep the body but must revalidate before reusing it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,131 @@
+import cProfile
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .metrics import QUERY_COUNT_BUCKETS, registry
+from .querybudget import count_queries
+# services/instrumentation.py
+
+logger = logging.getLogger(__name__)
+
+# {upstream name: seconds} for the request being handled, or None outside requests
+_upstream_time = ContextVar('upstream_time', default=None)
+
+
+def record_upstream(name, seconds):
+    """Add time spent calling an upstream to the current request's breakdown"""
+    timings = _upstream_time.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed_upstream(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_upstream(name, time.perf_counter() - start)
+
+
+class Profiler:
+    """
+    Profile one request in every PROFILE_SAMPLE_RATE with cProfile and write the stats
+    to PROFILE_DIR as <view>-<time>-<pid>.prof, for `python -m pstats` or snakeviz.
+    Only one request is profiled at a time per process.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def should_sample(self):
+        rate = settings.PROFILE_SAMPLE_RATE
+        return bool(rate) and next(self._counter) % rate == 0
+
+    @contextmanager
+    def maybe_profile(self, name):
+        if not self.should_sample() or not self._busy.acquire(blocking=False):
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(settings.PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+            profile.dump_stats(path)
+        except OSError:
+            logger.exception("Could not write profile for %s", name)
+        finally:
+            self._busy.release()
+
+
+profiler = Profiler()
+
+
+class MetricsMiddleware:
+    """
+    Record per-view wall time, database query count and time, and time spent in each
+    upstream (Google Places, ipinfo, Nominatim) into services.metrics.registry.
+    Place it first so the wall time covers the other middleware. For streamed
+    responses only the time to the first byte is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request) as outcome:
+            outcome.response = self.get_response(request)
+        return outcome.response
+
+    async def __acall__(self, request):
+        with self.measure(request) as outcome:
+            outcome.response = await self.get_response(request)
+        return outcome.response
+
+    @contextmanager
+    def measure(self, request):
+        """Time the block, which sets `response` on the yielded namespace, and record it"""
+        name = request.path.strip('/').replace('/', '.') or 'root'
+        outcome = SimpleNamespace(response=None)
+        token = _upstream_time.set({})
+        start = time.perf_counter()
+        try:
+            with profiler.maybe_profile(name), count_queries() as queries:
+                yield outcome
+            wall = time.perf_counter() - start
+            upstreams = _upstream_time.get()
+        finally:
+            _upstream_time.reset(token)
+        self.record(request, outcome.response, wall, queries, upstreams)
+
+    def record(self, request, response, wall, queries, upstreams):
+        match = getattr(request, 'resolver_match', None)
+        labels = (('view', (match.url_name or match.view_name) if match else 'unmatched'), ('method', request.method))
+        registry.inc('nmc_requests_total', 'Requests handled', labels + (('status', str(response.status_code)),))
+        registry.histogram('nmc_request_duration_seconds', 'Wall time per request', labels).observe(wall)
+        registry.histogram('nmc_request_db_queries', 'Database queries per request', labels,
+                           QUERY_COUNT_BUCKETS).observe(queries.count)
+        registry.histogram('nmc_request_db_seconds', 'Database time per request', labels).observe(queries.duration)
+        for upstream, seconds in upstreams.items():
+            registry.histogram('nmc_request_upstream_seconds', 'Upstream time per request',
+                               labels + (('upstream', upstream),)).observe(seconds)
@@ -0,0 +1,222 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Job
+# services/jobs.py
+
+logger = logging.getLogger(__name__)
+
+# name -> (handler, max concurrent runs per worker process or None)
+_handlers = {}
+
+
+def job(name, concurrency=None):
+    """Register `func(**payload)` as the handler for jobs called `name`"""
+    def register(func):
+        _handlers[name] = (func, concurrency)
+        return func
+    return register
+
+
+def enqueue(name, payload=None, dedupe_key=None, delay=0, max_attempts=None):
+    """
+    Queue a job; returns False if a job with `dedupe_key` is already waiting to run.
+    Called inside a transaction, the job only becomes visible when it commits.
+    """
+    return enqueue_many(name, [payload or {}], [dedupe_key], delay, max_attempts) == 1
+
+
+def enqueue_many(name, payloads, dedupe_keys=None, delay=0, max_attempts=None):
+    """Queue one job per payload in a single insert; returns how many were new"""
+    run_after = timezone.now() + timedelta(seconds=delay)
+    dedupe_keys = dedupe_keys or [None] * len(payloads)
+    jobs = [
+        Job(name=name, payload=payload, dedupe_key=key, run_after=run_after,
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS)
+        for payload, key in zip(payloads, dedupe_keys)
+    ]
+    keys = [key for key in dedupe_keys if key]
+    existing = set(Job.objects.filter(
+        dedupe_key__in=keys, status=Job.QUEUED
+    ).values_list('dedupe_key', flat=True)) if keys else set()
+    jobs = [j for j in jobs if j.dedupe_key not in existing]
+    # Conflicts with jobs queued concurrently are dropped by the partial unique index
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+    return len(jobs)
+
+
+def claim(limit, visibility_timeout=None, exclude_names=()):
+    """
+    Lease up to `limit` due jobs: queued ones whose run_after has passed and running
+    ones whose lease expired. Returns the claimed Job instances.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    timeout = settings.JOB_VISIBILITY_TIMEOUT if visibility_timeout is None else visibility_timeout
+    due = (
+        Q(status=Job.QUEUED, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+    with transaction.atomic():
+        queryset = Job.objects.filter(due).exclude(name__in=exclude_names).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers skip each other's rows instead of waiting on them
+            queryset = queryset.select_for_update(skip_locked=True)
+        jobs = list(queryset[:limit])
+        locked_until = now + timedelta(seconds=timeout)
+        for j in jobs:
+            j.status, j.locked_until, j.attempts = Job.RUNNING, locked_until, j.attempts + 1
+        Job.objects.bulk_update(jobs, ['status', 'locked_until', 'attempts'])
+    return jobs
+
+
+def retry_delay(attempts):
+    """Exponential backoff from JOB_RETRY_BACKOFF seconds, capped at an hour"""
+    return min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), 3600)
+
+
+def execute(j):
+    """Call the handler for a claimed job; returns the field updates recording the outcome"""
+    handler, _ = _handlers.get(j.name, (None, None))
+    try:
+        if handler is None:
+            raise LookupError(f"no handler registered for {j.name!r}")
+        handler(**j.payload)
+    except Exception as e:
+        logger.exception("Job %s failed (attempt %s/%s)", j, j.attempts, j.max_attempts)
+        if j.attempts >= j.max_attempts or handler is None:
+            status, run_after = Job.FAILED, j.run_after
+        else:
+            status, run_after = Job.QUEUED, timezone.now() + timedelta(seconds=retry_delay(j.attempts))
+        return {'status': status, 'run_after': run_after, 'last_error': f"{type(e).__name__}: {e}"}
+    return {'status': Job.DONE, 'last_error': ''}
+
+
+def _superseded(updates, queued_pk=None):
+    """Fail a retry instead of re-queuing it next to a queued job with the same dedupe key"""
+    by = f" #{queued_pk}" if queued_pk else ''
+    return {**updates, 'status': Job.FAILED, 'last_error': f"{updates['last_error']} (superseded by queued job{by})"}
+
+
+def _store(j, updates):
+    return bool(Job.objects.filter(pk=j.pk, status=Job.RUNNING, locked_until=j.locked_until).update(
+        locked_until=None, updated_at=timezone.now(), **updates
+    ))
+
+
+def record(j, updates):
+    """
+    Store a job's outcome; returns False if its lease expired and another worker reclaimed it.
+    A retry whose dedupe key was queued again meanwhile is failed, leaving the newer job to run.
+    """
+    if updates['status'] == Job.QUEUED and j.dedupe_key:
+        queued_pk = Job.objects.filter(
+            dedupe_key=j.dedupe_key, status=Job.QUEUED
+        ).exclude(pk=j.pk).values_list('pk', flat=True).first()
+        if queued_pk is not None:
+            updates = _superseded(updates, queued_pk)
+    try:
+        with transaction.atomic():
+            return _store(j, updates)
+    except IntegrityError:
+        # The same key was queued between the check and the update
+        return _store(j, _superseded(updates))
+
+
+def run(j):
+    """Run one claimed job and record the outcome; returns the new status"""
+    updates = execute(j)
+    record(j, updates)
+    return updates['status']
+
+
+def _execute_in_thread(j):
+    try:
+        return execute(j)
+    finally:
+        # Handlers in worker threads open their own connections; release them between jobs
+        close_old_connections()
+        connection.close()
+
+
+class Worker:
+    """
+    Polls the queue and runs claimed job handlers on a thread pool.
+    Claims and outcomes are written from the polling thread only.
+    """
+
+    def __init__(self, threads=None, poll_interval=None, visibility_timeout=None):
+        self.threads = threads or settings.JOB_THREADS
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+
+    def saturated_names(self, running):
+        """Job names at their per-process concurrency limit"""
+        counts = {}
+        for j in running.values():
+            counts[j.name] = counts.get(j.name, 0) + 1
+        return [
+            name for name, (_, limit) in _handlers.items()
+            if limit is not None and counts.get(name, 0) >= limit
+        ]
+
+    def run(self, once=False):
+        """Process jobs until stop() is called, or until the queue is drained when `once`"""
+        processed = 0
+        logger.info("Job worker %s started with %s threads", self.name, self.threads)
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job') as pool:
+            running = {}
+            while not self.stop_event.is_set():
+                jobs = claim(self.threads - len(running), self.visibility_timeout, self.saturated_names(running))
+                for j in jobs:
+                    running[pool.submit(_execute_in_thread, j)] = j
+                if not running:
+                    if once:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    j = running.pop(future)
+                    processed += 1
+                    try:
+                        if not record(j, future.result()):
+                            logger.warning("Job %s outlived its lease; its result was discarded", j)
+                    except Exception:
+                        # The job stays leased and is retried once the lease expires
+                        logger.exception("Could not record the outcome of job %s", j)
+        logger.info("Job worker %s stopped after %s jobs", self.name, processed)
+        return processed
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def run_pending(visibility_timeout=None):
+    """Run every due job in the calling thread, e.g. from tests or a cron entry; returns the count"""
+    processed = 0
+    while True:
+        jobs = claim(1, visibility_timeout)
+        if not jobs:
+            return processed
+        run(jobs[0])
+        processed += 1
+
+
+def prune(older_than_days=7):
+    """Delete finished jobs older than the cutoff; failed jobs are kept for inspection"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
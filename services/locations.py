@@ -0,0 +1,139 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from .feed import get_broker, location_event, publish
+from .google_api import validate_coordinates
+from .httpcache import bump_version
+from .models import ServiceProvider
+from .spatial import encode_geohash
+from .tasks import queue_snapshot_rebuild
+# services/locations.py
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ['latitude', 'longitude', 'geohash']
+
+
+class LocationBuffer:
+    """
+    Coalesces provider GPS pings to the latest position per provider. The first
+    ping into an empty buffer opens a LOCATION_FLUSH_INTERVAL window; when it
+    closes, or the buffer holds LOCATION_BUFFER_MAX providers, everything is
+    written with one bulk_update of the location columns and geohash cell.
+    """
+
+    def __init__(self):
+        self._pending = {}  # provider_id -> (timestamp, lat, lng)
+        self._lock = threading.Lock()
+        self._timer = None
+        self.flushed = 0
+
+    def add(self, provider_id, lat, lng, timestamp=None):
+        """Buffer one ping; older pings than the one already held are ignored"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            current = self._pending.get(provider_id)
+            if current is None or timestamp >= current[0]:
+                self._pending[provider_id] = (timestamp, lat, lng)
+            full = len(self._pending) >= settings.LOCATION_BUFFER_MAX
+            if not full:
+                self._schedule()
+        if full:
+            self.flush_quietly()
+
+    def _schedule(self):
+        """Start the flush timer for the current window; call with the lock held"""
+        if self._timer is None:
+            self._timer = threading.Timer(settings.LOCATION_FLUSH_INTERVAL, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return pending
+
+    def _restore(self, pending):
+        """Put back entries from a failed flush unless newer pings arrived meanwhile"""
+        with self._lock:
+            for provider_id, entry in pending.items():
+                current = self._pending.get(provider_id)
+                if current is None or entry[0] > current[0]:
+                    self._pending[provider_id] = entry
+            self._schedule()
+
+    def flush(self):
+        """Write buffered positions; returns the number of providers updated"""
+        pending = self._take()
+        if not pending:
+            return 0
+        try:
+            # Providers deleted since their pings arrived are dropped here rather than updated as no-ops
+            categories = dict(ServiceProvider.objects.filter(pk__in=pending).values_list('pk', 'category_id'))
+            providers = [
+                ServiceProvider(pk=provider_id, latitude=lat, longitude=lng, geohash=encode_geohash(lat, lng))
+                for provider_id, (_, lat, lng) in pending.items() if provider_id in categories
+            ]
+            ServiceProvider.objects.bulk_update(providers, LOCATION_FIELDS, batch_size=500)
+        except Exception:
+            logger.exception("Flushing %s provider locations failed; keeping them for the next flush", len(pending))
+            self._restore(pending)
+            raise
+        if len(providers) < len(pending):
+            logger.info("Dropped buffered locations of %s deleted providers", len(pending) - len(providers))
+        if not providers:
+            return 0
+        self.flushed += len(providers)
+        bump_version(ServiceProvider)
+        queue_snapshot_rebuild()
+        self.publish(pending, categories)
+        return len(providers)
+
+    def publish(self, pending, categories):
+        """Tell feed subscribers about the flushed positions (bulk_update sends no signals)"""
+        if not get_broker().wants_events():
+            return
+        publish(
+            location_event(provider_id, categories[provider_id], lat, lng)
+            for provider_id, (_, lat, lng) in pending.items() if provider_id in categories
+        )
+
+    def flush_quietly(self):
+        """flush() for timers and shutdown hooks, where failures are only logged"""
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def _flush_from_timer(self):
+        try:
+            self.flush_quietly()
+        finally:
+            # The timer thread's connection is not closed by request handling
+            connection.close()
+
+
+location_buffer = LocationBuffer()
+atexit.register(location_buffer.flush_quietly)
+
+
+def parse_ping(ping):
+    """Return (lat, lng, timestamp) from a ping dict, raising ValueError if it is malformed"""
+    try:
+        lat, lng = float(ping['latitude']), float(ping['longitude'])
+        timestamp = float(ping['timestamp']) if ping.get('timestamp') is not None else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('latitude and longitude must be numbers')
+    if not validate_coordinates(lat, lng):
+        raise ValueError('coordinates out of range')
+    return lat, lng, timestamp
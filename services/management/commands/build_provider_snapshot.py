@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from services.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write located providers to a memory-mappable columnar snapshot and publish it atomically"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Snapshot file; defaults to PROVIDER_SNAPSHOT_PATH")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.PROVIDER_SNAPSHOT_PATH
+        if not output:
+            raise CommandError("Pass --output or set PROVIDER_SNAPSHOT_PATH")
+        count = build_snapshot(output, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} providers to {output}"))
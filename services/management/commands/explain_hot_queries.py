@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Upper
+
+from services.distance import bounding_box_filter
+from services.models import Review, ServiceCategory, ServiceProvider, ServiceRequest
+from services.spatial import cells_filter, covering_cells
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN on the hot API queries and report whether each uses its index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="Use EXPLAIN ANALYZE (Postgres only)")
+        parser.add_argument('--lat', type=float, default=31.5204)
+        parser.add_argument('--lng', type=float, default=74.3587)
+        parser.add_argument('--radius', type=int, default=5000)
+
+    def hot_queries(self, lat, lng, radius):
+        """Yield (label, acceptable index names, queryset) with sample parameters from the data"""
+        category = ServiceCategory.objects.order_by('pk').first()
+        provider_id = ServiceProvider.objects.values_list('pk', flat=True).order_by('pk').first() or 0
+        user_id = User.objects.values_list('pk', flat=True).order_by('pk').first() or 0
+        name = category.name if category else 'electrician'
+        category_id = category.pk if category else 0
+
+        # Spelled as the index expression: iexact compiles to LIKE on SQLite, which cannot use it
+        yield ('category by name', ('category_name_upper_idx',),
+               ServiceCategory.objects.alias(name_upper=Upper('name')).filter(name_upper=name.upper()))
+        # Either composite index narrows the scan to the search area
+        yield ('discover cell scan', ('provider_category_geohash_idx', 'provider_category_latlng_idx'),
+               ServiceProvider.objects.filter(
+                   cells_filter(covering_cells(lat, lng, radius)),
+                   bounding_box_filter(lat, lng, radius),
+                   category_id=category_id,
+               ).values_list('pk', 'latitude', 'longitude'))
+        yield ('discover bounding box', ('provider_category_latlng_idx',),
+               ServiceProvider.objects.filter(bounding_box_filter(lat, lng, radius), category_id=category_id)
+               .values_list('pk', 'latitude', 'longitude'))
+        yield ('providers by rating', ('provider_bayesian_rating_idx',),
+               ServiceProvider.objects.order_by('-bayesian_rating', 'id')[:50])
+        yield ('requests for provider', ('request_provider_created_idx',),
+               ServiceRequest.objects.filter(provider_id=provider_id).order_by('-created_at', '-id')[:50])
+        yield ('requests for customer', ('request_customer_created_idx',),
+               ServiceRequest.objects.filter(customer_id=user_id).order_by('-created_at', '-id')[:50])
+        yield ('reviews for provider', ('review_provider_created_idx',),
+               Review.objects.filter(provider_id=provider_id).order_by('-created_at', '-id')[:50])
+        yield ('reviews by customer', ('review_customer_created_idx',),
+               Review.objects.filter(customer_id=user_id).order_by('-created_at', '-id')[:50])
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        missed = 0
+        for label, indexes, queryset in self.hot_queries(options['lat'], options['lng'], options['radius']):
+            plan = queryset.explain(**explain_options)
+            used = next((index for index in indexes if index in plan), None)
+            missed += not used
+            if used:
+                self.stdout.write(self.style.SUCCESS(f"== {label}: uses {used}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"== {label}: does NOT use {' or '.join(indexes)}"))
+            self.stdout.write(plan)
+        if missed:
+            self.stdout.write(self.style.WARNING(
+                f"{missed} queries did not use their index; on small tables the planner may prefer a "
+                "sequential scan, so run ANALYZE and re-check against production-sized data."
+            ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from services.bulk import FORMATS, detect_format, export_providers
+
+
+class Command(BaseCommand):
+    help = "Export service providers as CSV or JSONL, streaming rows from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="File to write; defaults to stdout")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the output extension, else csv")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or detect_format(output or '')
+        rows = export_providers(fmt=fmt, chunk_size=options['chunk_size'])
+        if not output:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(rows)
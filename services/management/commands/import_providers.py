@@ -0,0 +1,71 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.bulk import FORMATS, GEOCODE_MODES, detect_format, import_providers, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import service providers from a CSV or JSONL file, streaming it in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--geocode', choices=GEOCODE_MODES, default='queue',
+                            help="Queue background geocoding jobs (default) or geocode before inserting")
+        parser.add_argument('--geocode-workers', type=int, help="Inline geocoding threads; defaults to settings.GEOCODE_WORKERS")
+        parser.add_argument('--progress-file', help="Last committed line; an existing file resumes the import")
+        parser.add_argument('--errors-file', help="Append per-row errors here as CSV (line, error)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or detect_format(path)
+        progress_file = options['progress_file']
+
+        start_after = 0
+        if progress_file and os.path.exists(progress_file):
+            with open(progress_file) as f:
+                start_after = int(f.read().strip() or 0)
+            self.stdout.write(f"Resuming after line {start_after}")
+
+        errors_out = open(options['errors_file'], 'a', newline='') if options['errors_file'] else None
+        errors_writer = csv.writer(errors_out) if errors_out else None
+        reported = 0
+
+        def on_chunk(result):
+            nonlocal reported
+            for line, message in result.errors[reported:]:
+                if errors_writer:
+                    errors_writer.writerow([line, message])
+                else:
+                    self.stderr.write(f"line {line}: {message}")
+            reported = len(result.errors)
+            if errors_out:
+                errors_out.flush()
+            if progress_file:
+                # Write then rename so a crash never leaves a truncated progress file
+                with open(f"{progress_file}.tmp", 'w') as f:
+                    f.write(str(result.last_line))
+                os.replace(f"{progress_file}.tmp", progress_file)
+            self.stdout.write(f"line {result.last_line}: {result.created} created, {len(result.errors)} errors")
+
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                result = import_providers(
+                    read_rows(f, fmt),
+                    chunk_size=options['chunk_size'],
+                    start_after=start_after,
+                    geocode=options['geocode'],
+                    geocode_workers=options['geocode_workers'],
+                    on_chunk=on_chunk,
+                )
+        finally:
+            if errors_out:
+                errors_out.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} providers with {len(result.errors)} errors"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from services.ratings import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute review count, sum, mean and Bayesian rating for every provider"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} providers"))
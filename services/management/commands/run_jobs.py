@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from services.jobs import Worker, prune
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs on a thread pool until stopped (SIGINT/SIGTERM)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, help="Defaults to settings.JOB_THREADS")
+        parser.add_argument('--poll-interval', type=float, help="Seconds between polls of an idle queue")
+        parser.add_argument('--visibility-timeout', type=int,
+                            help="Seconds a claimed job may run before another worker may retry it")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due")
+        parser.add_argument('--prune-days', type=int, help="First delete finished jobs older than this")
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            self.stdout.write(f"Pruned {prune(options['prune_days'])} finished jobs")
+        worker = Worker(
+            threads=options['threads'],
+            poll_interval=options['poll_interval'],
+            visibility_timeout=options['visibility_timeout'],
+        )
+        if not options['once']:
+            # Finish in-flight jobs, then exit; unfinished leases expire and are retried
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: worker.stop())
+        processed = worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
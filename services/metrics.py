@@ -0,0 +1,112 @@
+import bisect
+import threading
+# services/metrics.py
+
+# Latency buckets in seconds, Prometheus style (upper bounds, +Inf implied)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    def snapshot(self):
+        """Return {'buckets': [(bound, cumulative count), ...], 'sum': ..., 'count': ...}"""
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        snapshot = self.snapshot()
+        if not snapshot['count']:
+            return None
+        target = q * snapshot['count']
+        for bound, running in snapshot['buckets']:
+            if running >= target:
+                return bound
+        return float('inf')
+
+# Query-count buckets for per-request database work
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class MetricsRegistry:
+    """Labelled histograms and counters rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._histograms = {}  # name -> (help, buckets, {labels: Histogram})
+        self._counters = {}    # name -> (help, {labels: value})
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        """Return the Histogram for `name` with `labels` (a tuple of (key, value) pairs)"""
+        with self._lock:
+            _, _, series = self._histograms.setdefault(name, (help_text, buckets, {}))
+            if labels not in series:
+                series[labels] = Histogram(buckets)
+            return series[labels]
+
+    def inc(self, name, help_text, labels, amount=1):
+        with self._lock:
+            _, series = self._counters.setdefault(name, (help_text, {}))
+            series[labels] = series.get(labels, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, extra_histograms=(), extra_counters=()):
+        """
+        Prometheus exposition text; `extra_histograms` adds (name, help, {labels: Histogram})
+        families and `extra_counters` (name, help, {labels: value}) ones.
+        """
+        with self._lock:
+            counters = [(name, h, dict(series)) for name, (h, series) in sorted(self._counters.items())]
+            histograms = [(name, h, dict(series)) for name, (h, _, series) in sorted(self._histograms.items())]
+        lines = []
+        for name, help_text, series in counters + list(extra_counters):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{_labels(labels)} {value}' for labels, value in sorted(series.items())]
+        for name, help_text, series in histograms + list(extra_histograms):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for labels, histogram in sorted(series.items()):
+                snapshot = histogram.snapshot()
+                for bound, count in snapshot['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {snapshot["sum"]}')
+                lines.append(f'{name}_count{_labels(labels)} {snapshot["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+from services.spatial import encode_geohash
+
+
+def populate_geohash(apps, schema_editor):
+    ServiceProvider = apps.get_model('services', 'ServiceProvider')
+    providers = list(ServiceProvider.objects.only('id', 'latitude', 'longitude'))
+    for provider in providers:
+        provider.geohash = encode_geohash(provider.latitude, provider.longitude)
+    ServiceProvider.objects.bulk_update(providers, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def rebuild_aggregates(apps, schema_editor):
+    ServiceProvider = apps.get_model('services', 'ServiceProvider')
+    Review = apps.get_model('services', 'Review')
+    weight, prior = settings.RATING_PRIOR_WEIGHT, settings.RATING_PRIOR_MEAN
+    totals = {
+        row['provider_id']: (row['count'], row['total'])
+        for row in Review.objects.values('provider_id').annotate(count=Count('id'), total=Sum('rating'))
+    }
+    providers = list(ServiceProvider.objects.only('id'))
+    for provider in providers:
+        count, total = totals.get(provider.id, (0, 0))
+        provider.review_count = count
+        provider.review_sum = total
+        provider.rating = round(total / count, 2) if count else 0
+        provider.bayesian_rating = (weight * prior + total) / (weight + count)
+    ServiceProvider.objects.bulk_update(
+        providers, ['review_count', 'review_sum', 'rating', 'bayesian_rating'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_placedetails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='bayesian_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='review_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['-bayesian_rating', 'id'], name='provider_bayesian_rating_idx'),
+        ),
+        migrations.RunPython(rebuild_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+# Previously hardcoded in services.google_api.get_nearby_services
+SERVICE_TYPE_MAP = {
+    "plumber": "plumber",
+    "electrician": "electrician",
+    "mechanic": "car_repair",
+    "doctor": "doctor",
+    "tailor": "clothing_store",
+    "ac technician": "hvac_contractor",
+    "barber": "hair_care",
+    "salon": "beauty_salon",
+    "mover": "moving_company",
+    "laundry": "laundry",
+}
+
+
+def populate_google_type(apps, schema_editor):
+    ServiceCategory = apps.get_model('services', 'ServiceCategory')
+    categories = list(ServiceCategory.objects.all())
+    for category in categories:
+        category.google_type = SERVICE_TYPE_MAP.get(category.name.lower(), '')
+    ServiceCategory.objects.bulk_update(categories, ['google_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='google_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.RunPython(populate_google_type, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from .spatial import encode_geohash
 
 class ServiceCategory(models.Model):
     name = models.CharField(max_length=100)
+    # Google Places type for nearby search; blank falls back to a keyword search
+    google_type = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        indexes = [
+            # name__iexact compiles to UPPER("name") = UPPER(%s) on Postgres
+            models.Index(Upper('name'), name='category_name_upper_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -13,14 +24,43 @@ class ServiceProvider(models.Model):
     bio = models.TextField()
     phone = models.CharField(max_length=15)
     address = models.CharField(max_length=255)
-    latitude = models.FloatField()
-    longitude = models.FloatField()
+    # Null until the address is geocoded by the background job
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     profile_image = models.ImageField(upload_to='profiles/')
-    rating = models.FloatField(default=0)
+    # Review aggregates, maintained by services.ratings on every review write
+    rating = models.FloatField(default=0)  # mean review rating
+    review_count = models.PositiveIntegerField(default=0)
+    review_sum = models.IntegerField(default=0)
+    bayesian_rating = models.FloatField(default=0)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Category-scoped geohash range scans for nearby search
+            models.Index(fields=['category', 'geohash'], name='provider_category_geohash_idx'),
+            models.Index(fields=['category', 'latitude', 'longitude'], name='provider_category_latlng_idx'),
+            models.Index(fields=['-bayesian_rating', 'id'], name='provider_bayesian_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.category.name}"
 
+    @property
+    def has_location(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.review_count:
+            # No reviews yet: rank at the prior until ratings come in
+            self.bayesian_rating = settings.RATING_PRIOR_MEAN
+        # Keep the spatial index cell in step with the coordinates
+        self.geohash = encode_geohash(self.latitude, self.longitude) if self.has_location else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
 class ServiceRequest(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
     provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE)
@@ -29,6 +69,12 @@ class ServiceRequest(models.Model):
     is_accepted = models.BooleanField(default=False)
     is_completed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['provider', 'created_at'], name='request_provider_created_idx'),
+            models.Index(fields=['customer', 'created_at'], name='request_customer_created_idx'),
+        ]
+
     def __str__(self):
         return f"Request from {self.customer.username} to {self.provider.user.username}"
 
@@ -39,6 +85,12 @@ class Review(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['provider', 'created_at'], name='review_provider_created_idx'),
+            models.Index(fields=['customer', 'created_at'], name='review_customer_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.customer.username} → {self.provider.user.username} ({self.rating})"
 
@@ -48,4 +100,63 @@ class UserProfile(models.Model):
     is_service_provider = models.BooleanField(default=False)
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+class GeocodeCache(models.Model):
+    """Geocoding results keyed by normalized address; null coordinates mark a failed lookup"""
+    query = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.query
+
+class PlaceDetails(models.Model):
+    """Google place details stored field by field; absent fields are kept as null"""
+    place_id = models.CharField(max_length=255, unique=True)
+    data = models.JSONField(default=dict)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.place_id
+
+class Job(models.Model):
+    """
+    Background work queued in the database and run by `manage.py run_jobs`.
+    A running job whose `locked_until` has passed is considered abandoned and
+    is claimed again. `dedupe_key` is unique among queued jobs, so repeat requests
+    collapse into one run that sees the latest data.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued'),
+                name='job_queued_dedupe_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,110 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+# services/pagination.py
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def seek_filter(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`, compared as a tuple: for
+    ('-bayesian_rating', 'id') that is rating < r OR (rating = r AND id > i).
+    """
+    query, equal = Q(), {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        query |= Q(**equal, **{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value})
+        equal[name] = value
+    return query
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination seeking on indexed columns, so page N costs the same as
+    page 1. Cursors are opaque base64 tokens returned in `next`/`previous`
+    carrying the boundary row's value for every ordering field, so ties on the
+    leading field are paged past by the trailing ones rather than by an offset.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        ordering = tuple(_flip(f) for f in self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(seek_filter(ordering, self.cursor.position))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = self.cursor is not None if reverse else has_more
+        self.has_previous = has_more if reverse else self.cursor is not None
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # Cursors come back from clients, so each value is parsed as its ordering field
+            position = [self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                        for field, value in zip(self.ordering, position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def _position(self, row):
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+        # isoformat() keeps microseconds, which DjangoJSONEncoder would truncate
+        return json.dumps([get(field.lstrip('-')) for field in self.ordering],
+                          default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+
+class RecentFirstPagination(KeysetPagination):
+    # created_at seeks via the (owner, created_at) indexes; id breaks ties
+    ordering = ('-created_at', '-id')
+
+
+class ProviderPagination(KeysetPagination):
+    def get_ordering(self, request, queryset, view):
+        # ?ordering=rating pages through the precomputed Bayesian score
+        if request.query_params.get('ordering') == 'rating':
+            return ('-bayesian_rating', 'id')
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,132 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .google_api import PLACE_DETAILS_FIELDS, get_place_details
+from .httpcache import bump_version
+from .models import PlaceDetails
+# services/places.py
+
+logger = logging.getLogger(__name__)
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def parse_fields(raw):
+    """Parse a comma-separated `fields` query value; raises ValueError on unknown fields"""
+    if not raw:
+        return PLACE_DETAILS_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in PLACE_DETAILS_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Valid options: {', '.join(PLACE_DETAILS_FIELDS)}")
+    return fields
+
+
+def _select(data, fields):
+    return {f: data[f] for f in fields if data.get(f) is not None}
+
+
+def _fetch(place_id, fields):
+    """Fetch `fields` from Google; returns (data, error_payload)"""
+    payload = get_place_details(place_id, fields)
+    if payload.get('status') != 'OK':
+        return None, payload
+    result = payload.get('result') or {}
+    return {f: result.get(f) for f in fields}, None
+
+
+def _upsert(place_id, data, fetched_at):
+    PlaceDetails.objects.bulk_create(
+        [PlaceDetails(place_id=place_id, data=data, fetched_at=fetched_at)],
+        update_conflicts=True, unique_fields=['place_id'], update_fields=['data', 'fetched_at'],
+    )
+
+
+def _store(place_id, data, fetched_at=None):
+    """
+    Merge `data` into the stored fields under a row lock, so fields it does not
+    carry (fetched by another request meanwhile) are kept. Returns the merged fields.
+    """
+    # No savepoint: nothing here is retried, a failure simply propagates
+    with transaction.atomic(savepoint=False):
+        stored, stored_at = PlaceDetails.objects.select_for_update().filter(place_id=place_id).values_list(
+            'data', 'fetched_at'
+        ).first() or ({}, None)
+        data = {**stored, **data}
+        _upsert(place_id, data, fetched_at or stored_at or timezone.now())
+    bump_version(PlaceDetails)
+    return data
+
+
+def refresh_place_details(place_id, fields, merge=True):
+    """
+    Re-fetch `fields` of a place, merge them into what is stored and reset its
+    freshness. merge=False skips the locked read for places not stored yet; a
+    field lost to a racing first fetch is simply fetched again when asked for.
+    """
+    data, error = _fetch(place_id, fields)
+    if data is None:
+        return data, error
+    if merge:
+        _store(place_id, data, fetched_at=timezone.now())
+    else:
+        _upsert(place_id, data, timezone.now())
+        bump_version(PlaceDetails)
+    return data, error
+
+
+def _refresh_in_background(place_id, fields):
+    try:
+        refresh_place_details(place_id, fields)
+    except Exception:
+        logger.exception("Refreshing place details for %s failed", place_id)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(place_id)
+        close_old_connections()
+
+
+def schedule_refresh(place_id, fields):
+    """Revalidate a stale entry off the request path, once per place at a time"""
+    with _refreshing_lock:
+        if place_id in _refreshing:
+            return
+        _refreshing.add(place_id)
+    threading.Thread(target=_refresh_in_background, args=(place_id, fields), daemon=True).start()
+
+
+def get_cached_place_details(place_id, fields=PLACE_DETAILS_FIELDS):
+    """
+    Return (result, error_payload) for a place, limited to `fields`.
+    Fresh entries are served without an outbound call; stale ones within
+    PLACE_DETAILS_STALE_TTL are served while a refresh runs in the background.
+    Fields never fetched before are requested on their own and merged in.
+    """
+    entry = PlaceDetails.objects.filter(place_id=place_id).first()
+    if entry is None:
+        data, error = refresh_place_details(place_id, fields, merge=False)
+        return (None, error) if error else (_select(data, fields), None)
+
+    age = timezone.now() - entry.fetched_at
+    fresh = age <= timedelta(seconds=settings.PLACE_DETAILS_TTL)
+    usable = age <= timedelta(seconds=settings.PLACE_DETAILS_STALE_TTL)
+    missing = [f for f in fields if f not in entry.data]
+
+    if not usable:
+        data, error = refresh_place_details(place_id, fields)
+        return (None, error) if error else (_select(data, fields), None)
+
+    if missing:
+        data, error = _fetch(place_id, missing)
+        if error:
+            return None, error
+        entry.data = _store(place_id, data)
+
+    if not fresh:
+        schedule_refresh(place_id, tuple(entry.data))
+    return _select(entry.data, fields), None
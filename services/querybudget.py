@@ -0,0 +1,108 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+# services/querybudget.py
+
+logger = logging.getLogger(__name__)
+
+# Counters open in the current context. Context variables follow a request into
+# sync_to_async threads, whose connections are not the event loop thread's.
+_counters = ContextVar('query_counters', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Query count and time tallied by count_queries()"""
+
+    def __init__(self, aliases=None):
+        self.aliases = set(aliases) if aliases else None
+        self.count = 0
+        self.duration = 0.0
+
+
+def _tally_queries(execute, sql, params, many, context):
+    counters = _counters.get()
+    if not counters:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        alias = context['connection'].alias
+        for counter in counters:
+            if counter.aliases is None or alias in counter.aliases:
+                counter.count += 1
+                counter.duration += duration
+
+
+def install_query_counter(connection, **kwargs):
+    """Add the tallying execute wrapper to a connection; connected to connection_created"""
+    if _tally_queries not in connection.execute_wrappers:
+        # First, so execute_wrapper() blocks, which pop the last wrapper, leave it in place
+        connection.execute_wrappers.insert(0, _tally_queries)
+
+
+@contextmanager
+def count_queries(aliases=None):
+    """Count queries issued inside the block, in this context and threads it hands work to"""
+    for alias in connections:
+        install_query_counter(connections[alias])
+    counter = QueryCounter(aliases)
+    token = _counters.set(_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+
+
+def budget_for(url_name):
+    return settings.QUERY_BUDGETS.get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count queries per request and compare GET requests with settings.QUERY_BUDGETS,
+    keyed by URL name. Over-budget requests are logged, or raise
+    QueryBudgetExceeded when QUERY_BUDGET_ACTION is 'raise'.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with count_queries() as counter:
+            response = self.get_response(request)
+        return self.check(request, response, counter)
+
+    async def __acall__(self, request):
+        with count_queries() as counter:
+            response = await self.get_response(request)
+        return self.check(request, response, counter)
+
+    def check(self, request, response, counter):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = budget_for(url_name) if request.method in ('GET', 'HEAD') else None
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(counter.count)
+        if budget is not None and counter.count > budget:
+            message = f"{request.method} {request.path} ({url_name}) ran {counter.count} queries, budget is {budget}"
+            if settings.QUERY_BUDGET_ACTION == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,148 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+from requests.exceptions import RequestException
+# services/ratelimit.py
+
+
+class RateLimitedError(RequestException):
+    """Raised without touching the network when an upstream's token bucket is empty"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LocalBucketStore:
+    """Token buckets held in this process; limits apply per worker"""
+
+    def __init__(self, **options):
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Take one token; returns 0 when allowed, otherwise the seconds until a token is due"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets in a Django cache alias, so every worker draws from the same bucket.
+    Updates are read-modify-write, so racing workers can overshoot by a token or two.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='ratelimit:', **options):
+        from django.core.cache import caches
+
+        self._cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        key = self.key_prefix + key
+        tokens, updated_at = self._cache.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Keep the entry until the bucket would have refilled anyway
+        self._cache.set(key, (tokens, now), timeout=int(burst / rate) + 1)
+        return 0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        # Shared entries cannot be listed; they expire once their bucket is full again
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Return the process-wide store configured by settings.RATE_LIMIT_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = settings.RATE_LIMIT_STORE
+            options = {k.lower(): v for k, v in config.items() if k != 'BACKEND'}
+            _store = import_string(config.get('BACKEND', 'services.ratelimit.LocalBucketStore'))(**options)
+        return _store
+
+
+def reset_rate_limits():
+    """Drop the store (and with it local buckets) so it is rebuilt from current settings"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.clear()
+        _store = None
+
+
+def take_token(key, limit):
+    """Take a token for `key` under a {'RATE': per second, 'BURST': n} limit; returns the wait, 0 if allowed"""
+    if not limit:
+        return 0
+    return get_bucket_store().take(key, limit['RATE'], limit['BURST'])
+
+
+def acquire_upstream(name, max_wait=0):
+    """
+    Take a token for calls to an upstream in UPSTREAM_RATE_LIMITS, sleeping up to
+    `max_wait` seconds for one; raises RateLimitedError if none comes in time.
+    """
+    limit = settings.UPSTREAM_RATE_LIMITS.get(name)
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = take_token(f'upstream:{name}', limit)
+        if not wait:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitedError(f"{name} rate limit reached", wait)
+        time.sleep(wait)
+
+
+def client_wait(request, scope, user=None):
+    """
+    Take a token from the client's bucket for `scope`; returns the wait, 0 if allowed.
+    Clients are the authenticated `user` if given, otherwise the remote address.
+    """
+    if user is not None and user.is_authenticated:
+        ident = f'user:{user.pk}'
+    else:
+        ident = f"ip:{BaseThrottle().get_ident(request)}"
+    return take_token(f'client:{scope}:{ident}', settings.CLIENT_RATE_LIMITS.get(scope))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle drawing from the client's CLIENT_RATE_LIMITS[scope] bucket (or the view's throttle_scope)"""
+    scope = None
+
+    def allow_request(self, request, view):
+        self._wait = client_wait(request, self.scope or getattr(view, 'throttle_scope', None), request.user)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class DiscoverThrottle(TokenBucketThrottle):
+    scope = 'discover'
+
+
+class PlaceDetailsThrottle(TokenBucketThrottle):
+    scope = 'place_details'
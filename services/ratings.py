@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from .httpcache import bump_version
+from .models import Review, ServiceProvider
+from .tasks import queue_snapshot_rebuild
+# services/ratings.py
+
+AGGREGATE_FIELDS = ['review_count', 'review_sum', 'rating', 'bayesian_rating']
+
+
+def bayesian_rating(count, total):
+    """
+    Mean rating shrunk towards RATING_PRIOR_MEAN as if every provider had
+    RATING_PRIOR_WEIGHT extra reviews at the prior, so a single 5-star
+    review does not outrank a hundred 4.8s.
+    """
+    weight = settings.RATING_PRIOR_WEIGHT
+    return (weight * settings.RATING_PRIOR_MEAN + total) / (weight + count)
+
+
+def set_aggregates(provider, count, total):
+    provider.review_count = count
+    provider.review_sum = total
+    provider.rating = round(total / count, 2) if count else 0
+    provider.bayesian_rating = bayesian_rating(count, total)
+
+
+def apply_review_change(provider_id, count_delta, sum_delta):
+    """Fold one review create/update/delete into the provider's aggregates"""
+    with transaction.atomic():
+        provider = (
+            ServiceProvider.objects.select_for_update()
+            .only('pk', 'review_count', 'review_sum')
+            .get(pk=provider_id)
+        )
+        set_aggregates(
+            provider,
+            provider.review_count + count_delta,
+            provider.review_sum + sum_delta,
+        )
+        ServiceProvider.objects.filter(pk=provider_id).update(
+            **{field: getattr(provider, field) for field in AGGREGATE_FIELDS}
+        )
+        bump_version(ServiceProvider)
+        queue_snapshot_rebuild()
+
+
+def rebuild_aggregates(batch_size=1000):
+    """Recompute every provider's aggregates from Review rows; returns the number updated"""
+    totals = {
+        row['provider_id']: (row['count'], row['total'])
+        for row in Review.objects.values('provider_id').annotate(count=Count('id'), total=Sum('rating'))
+    }
+    updated, batch = 0, []
+    for provider in ServiceProvider.objects.only('pk').order_by('pk').iterator(chunk_size=batch_size):
+        set_aggregates(provider, *totals.get(provider.pk, (0, 0)))
+        batch.append(provider)
+        if len(batch) >= batch_size:
+            updated += ServiceProvider.objects.bulk_update(batch, AGGREGATE_FIELDS)
+            batch = []
+    if batch:
+        updated += ServiceProvider.objects.bulk_update(batch, AGGREGATE_FIELDS)
+    bump_version(ServiceProvider)
+    queue_snapshot_rebuild()
+    return updated
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from .models import ServiceCategory
+# services/registry.py
+
+CategoryEntry = namedtuple('CategoryEntry', 'id name google_type')
+
+
+class CategoryRegistry:
+    """
+    Process-local map of lowercase category name to (id, name, google_type).
+    Writes bump a version key in the Django cache; other workers notice it within
+    CATEGORY_REGISTRY_CHECK_INTERVAL seconds and reload from the database. The key
+    only reaches other processes through a shared cache backend, so a copy is also
+    reloaded once it is CATEGORY_REGISTRY_MAX_AGE seconds old.
+    """
+    VERSION_KEY = 'category_registry:version'
+
+    def __init__(self):
+        self._entries = None
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _shared_version(self):
+        return cache.get(self.VERSION_KEY, 0)
+
+    def _entries_map(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._entries is not None and now - self._checked_at < settings.CATEGORY_REGISTRY_CHECK_INTERVAL:
+                return self._entries
+            version = self._shared_version()
+            expired = now - self._loaded_at >= settings.CATEGORY_REGISTRY_MAX_AGE
+            if self._entries is None or version != self._version or expired:
+                self._entries = {
+                    name.lower(): CategoryEntry(pk, name, google_type or None)
+                    for pk, name, google_type in ServiceCategory.objects.values_list('pk', 'name', 'google_type')
+                }
+                self._version = version
+                self._loaded_at = now
+            self._checked_at = now
+            return self._entries
+
+    def get(self, name):
+        """Return the CategoryEntry for a case-insensitive name, or None"""
+        return self._entries_map().get(name.lower())
+
+    def names(self):
+        return list(self._entries_map())
+
+    def load(self):
+        """Populate the registry ahead of the first lookup"""
+        self._entries_map()
+
+    def clear(self):
+        """Drop this process's copy only"""
+        with self._lock:
+            self._entries = None
+
+    def invalidate(self):
+        """Drop this process's copy and tell other workers to drop theirs"""
+        self.clear()
+        if not cache.add(self.VERSION_KEY, 1, timeout=None):
+            try:
+                cache.incr(self.VERSION_KEY)
+            except ValueError:
+                cache.set(self.VERSION_KEY, 1, timeout=None)
+
+
+category_registry = CategoryRegistry()
@@ -0,0 +1,82 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+# services/routers.py
+
+# Set while a request (or block) may read from a replica
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def use_replica():
+    """Route reads inside the block to a replica, e.g. for reports run outside a request"""
+    token = replica_reads.set(True)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Reads go to a random DATABASE_REPLICAS alias while replica_reads is set and to
+    the primary otherwise, so requests that write, and reads that must see their
+    own writes, never touch a lagging replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Enable replica reads for safe requests to the views named in REPLICA_READ_URL_NAMES"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would otherwise run the sync hook through sync_to_async on every request
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_reads.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            # Streamed bodies are produced after this point and read from the primary
+            replica_reads.reset(token)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(False)
+        try:
+            return await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if request.method in ('GET', 'HEAD') and match and match.url_name in settings.REPLICA_READ_URL_NAMES:
+            replica_reads.set(True)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # Awaited in the request's task, so the flag stays set for the view
+        ReplicaRoutingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
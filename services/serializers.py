@@ -1,3 +1,4 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import ServiceProvider, ServiceRequest, Review,ServiceCategory, UserProfile
 from django.contrib.auth.models import User
@@ -55,6 +56,7 @@ class ServiceProviderSerializer(serializers.ModelSerializer):
         model = ServiceProvider
         fields = '__all__'
         depth = 1
+        read_only_fields = ['rating', 'review_count', 'review_sum', 'bayesian_rating']
 
     def create(self, validated_data):
         user_data = validated_data.pop('user')
@@ -65,6 +67,55 @@ class ServiceProviderSerializer(serializers.ModelSerializer):
             return provider
         raise serializers.ValidationError(user_serializer.errors)
 
+class ProviderReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only provider output built from a `.values(*ProviderReadSerializer.values)` row.
+    There is no per-instance field introspection, which dominates ModelSerializer
+    cost on list pages; writes still go through ServiceProviderSerializer.
+    """
+    values = (
+        'id', 'bio', 'phone', 'address', 'latitude', 'longitude', 'profile_image',
+        'rating', 'review_count', 'bayesian_rating',
+        'user_id', 'user__username', 'user__email', 'user__first_name', 'user__last_name',
+        'user__userprofile__phone', 'user__userprofile__is_service_provider',
+        'category_id', 'category__name',
+    )
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, row):
+        has_profile = row['user__userprofile__is_service_provider'] is not None
+        return {
+            'id': row['id'],
+            'user': {
+                'id': row['user_id'],
+                'username': row['user__username'],
+                'email': row['user__email'],
+                'first_name': row['user__first_name'],
+                'last_name': row['user__last_name'],
+                'profile': {
+                    'phone': row['user__userprofile__phone'],
+                    'is_service_provider': row['user__userprofile__is_service_provider'],
+                } if has_profile else None,
+            },
+            'category': {'id': row['category_id'], 'name': row['category__name']},
+            'bio': row['bio'],
+            'phone': row['phone'],
+            'address': row['address'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'profile_image': self.image_url(row['profile_image']),
+            'rating': row['rating'],
+            'review_count': row['review_count'],
+            'bayesian_rating': row['bayesian_rating'],
+        }
+
+
 class ServiceRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = ServiceRequest
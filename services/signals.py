@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .feed import location_event, publish, removed_event
+from .httpcache import bump_version, forget_user_active
+from .models import PlaceDetails, Review, ServiceCategory, ServiceProvider, UserProfile
+from .registry import category_registry
+from .tasks import queue_snapshot_rebuild
+# services/signals.py
+
+
+@receiver([post_save, post_delete], sender=ServiceCategory)
+def invalidate_category_registry(sender, **kwargs):
+    category_registry.invalidate()
+
+
+@receiver(post_save, sender=ServiceProvider)
+def publish_provider_location(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'latitude', 'longitude'} & set(update_fields):
+        return
+    if instance.has_location:
+        publish([location_event(instance.pk, instance.category_id, instance.latitude, instance.longitude)])
+
+
+@receiver(post_delete, sender=ServiceProvider)
+def publish_provider_removed(sender, instance, **kwargs):
+    publish([removed_event(instance.pk, instance.category_id)])
+
+
+@receiver([post_save, post_delete], sender=ServiceProvider)
+def rebuild_provider_snapshot(sender, **kwargs):
+    queue_snapshot_rebuild()
+
+
+@receiver([post_save, post_delete], sender=ServiceCategory)
+@receiver([post_save, post_delete], sender=ServiceProvider)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=PlaceDetails)
+def bump_response_version(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver([post_save, post_delete], sender=User)
+def bump_user_response_version(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached response includes
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    forget_user_active(instance.pk)
+    bump_version(sender)
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import weakref
+# services/singleflight.py
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: the first caller for a key runs the
+    function and every caller arriving while it is in flight waits for, and
+    shares, its result or exception. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self._async_calls = weakref.WeakKeyDictionary()  # loop -> {key: task}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, coroutine_func):
+        """
+        Async counterpart of do() for callers on the same event loop. The shared call
+        runs as a task, so a caller that gives up (e.g. on a timeout) does not cancel it for the rest.
+        """
+        calls = self._async_calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_func())
+            calls[key] = task
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from .models import ServiceProvider
+from .spatial import GEOHASH_PRECISION, cell_range, covering_cells, rank_candidates
+# services/snapshot.py
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NMCSNAP1'
+# Snapshot candidates read per result wanted, leaving room for providers deleted or moved since the build
+OVERFETCH = 2
+# Columns start on this boundary so every typed view of the mapping is aligned
+ALIGNMENT = 64
+
+NUMERIC_COLUMNS = (
+    ('id', '<i8'),
+    ('category_id', '<i8'),
+    ('latitude', '<f8'),
+    ('longitude', '<f8'),
+    ('rating', '<f8'),
+    ('review_count', '<i8'),
+    ('bayesian_rating', '<f8'),
+    ('geohash', f'S{GEOHASH_PRECISION}'),
+)
+TEXT_COLUMNS = ('name', 'address', 'phone')
+
+
+def _pad(offset):
+    return -offset % ALIGNMENT
+
+
+def _columns_from_rows(rows):
+    """Turn provider rows into sorted column arrays, text as (utf-8 blob, offsets) pairs"""
+    columns = {name: np.array([r[i] for r in rows], dtype=dtype) for i, (name, dtype) in enumerate(NUMERIC_COLUMNS)}
+    # Category-major, then geohash order: a category's providers in one cell are contiguous
+    order = np.lexsort((columns['id'], columns['geohash'], columns['category_id']))
+    columns = {name: values[order] for name, values in columns.items()}
+    for j, name in enumerate(TEXT_COLUMNS, start=len(NUMERIC_COLUMNS)):
+        encoded = [rows[i][j].encode('utf-8') for i in order]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        columns[f'{name}.offsets'] = offsets
+        columns[f'{name}.data'] = np.frombuffer(b''.join(encoded), dtype='u1')
+    return columns
+
+
+def build_snapshot(path, chunk_size=2000):
+    """
+    Write every located provider to `path` as a columnar snapshot and publish it
+    atomically, so workers mapping the previous file never see a partial one.
+    Returns the number of providers written.
+    """
+    rows = [
+        (pk, category_id, lat, lng, rating, review_count, bayesian, geohash.encode('ascii'),
+         f"{first} {last}".strip() or username, address, phone)
+        for pk, category_id, lat, lng, rating, review_count, bayesian, geohash, first, last, username, address, phone
+        in ServiceProvider.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+            'pk', 'category_id', 'latitude', 'longitude', 'rating', 'review_count', 'bayesian_rating', 'geohash',
+            'user__first_name', 'user__last_name', 'user__username', 'address', 'phone',
+        ).iterator(chunk_size=chunk_size)
+    ]
+    columns = _columns_from_rows(rows)
+
+    layout, offset = [], 0
+    for name, values in columns.items():
+        offset += _pad(offset)
+        layout.append({'name': name, 'dtype': values.dtype.str, 'offset': offset, 'length': len(values)})
+        offset += values.nbytes
+    header = json.dumps({'count': len(rows), 'built_at': time.time(), 'columns': layout}).encode('utf-8')
+    prefix = len(MAGIC) + 8 + len(header)
+    data_start = prefix + _pad(prefix)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            for column, values in zip(layout, columns.values()):
+                f.seek(data_start + column['offset'])
+                f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(rows)
+
+
+class ProviderSnapshot:
+    """Read-only views over a memory-mapped snapshot file; pages are shared by every process mapping it"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a provider snapshot")
+            (header_len,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len))
+        prefix = len(MAGIC) + 8 + header_len
+        data_start = prefix + _pad(prefix)
+        self.count = header['count']
+        self.built_at = header['built_at']
+        self.stale = False
+        buffer = np.memmap(path, dtype='u1', mode='r')
+        self.columns = {}
+        for column in header['columns']:
+            dtype = np.dtype(column['dtype'])
+            start = data_start + column['offset']
+            self.columns[column['name']] = buffer[start:start + column['length'] * dtype.itemsize].view(dtype)
+
+    def _text(self, name, i):
+        offsets = self.columns[f'{name}.offsets']
+        return self.columns[f'{name}.data'][offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def _candidates(self, category_id, lat, lng, radius_m):
+        """Row indices of the category's providers in cells overlapping the search box"""
+        categories = self.columns['category_id']
+        lo, hi = np.searchsorted(categories, category_id, 'left'), np.searchsorted(categories, category_id, 'right')
+        geohashes = self.columns['geohash'][lo:hi]
+        ranges = []
+        for cell in covering_cells(lat, lng, radius_m):
+            low, high = cell_range(cell)
+            start = np.searchsorted(geohashes, low.encode('ascii'), 'left')
+            stop = np.searchsorted(geohashes, high.encode('ascii'), 'left') if high else len(geohashes)
+            if start < stop:
+                ranges.append(np.arange(lo + start, lo + stop))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.intp)
+
+    def nearest(self, category_id, lat, lng, radius_m, limit=10, order_by='distance'):
+        """
+        Return up to `limit` (row, distance_m) pairs within `radius_m`, ordered as
+        services.spatial.nearest_providers orders them.
+        """
+        rows = self._candidates(category_id, lat, lng, radius_m)
+        if not rows.size:
+            return []
+        c = self.columns
+        indices, distances = rank_candidates(
+            lat, lng, c['latitude'][rows], c['longitude'][rows], c['bayesian_rating'][rows], radius_m, limit, order_by
+        )
+        return [(int(rows[i]), float(d)) for i, d in zip(indices, distances)]
+
+    def nearest_providers(self, queryset, category_id, lat, lng, radius_m, limit=10, order_by='distance'):
+        """
+        services.spatial.nearest_providers with candidates taken from the snapshot
+        instead of a range scan. Candidates are loaded by primary key and ranked
+        again on their live rows, so deleted providers are dropped and moved or
+        re-rated ones are placed by their current values.
+        """
+        rows = self.nearest(category_id, lat, lng, radius_m, limit * OVERFETCH, order_by)
+        ids = [int(self.columns['id'][row]) for row, _ in rows]
+        providers = queryset.in_bulk(ids)
+        live = [providers[pk] for pk in ids if pk in providers and providers[pk].has_location]
+        if not live:
+            return []
+        indices, distances = rank_candidates(
+            lat, lng, [p.latitude for p in live], [p.longitude for p in live],
+            [p.bayesian_rating for p in live], radius_m, limit, order_by
+        )
+        return [(live[i], float(d)) for i, d in zip(indices, distances)]
+
+    def provider(self, row):
+        """The provider fields stored for a row, as a dict"""
+        c = self.columns
+        return {
+            'id': int(c['id'][row]),
+            'category_id': int(c['category_id'][row]),
+            'latitude': float(c['latitude'][row]),
+            'longitude': float(c['longitude'][row]),
+            'rating': float(c['rating'][row]),
+            'review_count': int(c['review_count'][row]),
+            'bayesian_rating': float(c['bayesian_rating'][row]),
+            **{name: self._text(name, row) for name in TEXT_COLUMNS},
+        }
+
+
+class SnapshotLoader:
+    """
+    Process-local handle on the snapshot at PROVIDER_SNAPSHOT_PATH. Every
+    PROVIDER_SNAPSHOT_CHECK_INTERVAL seconds the file is stat'ed; a newly published
+    one is mapped in its place, while callers still holding the old mapping keep
+    reading it safely. get() returns None when no snapshot is configured or readable,
+    or when it was built more than PROVIDER_SNAPSHOT_MAX_AGE seconds ago.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._identity = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        path = settings.PROVIDER_SNAPSHOT_PATH
+        if not path:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self._identity is None or now - self._checked_at >= settings.PROVIDER_SNAPSHOT_CHECK_INTERVAL:
+                self._checked_at = now
+                self._reload(path)
+            snapshot = self._snapshot
+        if snapshot is not None and time.time() - snapshot.built_at > settings.PROVIDER_SNAPSHOT_MAX_AGE:
+            if not snapshot.stale:
+                logger.warning("Provider snapshot %s is older than %ss; reading the database until it is rebuilt",
+                               path, settings.PROVIDER_SNAPSHOT_MAX_AGE)
+                snapshot.stale = True
+            return None
+        return snapshot
+
+    def _reload(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._snapshot, self._identity = None, (path, None)
+            return
+        identity = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity != self._identity:
+            try:
+                self._snapshot = ProviderSnapshot(path)
+            except (OSError, ValueError):
+                # Keep serving the previous snapshot, or the database, until a good one lands
+                logger.exception("Could not load provider snapshot %s", path)
+            self._identity = identity
+
+    def load(self):
+        """Map the snapshot ahead of the first lookup"""
+        self.get()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot, self._identity = None, None
+
+
+provider_snapshot = SnapshotLoader()
@@ -0,0 +1,120 @@
+import numpy as np
+from django.db.models import Q
+from .distance import bounding_box, bounding_box_filter, rank_by_distance
+# services/spatial.py
+
+GEOHASH_PRECISION = 9
+
+# Upper bound on prefix lookups per query; the coarsest precision that
+# covers the search box within this many cells is picked.
+MAX_COVERING_CELLS = 32
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    """Encode coordinates as a base32 geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    value, bits, use_lng = 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if use_lng else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        use_lng = not use_lng
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            value, bits = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the (lat, lng) size in degrees of a geohash cell"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def covering_cells(lat, lng, radius_m, max_cells=MAX_COVERING_CELLS):
+    """
+    Return the geohash prefixes whose cells overlap the search circle's bounding box.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_m)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lng_step = cell_size(precision)
+        n_rows, n_cols = round(180.0 / lat_step), round(360.0 / lng_step)
+        row_lo = int((min_lat + 90.0) // lat_step)
+        row_hi = min(int((max_lat + 90.0) // lat_step), n_rows - 1)
+        col_lo = int((min_lng + 180.0) // lng_step)
+        col_hi = int((max_lng + 180.0) // lng_step)
+        if col_hi - col_lo + 1 >= n_cols:
+            col_lo, col_hi = 0, n_cols - 1
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) <= max_cells:
+            break
+
+    cells = set()
+    for row in range(row_lo, row_hi + 1):
+        cell_lat = -90.0 + (row + 0.5) * lat_step
+        for col in range(col_lo, col_hi + 1):
+            cell_lng = -180.0 + ((col % n_cols) + 0.5) * lng_step
+            cells.add(encode_geohash(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def cell_range(cell):
+    """
+    Return the [low, high) string range holding every geohash under `cell`,
+    so prefix lookups become index range scans on any backend.
+    """
+    head = cell.rstrip(_BASE32[-1])
+    if not head:
+        return cell, None
+    return cell, head[:-1] + _BASE32[_BASE32.index(head[-1]) + 1]
+
+
+def cells_filter(cells):
+    """Build a Q object matching providers inside any of the given cells"""
+    query = Q()
+    for cell in cells:
+        low, high = cell_range(cell)
+        query |= Q(geohash__gte=low, geohash__lt=high) if high else Q(geohash__gte=low)
+    return query
+
+
+def rank_candidates(lat, lng, lats, lngs, ratings, radius_m, limit=10, order_by='distance'):
+    """
+    Return (indices, distances) of the candidates within `radius_m`, nearest first,
+    or highest rating first (nearest breaking ties) when `order_by='rating'`.
+    """
+    if order_by == 'rating':
+        indices, distances = rank_by_distance(lat, lng, lats, lngs, radius_m)
+        order = np.lexsort((distances, -np.asarray(ratings)[indices]))[:limit]
+        return indices[order], distances[order]
+    return rank_by_distance(lat, lng, lats, lngs, radius_m, limit)
+
+
+def nearest_providers(queryset, lat, lng, radius_m, limit=10, order_by='distance'):
+    """
+    Return up to `limit` (provider, distance_m) pairs within `radius_m`,
+    nearest first, or highest Bayesian rating first when `order_by='rating'`.
+    Only rows in geohash cells overlapping the radius are read.
+    """
+    cell_filter = cells_filter(covering_cells(lat, lng, radius_m))
+    rows = list(
+        queryset.filter(cell_filter, bounding_box_filter(lat, lng, radius_m))
+        .values_list('pk', 'latitude', 'longitude', 'bayesian_rating')
+    )
+    if not rows:
+        return []
+    pks, lats, lngs, ratings = zip(*rows)
+    indices, distances = rank_candidates(lat, lng, lats, lngs, ratings, radius_m, limit, order_by)
+    providers = queryset.in_bulk([pks[i] for i in indices])
+    return [(providers[pks[i]], float(d)) for i, d in zip(indices, distances)]
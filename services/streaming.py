@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+# services/streaming.py
+
+STREAM_TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def stream_json_array(rows, keys, batch_size=100):
+    """Yield a JSON array of {key: value} objects built from value tuples, a batch of rows at a time"""
+    encode = JSONEncoder().encode
+    yield '['
+    batch, first = [], True
+    for row in rows:
+        batch.append(encode(dict(zip(keys, row))))
+        if len(batch) >= batch_size:
+            yield ('' if first else ',') + ','.join(batch)
+            batch, first = [], False
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
+
+class StreamingListMixin:
+    """
+    List views answer ?stream=1 with every matching row as one flat JSON array,
+    read with .iterator() and encoded as it is sent, so memory stays flat no
+    matter how many rows match. Rows come from values_list() over
+    `stream_fields` ({output key: lookup}) in the paginator's ordering.
+    """
+    stream_fields = None
+
+    def wants_stream(self, request):
+        return request.query_params.get('stream', '').lower() in STREAM_TRUE_VALUES
+
+    def list(self, request, *args, **kwargs):
+        if not self.wants_stream(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None and hasattr(self.paginator, 'get_ordering'):
+            queryset = queryset.order_by(*self.paginator.get_ordering(request, queryset, self))
+        rows = (
+            queryset.values_list(*self.stream_fields.values())
+            .iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+        )
+        return StreamingHttpResponse(stream_json_array(rows, list(self.stream_fields)),
+                                     content_type='application/json')
@@ -0,0 +1,68 @@
+import logging
+
+from django.conf import settings
+from .geocoding import geocode_addresses
+from .jobs import enqueue, enqueue_many, job
+from .models import ServiceProvider
+from .snapshot import build_snapshot
+# services/tasks.py
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_PROVIDERS = 'geocode_providers'
+BUILD_PROVIDER_SNAPSHOT = 'build_provider_snapshot'
+
+
+@job(GEOCODE_PROVIDERS, concurrency=1)
+def geocode_providers(provider_ids):
+    """
+    Fill in coordinates for providers from their addresses.
+    One run at a time per worker keeps Nominatim lookups within its rate limit.
+    Addresses with no match are logged and left without coordinates; only an
+    unreachable or throttled Nominatim fails the job, so it is retried.
+    """
+    providers = [
+        p for p in ServiceProvider.objects.filter(pk__in=provider_ids).only('pk', 'address', 'latitude', 'longitude')
+        if p.address
+    ]
+    # Resolved addresses are cached before this raises, so the retry only repeats the failed lookups
+    coordinates = geocode_addresses([p.address for p in providers], raise_unavailable=True)
+    unresolved = []
+    for provider in providers:
+        lat, lng = coordinates[provider.address]
+        if lat is None:
+            unresolved.append(provider.pk)
+            continue
+        provider.latitude, provider.longitude = lat, lng
+        provider.save(update_fields=['latitude', 'longitude'])
+    if unresolved:
+        logger.warning("No geocoding match for the addresses of providers %s", unresolved)
+
+
+def queue_geocoding(provider):
+    """Queue a geocode of one provider's address, collapsing repeat saves into one job"""
+    return enqueue(GEOCODE_PROVIDERS, {'provider_ids': [provider.pk]}, dedupe_key=f'geocode_provider:{provider.pk}')
+
+
+def queue_bulk_geocoding(provider_ids, batch_size=100):
+    """Queue geocoding for many providers, `batch_size` providers per job"""
+    batches = [provider_ids[i:i + batch_size] for i in range(0, len(provider_ids), batch_size)]
+    return enqueue_many(GEOCODE_PROVIDERS, [{'provider_ids': batch} for batch in batches])
+
+
+@job(BUILD_PROVIDER_SNAPSHOT, concurrency=1)
+def rebuild_provider_snapshot():
+    """Publish a new provider snapshot for discover to map"""
+    if settings.PROVIDER_SNAPSHOT_PATH:
+        build_snapshot(settings.PROVIDER_SNAPSHOT_PATH)
+
+
+def queue_snapshot_rebuild():
+    """
+    Queue a snapshot rebuild after providers change, if a snapshot is configured.
+    Changes within PROVIDER_SNAPSHOT_REBUILD_DELAY seconds collapse into one build.
+    """
+    if not settings.PROVIDER_SNAPSHOT_PATH:
+        return False
+    return enqueue(BUILD_PROVIDER_SNAPSHOT, dedupe_key=BUILD_PROVIDER_SNAPSHOT,
+                   delay=settings.PROVIDER_SNAPSHOT_REBUILD_DELAY)
@@ -0,0 +1,122 @@
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .querybudget import QueryBudgetExceeded, budget_for, count_queries
+# services/testing.py
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is expected here
+        pass
+
+
+class StubServer:
+    """
+    Local HTTP stand-in for upstream APIs.
+    `routes` maps a path to a callable taking the parsed query dict and
+    returning (status, payload); payload dicts and lists are sent as JSON.
+
+        with StubServer({'/nearbysearch/json': handler}) as server:
+            settings.GOOGLE_PLACES_API_URL = server.url
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                stub.requests.append((parts.path, query))
+                route = stub.routes.get(parts.path)
+                if route is None:
+                    status, payload = 404, {'error': 'not found'}
+                else:
+                    status, payload = route(query)
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _QuietHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def hits(self, path):
+        return sum(1 for p, _ in self.requests if p == path)
+
+
+def fake_nearby_search(query):
+    """Places nearbysearch response with one result per request"""
+    lat, lng = (float(v) for v in query['location'].split(','))
+    return 200, {
+        'status': 'OK',
+        'results': [{
+            'place_id': f"stub-{query.get('type') or query.get('keyword')}",
+            'name': 'Stub Place',
+            'geometry': {'location': {'lat': lat, 'lng': lng}},
+        }],
+    }
+
+
+class FakeNominatim:
+    """Nominatim /search stand-in resolving a fixed set of addresses"""
+
+    def __init__(self, places):
+        self.places = {query.lower(): coords for query, coords in places.items()}
+
+    def __call__(self, query):
+        coords = self.places.get(query.get('q', '').lower())
+        if coords is None:
+            return 200, []
+        lat, lng = coords
+        return 200, [{'lat': str(lat), 'lon': str(lng), 'display_name': query['q'], 'place_id': 1}]
+
+
+def fake_place_details(query):
+    """Places details response echoing only the requested fields"""
+    if not query.get('place_id', '').startswith('stub-'):
+        return 200, {'status': 'NOT_FOUND'}
+    place = {
+        'name': 'Stub Place',
+        'formatted_address': '1 Stub Street',
+        'geometry': {'location': {'lat': 31.5204, 'lng': 74.3587}},
+        'rating': 4.5,
+        'user_ratings_total': 12,
+    }
+    fields = query.get('fields', '').split(',')
+    return 200, {'status': 'OK', 'result': {f: place[f] for f in fields if f in place}}
+
+
+class QueryBudgetAssertions:
+    """TestCase mixin for pinning per-endpoint query counts"""
+
+    @contextmanager
+    def assertQueryBudget(self, url_name=None, limit=None):
+        """Fail if the block runs more queries than `limit` or the endpoint's QUERY_BUDGETS entry"""
+        limit = budget_for(url_name) if limit is None else limit
+        with count_queries() as counter:
+            yield counter
+        if counter.count > limit:
+            raise QueryBudgetExceeded(f"{url_name or 'block'} ran {counter.count} queries, budget is {limit}")
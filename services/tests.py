@@ -1,14 +1,83 @@
 # services/tests.py
-from django.test import TestCase
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+import requests
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache as django_cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.contrib.admin.sites import site
+from django.conf import settings
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth.models import User
-from .models import ServiceCategory  # Add this import
+from .models import ServiceCategory, ServiceProvider  # Add this import
+from .spatial import covering_cells, encode_geohash
+from .distance import bounding_box_filter, haversine_m, rank_by_distance
+from .cache import DjangoCacheBackend, LocMemTTLCache, get_cache, reset_caches
+from .google_api import aget_nearby_services, get_nearby_services
+from .testing import FakeNominatim, QueryBudgetAssertions, StubServer, fake_nearby_search, fake_place_details
+from .geocoding import geocode_address, geocode_addresses, normalize_address, reset_geocoder
+from .models import GeocodeCache, PlaceDetails, Review, ServiceRequest, UserProfile
+from .querybudget import QueryBudgetExceeded, count_queries
+from .upstream import CircuitOpenError, Upstream, reset_upstreams
+from .registry import CategoryRegistry, category_registry
+from .bulk import export_providers
+from .ratings import rebuild_aggregates
+from .streaming import stream_json_array
+from .serializers import ProviderReadSerializer, ServiceProviderSerializer
+from .jobs import Worker, claim, enqueue, job, record as record_outcome, run, run_pending
+from .models import Job
+from .admin import ServiceProviderAdmin
+from .locations import LocationBuffer, location_buffer
+from .spatial import nearest_providers
+from .feed import InProcessBroker, get_broker, listener_params, location_event, removed_event, reset_broker
+from .warmup import per_process_state, warm_up
+from .routers import ReplicaRouter, ReplicaRoutingMiddleware, replica_reads
+from .views import ReviewListCreate
+from .metrics import registry as metrics_registry
+from .ratelimit import LocalBucketStore, RateLimitedError, reset_rate_limits
+from .discovery import find_local_providers
+from .snapshot import provider_snapshot
+from .places import refresh_place_details
+
+
+def _stub_location(test, lat=31.5204, lng=74.3587):
+    """Patch the upstream lookups used by discover so tests stay offline"""
+    for target, value in (
+        ('services.views.get_current_location', (lat, lng)),
+        ('services.views.get_nearby_services', {'results': []}),
+    ):
+        patcher = patch(target, return_value=value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
 
 class APITests(TestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = User.objects.create_user(username='test', password='test')
         self.client.force_authenticate(user=self.user)
+        _stub_location(self)
         
         # Create a test service category
         ServiceCategory.objects.create(name='electrician')
@@ -20,4 +89,1607 @@ class APITests(TestCase):
     def test_service_discovery(self):
         response = self.client.get('/api/discover/?service=electrician')
         self.assertEqual(response.status_code, 200)
-        self.assertIn('local_providers', response.data)
\ No newline at end of file
+        self.assertIn('local_providers', response.data)
+
+    def test_request_to_provider_awaiting_geocoding_is_rejected(self):
+        provider = ServiceProvider.objects.create(
+            user=User.objects.create(username='new'), category=ServiceCategory.objects.get(),
+            bio='', phone='1', address='123 Main St'
+        )
+        response = self.client.post(f'/api/providers/{provider.pk}/request/', {'message': 'hi'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Provider location is not known yet')
+
+
+class SpatialIndexTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        _stub_location(self, lat=31.5204, lng=74.3587)
+        self.category = ServiceCategory.objects.create(name='plumber')
+        # Roughly 0.5km, 3km and 20km north of the search point
+        for i, lat in enumerate((31.5249, 31.5474, 31.7004)):
+            user = User.objects.create_user(username=f'p{i}', password='test')
+            ServiceProvider.objects.create(
+                user=user, category=self.category, bio='', phone='1',
+                address='', latitude=lat, longitude=74.3587
+            )
+
+    def test_geohash_is_kept_in_step_with_location(self):
+        provider = ServiceProvider.objects.first()
+        provider.latitude, provider.longitude = 40.7128, -74.0060
+        provider.save(update_fields=['latitude', 'longitude'])
+        provider.refresh_from_db()
+        self.assertEqual(provider.geohash, encode_geohash(40.7128, -74.0060))
+        self.assertTrue(provider.geohash.startswith('dr5r'))
+
+    def test_covering_cells_contain_nearby_points(self):
+        cells = covering_cells(31.5204, 74.3587, 5000)
+        self.assertLessEqual(len(cells), 32)
+        for lat, lng in ((31.5204, 74.3587), (31.56, 74.40), (31.48, 74.31)):
+            self.assertTrue(any(encode_geohash(lat, lng).startswith(c) for c in cells))
+
+    def test_covering_cells_across_antimeridian(self):
+        cells = covering_cells(0.0, 179.99, 5000)
+        for lng in (179.995, -179.995):
+            self.assertTrue(any(encode_geohash(0.0, lng).startswith(c) for c in cells))
+
+    def test_haversine(self):
+        # One degree of latitude is ~111.2km everywhere
+        self.assertAlmostEqual(float(haversine_m(0, 0, 1, 0)), 111195, delta=10)
+        # One degree of longitude shrinks with cos(latitude)
+        self.assertAlmostEqual(float(haversine_m(60, 0, 60, 1)), 55597, delta=10)
+
+    def test_rank_by_distance_is_vectorized(self):
+        lats, lngs = [60.0, 60.0, 60.0, 61.0], [1.0, 0.1, 0.5, 0.0]
+        indices, distances = rank_by_distance(60.0, 0.0, lats, lngs, radius_m=60000, limit=2)
+        self.assertEqual(list(indices), [1, 2])
+        self.assertTrue(all(distances[:-1] <= distances[1:]))
+
+    def test_bounding_box_filter_prefilters_in_db(self):
+        qs = ServiceProvider.objects.filter(bounding_box_filter(31.5204, 74.3587, 5000))
+        self.assertEqual(qs.count(), 2)
+
+    def test_discover_honors_radius(self):
+        response = self.client.get('/api/discover/?service=plumber&radius=5000')
+        self.assertEqual(response.status_code, 200)
+        distances = [p['distance_km'] for p in response.data['local_providers']]
+        self.assertEqual(len(distances), 2)
+        self.assertEqual(distances, sorted(distances))
+        self.assertLess(distances[-1], 5)
+
+        response = self.client.get('/api/discover/?service=plumber&radius=30000')
+        self.assertEqual(len(response.data['local_providers']), 3)
+
+
+class PlacesCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        reset_upstreams()
+        self.server = StubServer({'/nearbysearch/json': fake_nearby_search}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_PLACES_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_repeat_searches_in_same_cell_are_served_from_cache(self):
+        first = get_nearby_services(31.52040, 74.35870, 'plumber', 5000)
+        second = get_nearby_services(31.52041, 74.35871, 'Plumber', 5000)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 1)
+        self.assertEqual(get_cache('PLACES_CACHE').stats()['hits'], 1)
+
+    def test_category_google_type_is_sent_as_type(self):
+        ServiceCategory.objects.create(name='Plumber', google_type='plumber')
+        get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        query = self.server.requests[-1][1]
+        self.assertEqual(query['type'], 'plumber')
+        self.assertNotIn('keyword', query)
+
+    def test_type_keyword_and_radius_are_part_of_the_key(self):
+        get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        get_nearby_services(31.5204, 74.3587, 'plumber', 3000)
+        get_nearby_services(31.5204, 74.3587, 'carpenter', 5000)
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 3)
+        self.assertEqual(self.server.requests[-1][1]['keyword'], 'carpenter')
+        self.assertEqual(get_cache('PLACES_CACHE').stats()['misses'], 3)
+
+    def test_error_responses_are_not_cached(self):
+        self.server.routes['/nearbysearch/json'] = lambda q: (200, {'status': 'OVER_QUERY_LIMIT'})
+        get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 2)
+
+    def test_django_cache_backend(self):
+        with override_settings(PLACES_CACHE={'BACKEND': 'services.cache.DjangoCacheBackend', 'TTL': 60}):
+            reset_caches()
+            get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+            get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 1)
+
+    def test_django_cache_backend_clear_keeps_other_keys(self):
+        django_cache.set('model_version:services.review', 7)
+        backend = DjangoCacheBackend(ttl=60, key_prefix='places:')
+        backend.set('a', 1)
+        backend.clear()
+        self.assertEqual(django_cache.get('model_version:services.review'), 7)
+
+    def test_locmem_ttl_and_lru_eviction(self):
+        cache = LocMemTTLCache(ttl=60, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('d', 4, ttl=-1)
+        self.assertIsNone(cache.get('d'))
+
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        fake = FakeNominatim({'123 Main St, Lahore': (31.5204, 74.3587), '9 Mall Rd, Lahore': (31.56, 74.31)})
+        self.server = StubServer({'/search': fake}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(
+            NOMINATIM_DOMAIN=self.server.url.split('://')[1], NOMINATIM_SCHEME='http', NOMINATIM_MIN_DELAY=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_geocoder()
+        self.addCleanup(reset_geocoder)
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address('  123  Main St ,LAHORE. '), '123 main st, lahore')
+
+    def test_cached_lookup_skips_geocoder(self):
+        self.assertEqual(geocode_address('123 Main St, Lahore'), (31.5204, 74.3587))
+        self.assertEqual(geocode_address('123 main st ,  lahore'), (31.5204, 74.3587))
+        self.assertEqual(self.server.hits('/search'), 1)
+        self.assertTrue(GeocodeCache.objects.filter(query='123 main st, lahore').exists())
+
+    def test_failed_lookups_are_cached_negatively(self):
+        self.assertEqual(geocode_address('Nowhere Lane'), (None, None))
+        self.assertEqual(geocode_address('Nowhere Lane'), (None, None))
+        self.assertEqual(self.server.hits('/search'), 1)
+        with override_settings(GEOCODE_NEGATIVE_TTL=-1):
+            geocode_address('Nowhere Lane')
+        self.assertEqual(self.server.hits('/search'), 2)
+
+    def test_batch_geocoding_dedupes_and_reads_cache_once(self):
+        geocode_address('9 Mall Rd, Lahore')
+        addresses = ['123 Main St, Lahore', '123 MAIN ST, LAHORE', '9 Mall Rd, Lahore', 'Nowhere Lane']
+        with self.assertNumQueries(2):
+            results = geocode_addresses(addresses)
+        self.assertEqual(results['123 MAIN ST, LAHORE'], (31.5204, 74.3587))
+        self.assertEqual(results['Nowhere Lane'], (None, None))
+
+    def test_parallel_workers_split_misses(self):
+        results = geocode_addresses(['123 Main St, Lahore', '9 Mall Rd, Lahore', 'Nowhere Lane'], workers=3)
+        self.assertEqual(results['9 Mall Rd, Lahore'], (31.56, 74.31))
+        self.assertEqual(self.server.hits('/search'), 3)
+        self.assertEqual(GeocodeCache.objects.count(), 3)
+        self.assertEqual(self.server.hits('/search'), 3)
+
+
+class AsyncDiscoverTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        reset_upstreams()
+        self.server = StubServer({'/nearbysearch/json': fake_nearby_search}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_PLACES_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = patch('services.views.get_current_location', return_value=(31.5204, 74.3587))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        category = ServiceCategory.objects.create(name='plumber')
+        user = User.objects.create_user(username='near', password='test')
+        ServiceProvider.objects.create(
+            user=user, category=category, bio='', phone='1',
+            address='', latitude=31.5249, longitude=74.3587
+        )
+
+    async def test_returns_google_and_local_results(self):
+        response = await self.async_client.get('/api/discover/async/?service=plumber')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data['partial'])
+        self.assertEqual(data['google_results'][0]['place_id'], 'stub-plumber')
+        self.assertEqual(len(data['local_providers']), 1)
+
+    async def test_slow_google_yields_partial_results(self):
+        async def slow_places(*args, **kwargs):
+            await asyncio.sleep(1)
+
+        with patch('services.views.aget_nearby_services', slow_places), \
+                override_settings(DISCOVER_TIMEOUTS={'geocode': 1, 'google': 0.05, 'local': 1}):
+            response = await self.async_client.get('/api/discover/async/?service=plumber')
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['partial'])
+        self.assertEqual(data['timed_out'], ['google'])
+        self.assertEqual(data['google_results'], [])
+        self.assertEqual(len(data['local_providers']), 1)
+
+    async def test_invalid_service_type(self):
+        response = await self.async_client.get('/api/discover/async/?service=astronaut')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_geocoding_runs_beside_database_work(self):
+        threads = {}
+
+        def geocode(address):
+            threads['geocode'] = threading.get_ident()
+            return 31.5204, 74.3587
+
+        def category(service_type):
+            threads['category'] = threading.get_ident()
+            return category_registry.get(service_type)
+
+        with patch('services.views.geocode_address', geocode), \
+                patch('services.views.resolve_category', category):
+            response = await self.async_client.get('/api/discover/async/?service=plumber&address=somewhere')
+        self.assertEqual(response.status_code, 200)
+        # A thread sensitive lookup would queue behind the request's ORM work on its one thread
+        self.assertNotEqual(threads['geocode'], threads['category'])
+
+
+class UpstreamClientTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.server = StubServer({}).__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def flaky(self, failures, status=503):
+        def route(query):
+            self.calls += 1
+            return (status, {}) if self.calls <= failures else (200, {'ok': True})
+        return route
+
+    def test_retries_transient_errors(self):
+        self.server.routes['/flaky'] = self.flaky(2)
+        upstream = Upstream('stub', retries=2, backoff=0)
+        response = upstream.get(f"{self.server.url}/flaky")
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(upstream.latency.count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.routes['/missing'] = self.flaky(5, status=404)
+        upstream = Upstream('stub', retries=2, backoff=0)
+        self.assertEqual(upstream.get(f"{self.server.url}/missing").status_code, 404)
+        self.assertEqual(self.calls, 1)
+
+    def test_read_timeout(self):
+        self.server.routes['/slow'] = lambda q: (time.sleep(0.3), (200, {}))[1]
+        upstream = Upstream('stub', read_timeout=0.05, retries=1, backoff=0)
+        with self.assertRaises(requests.exceptions.Timeout):
+            upstream.get(f"{self.server.url}/slow")
+        self.assertEqual(upstream.latency.count, 2)
+        self.assertLess(upstream.latency.quantile(1.0), 0.3)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        self.server.routes['/down'] = self.flaky(2)
+        upstream = Upstream('stub', retries=0, backoff=0, failure_threshold=2, reset_timeout=0.1)
+        upstream.get(f"{self.server.url}/down")
+        upstream.get(f"{self.server.url}/down")
+        self.assertEqual(upstream.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            upstream.get(f"{self.server.url}/down")
+        self.assertEqual(self.calls, 2)
+
+        time.sleep(0.15)
+        self.assertEqual(upstream.breaker.state, 'half_open')
+        self.assertEqual(upstream.get(f"{self.server.url}/down").status_code, 200)
+        self.assertEqual(upstream.breaker.state, 'closed')
+
+    def test_rate_limited_trial_gives_its_slot_back(self):
+        self.server.routes['/down'] = self.flaky(1)
+        upstream = Upstream('stub', retries=0, backoff=0, failure_threshold=1, reset_timeout=0.05)
+        upstream.get(f"{self.server.url}/down")
+        time.sleep(0.06)
+        with patch('services.upstream.acquire_upstream', side_effect=RateLimitedError('stub rate limit reached', 1)):
+            with self.assertRaises(RateLimitedError):
+                upstream.get(f"{self.server.url}/down")
+        self.assertEqual(upstream.breaker.state, 'half_open')
+        self.assertEqual(upstream.get(f"{self.server.url}/down").status_code, 200)
+        self.assertEqual((upstream.breaker.state, self.calls), ('closed', 2))
+
+    def test_unexpected_errors_count_as_failed_trials(self):
+        self.server.routes['/down'] = self.flaky(1)
+        upstream = Upstream('stub', retries=1, backoff=0, failure_threshold=1, reset_timeout=0.05)
+        upstream.get(f"{self.server.url}/down")
+        time.sleep(0.06)
+        with patch.object(upstream.session, 'get', side_effect=requests.exceptions.ChunkedEncodingError()):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                upstream.get(f"{self.server.url}/down")
+        self.assertEqual(upstream.breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertEqual(upstream.get(f"{self.server.url}/down").status_code, 200)
+        self.assertEqual(upstream.breaker.state, 'closed')
+
+    async def test_cancelled_async_trial_gives_its_slot_back(self):
+        self.server.routes['/slow'] = lambda q: (time.sleep(0.3), (200, {}))[1]
+        upstream = Upstream('stub', retries=0, backoff=0)
+        upstream.breaker.opened_at = time.monotonic() - upstream.breaker.reset_timeout
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(upstream.aget(f"{self.server.url}/slow"), 0.05)
+        self.assertEqual(upstream.breaker.state, 'half_open')
+        self.assertTrue(upstream.breaker.allow())
+
+
+class PlaceDetailsStoreTests(TestCase):
+    def setUp(self):
+        reset_upstreams()
+        self.client = APIClient()
+        self.server = StubServer({'/details/json': fake_place_details}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_PLACES_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_cache_hit_makes_no_outbound_call(self):
+        first = self.client.get('/api/places/stub-1/')
+        second = self.client.get('/api/places/stub-1/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.json()['result']['name'], 'Stub Place')
+        self.assertNotIn('website', second.json()['result'])
+        self.assertEqual(self.server.hits('/details/json'), 1)
+
+    def test_field_subsets_fetch_only_missing_fields(self):
+        response = self.client.get('/api/places/stub-1/?fields=name,rating')
+        self.assertEqual(response.json()['result'], {'name': 'Stub Place', 'rating': 4.5})
+        self.assertEqual(self.server.requests[-1][1]['fields'], 'name,rating')
+
+        response = self.client.get('/api/places/stub-1/?fields=rating,formatted_address')
+        self.assertEqual(response.json()['result'], {'rating': 4.5, 'formatted_address': '1 Stub Street'})
+        self.assertEqual(self.server.requests[-1][1]['fields'], 'formatted_address')
+
+        self.client.get('/api/places/stub-1/?fields=name,formatted_address')
+        self.assertEqual(self.server.hits('/details/json'), 2)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/places/stub-1/?fields=name,reviews')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        PlaceDetails.objects.create(
+            place_id='stub-1', data={'name': 'Old Name'},
+            fetched_at=timezone.now() - timedelta(days=2)
+        )
+        with patch('services.places.schedule_refresh') as schedule_refresh:
+            response = self.client.get('/api/places/stub-1/?fields=name')
+        self.assertEqual(response.json()['result'], {'name': 'Old Name'})
+        schedule_refresh.assert_called_once_with('stub-1', ('name',))
+        self.assertEqual(self.server.hits('/details/json'), 0)
+
+    def test_expired_entries_are_refetched(self):
+        PlaceDetails.objects.create(
+            place_id='stub-1', data={'name': 'Old Name'},
+            fetched_at=timezone.now() - timedelta(days=30)
+        )
+        response = self.client.get('/api/places/stub-1/?fields=name')
+        self.assertEqual(response.json()['result'], {'name': 'Stub Place'})
+
+    def test_refresh_keeps_fields_it_did_not_fetch(self):
+        PlaceDetails.objects.create(
+            place_id='stub-1', data={'name': 'Old Name', 'rating': 4.0},
+            fetched_at=timezone.now() - timedelta(days=30)
+        )
+        self.client.get('/api/places/stub-1/?fields=name')
+        # Fetched by another request while the refresh was in flight
+        refresh_place_details('stub-1', ('formatted_address',))
+        entry = PlaceDetails.objects.get(place_id='stub-1')
+        self.assertEqual(entry.data, {'name': 'Stub Place', 'rating': 4.0, 'formatted_address': '1 Stub Street'})
+        self.assertGreater(entry.fetched_at, timezone.now() - timedelta(minutes=1))
+
+    def test_not_found_is_not_stored(self):
+        response = self.client.get('/api/places/unknown/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PlaceDetails.objects.exists())
+
+
+@override_settings(RATING_PRIOR_MEAN=3.0, RATING_PRIOR_WEIGHT=2)
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(username='customer', password='test')
+        self.client.force_authenticate(user=self.customer)
+        _stub_location(self, lat=31.5204, lng=74.3587)
+        category = ServiceCategory.objects.create(name='plumber')
+        self.near, self.far = (
+            ServiceProvider.objects.create(
+                user=User.objects.create_user(username=f'rated{i}', password='test'),
+                category=category, bio='', phone='1', address='', latitude=lat, longitude=74.3587
+            )
+            for i, lat in enumerate((31.5249, 31.5474))
+        )
+
+    def review(self, provider, rating):
+        response = self.client.post('/api/reviews/', {
+            'provider': provider.pk, 'customer': self.customer.pk, 'rating': rating, 'comment': 'ok'
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_new_providers_rank_at_the_prior(self):
+        self.assertEqual(self.near.bayesian_rating, 3.0)
+
+    def test_aggregates_follow_review_writes(self):
+        first = self.review(self.far, 5)
+        self.review(self.far, 4)
+        self.far.refresh_from_db()
+        self.assertEqual((self.far.review_count, self.far.review_sum, self.far.rating), (2, 9, 4.5))
+        self.assertEqual(self.far.bayesian_rating, (2 * 3.0 + 9) / 4)
+
+        self.client.patch(f'/api/reviews/{first}/', {'rating': 1})
+        self.far.refresh_from_db()
+        self.assertEqual((self.far.review_count, self.far.review_sum), (2, 5))
+
+        self.client.patch(f'/api/reviews/{first}/', {'provider': self.near.pk})
+        self.client.delete(f'/api/reviews/{first}/')
+        self.near.refresh_from_db()
+        self.far.refresh_from_db()
+        self.assertEqual((self.near.review_count, self.near.review_sum, self.near.rating), (0, 0, 0))
+        self.assertEqual((self.far.review_count, self.far.review_sum, self.far.rating), (1, 4, 4.0))
+
+    def test_rebuild_command_matches_incremental_aggregates(self):
+        self.review(self.far, 5)
+        self.review(self.near, 2)
+        fields = ('review_count', 'review_sum', 'rating', 'bayesian_rating')
+        expected = list(ServiceProvider.objects.order_by('pk').values_list(*fields))
+        ServiceProvider.objects.update(review_count=0, review_sum=0, rating=0, bayesian_rating=0)
+        call_command('rebuild_ratings', stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(ServiceProvider.objects.order_by('pk').values_list(*fields)), expected)
+
+    def test_discover_and_listing_sort_by_rating(self):
+        self.review(self.far, 5)
+        response = self.client.get('/api/discover/?service=plumber&sort=rating')
+        self.assertEqual([p['provider_id'] for p in response.data['local_providers']], [self.far.pk, self.near.pk])
+        response = self.client.get('/api/discover/?service=plumber')
+        self.assertEqual([p['provider_id'] for p in response.data['local_providers']], [self.near.pk, self.far.pk])
+
+        response = self.client.get('/api/providers/?ordering=rating')
+        self.assertEqual(response.data['results'][0]['id'], self.far.pk)
+
+
+class QueryBudgetTests(QueryBudgetAssertions, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(username='customer', password='test')
+        self.client.force_authenticate(user=self.customer)
+        _stub_location(self, lat=31.5204, lng=74.3587)
+        self.category = ServiceCategory.objects.create(name='plumber')
+        self.add_rows(2)
+        # Workers load the registry once at startup, outside any request
+        category_registry.load()
+
+    def add_rows(self, count):
+        for _ in range(count):
+            n = ServiceProvider.objects.count()
+            user = User.objects.create(username=f'budget{n}', first_name='Pat')
+            UserProfile.objects.create(user=user, is_service_provider=True)
+            provider = ServiceProvider.objects.create(
+                user=user, category=self.category, bio='', phone='1',
+                address='', latitude=31.5204 + n * 0.001, longitude=74.3587
+            )
+            ServiceRequest.objects.create(customer=self.customer, provider=provider, message='help')
+            Review.objects.create(customer=self.customer, provider=provider, rating=4, comment='')
+
+    def query_count(self, url_name, url):
+        # A fresh user per request, as token authentication would load it
+        self.client.force_authenticate(user=User.objects.get(pk=self.customer.pk))
+        with self.assertQueryBudget(url_name) as counter:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return counter.count
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        endpoints = {
+            'discover-services': '/api/discover/?service=plumber',
+            'provider-list': '/api/providers/',
+            'provider-detail': f'/api/providers/{ServiceProvider.objects.first().pk}/',
+            'request-list': '/api/requests/',
+            'review-list': '/api/reviews/',
+        }
+        before = {name: self.query_count(name, url) for name, url in endpoints.items()}
+        self.add_rows(8)
+        after = {name: self.query_count(name, url) for name, url in endpoints.items()}
+        self.assertEqual(before, after)
+        self.assertEqual(after, {
+            'discover-services': 2,
+            'provider-list': 1,
+            'provider-detail': 1,
+            'request-list': 2,
+            'review-list': 1,
+        })
+
+    def test_place_details_budget(self):
+        with StubServer({'/details/json': fake_place_details}) as server, \
+                override_settings(GOOGLE_PLACES_API_URL=server.url):
+            reset_upstreams()
+            self.assertEqual(self.query_count('place-details', '/api/places/stub-1/'), 2)
+            self.assertEqual(self.query_count('place-details', '/api/places/stub-1/'), 1)
+            provider = ServiceProvider.objects.first()
+            self.assertEqual(self.query_count('place-details', f'/api/places/{provider.pk}/'), 1)
+
+    @override_settings(QUERY_BUDGETS={'provider-list': 0}, QUERY_BUDGET_ACTION='raise')
+    def test_middleware_enforces_budgets(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/providers/')
+
+    @override_settings(QUERY_BUDGETS={'provider-list': 0}, QUERY_BUDGET_ACTION='log')
+    def test_middleware_logs_over_budget_requests(self):
+        with self.assertLogs('services.querybudget', 'WARNING'):
+            self.assertEqual(self.client.get('/api/providers/').status_code, 200)
+
+    async def test_queries_in_worker_threads_are_counted(self):
+        def query_on_own_connection():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()
+
+        with count_queries() as counter:
+            await sync_to_async(query_on_own_connection, thread_sensitive=False)()
+        self.assertEqual(counter.count, 1)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_stays_async_under_asgi(self):
+        # Django logs every sync/async adaptation of the handler chain in DEBUG
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(all(asyncio.iscoroutinefunction(method) for method in handler._view_middleware))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create(username='customer')
+        self.client.force_authenticate(user=self.customer)
+        category = ServiceCategory.objects.create(name='plumber')
+        for n in range(7):
+            user = User.objects.create(username=f'paged{n}')
+            provider = ServiceProvider.objects.create(
+                user=user, category=category, bio='', phone='1', address='', latitude=0, longitude=0
+            )
+            Review.objects.create(customer=self.customer, provider=provider, rating=n % 5 + 1, comment='')
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_providers_page_by_id(self):
+        ids, pages = self.walk('/api/providers/?page_size=3')
+        self.assertEqual(ids, list(ServiceProvider.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(pages, 3)
+
+    def test_reviews_page_newest_first(self):
+        ids, _ = self.walk('/api/reviews/?page_size=2')
+        self.assertEqual(ids, list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_cursor_is_opaque_and_seeks(self):
+        response = self.client.get('/api/providers/?page_size=3')
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        self.assertNotIn('id', cursor)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        self.assertIn('"id" >', queries[-1]['sql'].replace('"services_serviceprovider".', ''))
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+
+    def test_rating_order_pages_through_ties(self):
+        # More tied rows than DRF's offset cutoff, all at the same Bayesian score
+        category = ServiceCategory.objects.get()
+        users = User.objects.bulk_create(User(username=f'tied{n}') for n in range(1100))
+        ServiceProvider.objects.bulk_create(
+            ServiceProvider(user=user, category=category, bio='', phone='1', address='', bayesian_rating=3.0)
+            for user in users
+        )
+        expected = list(ServiceProvider.objects.order_by('-bayesian_rating', 'id').values_list('id', flat=True))
+        ids, pages = self.walk('/api/providers/?ordering=rating&page_size=200')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 6)
+
+        response = self.client.get('/api/providers/?ordering=rating&page_size=200')
+        response = self.client.get(self.client.get(response.data['next']).data['next'])
+        back = self.client.get(response.data['previous'])
+        self.assertEqual([row['id'] for row in back.data['results']], expected[200:400])
+        self.assertIsNotNone(back.data['previous'])
+
+    def test_tampered_cursors_are_rejected(self):
+        for position in (['abc', 1], ['2026-01-01T00:00:00', 'x'], [None, 1], [[1], 2]):
+            cursor = base64.b64encode(urlencode({'p': json.dumps(position)}).encode()).decode()
+            response = self.client.get('/api/reviews/', {'page_size': 2, 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_page_size_is_capped(self):
+        with patch('services.pagination.KeysetPagination.max_page_size', 4):
+            response = self.client.get('/api/providers/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 4)
+
+
+class ProviderReadSerializerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create(username='reader'))
+        user = User.objects.create(username='pat', first_name='Pat', email='pat@example.com')
+        UserProfile.objects.create(user=user, phone='0300', is_service_provider=True)
+        self.provider = ServiceProvider.objects.create(
+            user=user, category=ServiceCategory.objects.create(name='plumber'), bio='Pipes', phone='1',
+            address='1 Main St', latitude=31.5, longitude=74.3, profile_image='profiles/pat.png'
+        )
+
+    def test_matches_model_serializer_on_shared_fields(self):
+        request = self.client.get('/api/providers/').wsgi_request
+        flat = ProviderReadSerializer(
+            ServiceProvider.objects.values(*ProviderReadSerializer.values).get(), context={'request': request}
+        ).data
+        full = ServiceProviderSerializer(
+            ServiceProvider.objects.select_related('user__userprofile', 'category').get(), context={'request': request}
+        ).data
+        for key in ('id', 'bio', 'phone', 'address', 'latitude', 'longitude', 'profile_image', 'rating'):
+            self.assertEqual(flat[key], full[key], key)
+        self.assertEqual(flat['user']['profile'], dict(full['user']['profile']))
+        self.assertEqual(flat['category'], {'id': full['category']['id'], 'name': 'plumber'})
+        self.assertNotIn('password', flat['user'])
+
+    def test_list_detail_and_place_details_use_flat_output(self):
+        listed = self.client.get('/api/providers/').json()['results'][0]
+        detail = self.client.get(f'/api/providers/{self.provider.pk}/').json()
+        place = self.client.get(f'/api/places/{self.provider.pk}/').json()['result']
+        self.assertEqual(listed, detail)
+        self.assertEqual(detail, place)
+        self.assertEqual(detail['user']['username'], 'pat')
+        self.assertTrue(detail['profile_image'].startswith('http://testserver/'))
+
+    def test_writes_still_use_model_serializer(self):
+        self.client.force_authenticate(user=self.provider.user)
+        response = self.client.patch(f'/api/providers/{self.provider.pk}/', {'bio': 'Drains'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('review_sum', response.data)
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create(username='customer')
+        self.client.force_authenticate(user=self.customer)
+        category = ServiceCategory.objects.create(name='plumber')
+        for n in range(5):
+            user = User.objects.create(username=f'streamed{n}')
+            provider = ServiceProvider.objects.create(
+                user=user, category=category, bio='', phone='1', address='', latitude=n, longitude=0
+            )
+            Review.objects.create(customer=self.customer, provider=provider, rating=n + 1, comment='ok')
+        rebuild_aggregates()
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_providers_stream_flat_rows_unpaginated(self):
+        with override_settings(STREAM_CHUNK_SIZE=2):
+            rows = self.stream('/api/providers/?stream=1')
+        self.assertEqual([row['username'] for row in rows], [f'streamed{n}' for n in range(5)])
+        self.assertEqual(rows[0]['category'], 'plumber')
+        self.assertEqual(rows[4]['latitude'], 4)
+
+    def test_json_array_batches_join_cleanly(self):
+        for batch_size in (1, 2, 3, 10):
+            body = ''.join(stream_json_array(iter([(1,), (2,), (3,)]), ['a'], batch_size=batch_size))
+            self.assertEqual(json.loads(body), [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertEqual(''.join(stream_json_array(iter([]), ['a'])), '[]')
+
+    def test_stream_follows_paginator_ordering(self):
+        rows = self.stream('/api/providers/?stream=1&ordering=rating')
+        self.assertEqual(rows[0]['username'], 'streamed4')
+        rows = self.stream('/api/reviews/?stream=true')
+        self.assertEqual([row['rating'] for row in rows], [5, 4, 3, 2, 1])
+        self.assertEqual(set(rows[0]), {'id', 'customer', 'provider', 'rating', 'comment', 'created_at'})
+
+    def test_stream_respects_queryset_scoping(self):
+        other = User.objects.create(username='other')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.stream('/api/requests/?stream=1'), [])
+        self.assertEqual(self.stream('/api/reviews/?stream=1'), [])
+
+
+class ExplainHotQueriesTests(TestCase):
+    def test_reports_index_usage_for_each_hot_query(self):
+        out = io.StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        reports = [line for line in out.getvalue().splitlines() if line.startswith('== ')]
+        self.assertEqual(len(reports), 8)
+        self.assertIn('== requests for provider: uses request_provider_created_idx', reports)
+        self.assertIn('== category by name: uses category_name_upper_idx', reports)
+
+
+class CategoryRegistryTests(TestCase):
+    def setUp(self):
+        category_registry.clear()
+        self.addCleanup(category_registry.clear)
+        self.category = ServiceCategory.objects.create(name='Electrician', google_type='electrician')
+
+    def test_lookups_after_load_do_not_query(self):
+        category_registry.load()
+        with self.assertNumQueries(0):
+            entry = category_registry.get('ELECTRICIAN')
+            self.assertEqual(category_registry.names(), ['electrician'])
+        self.assertEqual(entry, (self.category.pk, 'Electrician', 'electrician'))
+        self.assertIsNone(category_registry.get('astronaut'))
+
+    def test_saves_and_deletes_invalidate(self):
+        category_registry.load()
+        ServiceCategory.objects.create(name='Carpenter')
+        self.assertIsNone(category_registry.get('carpenter').google_type)
+        self.category.delete()
+        self.assertEqual(category_registry.names(), ['carpenter'])
+
+    @override_settings(CATEGORY_REGISTRY_CHECK_INTERVAL=0)
+    def test_other_workers_reload_after_version_bump(self):
+        # A second registry stands in for another worker process sharing the cache
+        other_worker = CategoryRegistry()
+        self.assertIsNotNone(other_worker.get('electrician'))
+        self.category.name = 'Electricians'
+        self.category.save()
+        self.assertIsNone(other_worker.get('electrician'))
+        self.assertIsNotNone(other_worker.get('electricians'))
+
+    @override_settings(CATEGORY_REGISTRY_CHECK_INTERVAL=0, CATEGORY_REGISTRY_MAX_AGE=0.05)
+    def test_copies_expire_without_a_shared_version(self):
+        other_worker = CategoryRegistry()
+        self.assertIsNone(other_worker.get('carpenter'))
+        # Created through a worker whose cache this one cannot see
+        with patch('services.registry.cache'):
+            ServiceCategory.objects.create(name='Carpenter')
+        self.assertIsNone(other_worker.get('carpenter'))
+        time.sleep(0.06)
+        self.assertIsNotNone(other_worker.get('carpenter'))
+
+    def test_discover_rejects_unknown_categories(self):
+        _stub_location(self)
+        self.client.force_login(User.objects.create_user(username='u', password='p'))
+        response = self.client.get('/api/discover/?service=astronaut')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('electrician', response.json()['error'])
+
+
+PROVIDERS_CSV = """username,email,first_name,last_name,phone,category,address,bio,latitude,longitude
+ali,ali@example.com,Ali,Khan,0300,plumber,,Pipes,31.52,74.35
+sara,,Sara,,0301,Plumber,"123 Main St, Lahore",,,
+ali,,,,,plumber,,,31.5,74.3
+omar,,,,,astronaut,,,31.5,74.3
+zoya,,,,,plumber,Nowhere Lane,,,
+bilal,,,,,plumber,,,95,74.3
+"""
+
+
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        category_registry.clear()
+        self.addCleanup(category_registry.clear)
+        self.category = ServiceCategory.objects.create(name='plumber')
+        self.server = StubServer({'/search': FakeNominatim({'123 Main St, Lahore': (31.5204, 74.3587)})}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(
+            NOMINATIM_DOMAIN=self.server.url.split('://')[1], NOMINATIM_SCHEME='http', NOMINATIM_MIN_DELAY=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_geocoder()
+        self.addCleanup(reset_geocoder)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_command_imports_valid_rows_and_reports_errors(self):
+        path = self.write('providers.csv', PROVIDERS_CSV)
+        errors = os.path.join(self.tmp.name, 'errors.csv')
+        progress = os.path.join(self.tmp.name, 'progress')
+        call_command('import_providers', path, chunk_size=4, errors_file=errors, progress_file=progress,
+                     geocode='inline', geocode_workers=2, stdout=io.StringIO())
+
+        sara = ServiceProvider.objects.get(user__username='sara')
+        self.assertEqual((sara.latitude, sara.longitude), (31.5204, 74.3587))
+        self.assertEqual(sara.geohash, encode_geohash(31.5204, 74.3587))
+        self.assertTrue(sara.user.userprofile.is_service_provider)
+        self.assertFalse(sara.user.has_usable_password())
+        self.assertEqual(ServiceProvider.objects.count(), 2)
+        with open(errors) as f:
+            self.assertEqual([row.split(',')[0] for row in f.read().splitlines()], ['4', '5', '6', '7'])
+        with open(progress) as f:
+            self.assertEqual(f.read(), '7')
+
+    def test_default_import_queues_geocoding(self):
+        path = self.write('providers.csv', PROVIDERS_CSV)
+        call_command('import_providers', path, stdout=io.StringIO(), stderr=io.StringIO())
+        sara = ServiceProvider.objects.get(user__username='sara')
+        self.assertFalse(sara.has_location)
+        self.assertEqual(sara.geohash, '')
+        self.assertEqual(self.server.hits('/search'), 0)
+        self.assertEqual(Job.objects.get().payload['provider_ids'], sorted(
+            ServiceProvider.objects.filter(user__username__in=['sara', 'zoya']).values_list('pk', flat=True)))
+
+        # 'Nowhere Lane' has no match: it is reported and the rest of the batch still succeeds
+        with self.assertLogs('services.tasks', 'WARNING') as logs:
+            run_pending()
+        zoya = ServiceProvider.objects.get(user__username='zoya')
+        self.assertIn(str(zoya.pk), logs.output[0])
+        self.assertFalse(zoya.has_location)
+        sara.refresh_from_db()
+        self.assertEqual((sara.latitude, sara.longitude), (31.5204, 74.3587))
+        self.assertEqual(sara.geohash, encode_geohash(31.5204, 74.3587))
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_geocoding_job_retries_when_nominatim_is_down(self):
+        path = self.write('providers.csv', PROVIDERS_CSV)
+        call_command('import_providers', path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.server.routes['/search'] = lambda query: (503, {})
+        with self.assertLogs('services.jobs', 'ERROR'):
+            run_pending()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('GeocodingUnavailable', job.last_error)
+
+    def test_resume_skips_committed_lines(self):
+        path = self.write('providers.csv', PROVIDERS_CSV)
+        progress = self.write('progress', '2')
+        call_command('import_providers', path, progress_file=progress, stdout=io.StringIO(), stderr=io.StringIO())
+        # Line 2 is skipped, so the later duplicate 'ali' on line 4 is the one imported
+        self.assertEqual(ServiceProvider.objects.get(user__username='ali').latitude, 31.5)
+        self.assertTrue(ServiceProvider.objects.filter(user__username='sara').exists())
+
+    def test_admin_upload_and_export_round_trip(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='staff', password='x', is_staff=True))
+        upload = io.BytesIO(b'{"username": "ali", "category": "plumber", "latitude": 31.52, "longitude": 74.35}\n'
+                            b'not json\n')
+        upload.name = 'providers.jsonl'
+        response = client.post('/api/admin/providers/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [{'line': 2, 'error': 'not a JSON object'}])
+
+        response = client.get('/api/admin/providers/export/?file_format=jsonl')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(r['username'], r['category'], r['latitude']) for r in rows], [('ali', 'plumber', 31.52)])
+
+        csv_lines = ''.join(export_providers(fmt='csv')).splitlines()
+        self.assertEqual(csv_lines[0].split(',')[:2], ['id', 'username'])
+        self.assertEqual(len(csv_lines), 2)
+        output = os.path.join(self.tmp.name, 'export.csv')
+        call_command('export_providers', output=output)
+        with open(output) as f:
+            self.assertEqual(f.read().splitlines(), csv_lines)
+
+    def test_admin_endpoints_require_staff(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='plain', password='x'))
+        self.assertEqual(client.get('/api/admin/providers/export/').status_code, 403)
+
+
+calls = []
+
+
+@job('test.record')
+def record(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_dedupe_key_collapses_waiting_jobs(self):
+        self.assertTrue(enqueue('test.record', {'value': 1}, dedupe_key='k'))
+        self.assertFalse(enqueue('test.record', {'value': 2}, dedupe_key='k'))
+        claim(1)
+        # Once running, a new request queues a fresh job that sees later changes
+        self.assertTrue(enqueue('test.record', {'value': 3}, dedupe_key='k'))
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_success_and_retry_with_backoff(self):
+        enqueue('test.record', {'value': 'ok'})
+        enqueue('test.record', {'value': 'bad', 'fail': True}, max_attempts=2)
+        with self.assertLogs('services.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), 2)
+        self.assertEqual(calls, ['ok', 'bad'])
+        ok, bad = Job.objects.order_by('id')
+        self.assertEqual(ok.status, Job.DONE)
+        self.assertEqual((bad.status, bad.attempts, bad.last_error), (Job.QUEUED, 1, 'RuntimeError: boom'))
+        self.assertGreater(bad.run_after, timezone.now())
+
+        Job.objects.filter(pk=bad.pk).update(run_after=timezone.now())
+        with self.assertLogs('services.jobs', 'ERROR'):
+            run_pending()
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (Job.FAILED, 2))
+
+    def test_expired_leases_are_reclaimed(self):
+        enqueue('test.record', {'value': 1})
+        first = claim(5, visibility_timeout=60)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(claim(5), [])
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        second = claim(5)
+        self.assertEqual((second[0].pk, second[0].attempts), (first[0].pk, 2))
+        # The first worker's late result is discarded; the new lease holder's counts
+        run(first[0])
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+        run(second[0])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_retry_yields_to_a_queued_job_with_the_same_key(self):
+        enqueue('test.record', {'value': 'bad', 'fail': True}, dedupe_key='k')
+        running = claim(1)[0]
+        enqueue('test.record', {'value': 'new'}, dedupe_key='k')
+        with self.assertLogs('services.jobs', 'ERROR'):
+            self.assertEqual(run(running), Job.QUEUED)
+        failed, queued = Job.objects.order_by('id')
+        self.assertEqual(failed.status, Job.FAILED)
+        self.assertIn(f'superseded by queued job #{queued.pk}', failed.last_error)
+        self.assertEqual(queued.status, Job.QUEUED)
+
+    def test_retry_racing_an_enqueue_is_failed(self):
+        enqueue('test.record', {'value': 'bad', 'fail': True}, dedupe_key='k')
+        running = claim(1)[0]
+        enqueue('test.record', {'value': 'new'}, dedupe_key='k')
+        updates = {'status': Job.QUEUED, 'run_after': timezone.now(), 'last_error': 'RuntimeError: boom'}
+        # The queued job is not seen by the check, only by the unique index
+        with patch('django.db.models.query.QuerySet.first', return_value=None):
+            self.assertTrue(record_outcome(running, updates))
+        self.assertEqual(Job.objects.get(pk=running.pk).status, Job.FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_unknown_jobs_fail_immediately(self):
+        enqueue('test.missing')
+        with self.assertLogs('services.jobs', 'ERROR'):
+            run_pending()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('no handler', job.last_error)
+
+    def test_admin_save_queues_geocoding(self):
+        user = User.objects.create(username='pat')
+        provider = ServiceProvider(user=user, category=ServiceCategory.objects.create(name='plumber'),
+                                   bio='', phone='1', address='123 Main St, Lahore')
+        with patch('services.tasks.geocode_addresses') as geocode:
+            ServiceProviderAdmin(ServiceProvider, site).save_model(None, provider, SimpleNamespace(changed_data=[]), False)
+            geocode.assert_not_called()
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.payload, job.dedupe_key),
+                         ('geocode_providers', {'provider_ids': [provider.pk]}, f'geocode_provider:{provider.pk}'))
+
+        with patch('services.tasks.geocode_addresses', return_value={'123 Main St, Lahore': (31.5, 74.3)}):
+            run_pending()
+        provider.refresh_from_db()
+        self.assertEqual((provider.latitude, provider.longitude), (31.5, 74.3))
+        self.assertEqual(provider.geohash, encode_geohash(31.5, 74.3))
+
+
+class JobWorkerTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_drains_queue_on_thread_pool(self):
+        for n in range(5):
+            enqueue('test.record', {'value': n})
+        self.assertEqual(Worker(threads=2, poll_interval=0.01).run(once=True), 5)
+        self.assertEqual(sorted(calls), list(range(5)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 5)
+
+    def test_bookkeeping_errors_do_not_stop_the_worker(self):
+        for n in range(3):
+            enqueue('test.record', {'value': n})
+        with patch('services.jobs.record', side_effect=[RuntimeError('db gone'), True, True]), \
+                self.assertLogs('services.jobs', 'ERROR'):
+            self.assertEqual(Worker(threads=1, poll_interval=0.01, visibility_timeout=60).run(once=True), 3)
+        self.assertEqual(sorted(calls), [0, 1, 2])
+
+
+def load_gunicorn_conf(**environ):
+    """Execute gunicorn.conf.py as gunicorn would, under extra environment variables"""
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', settings.BASE_DIR / 'gunicorn.conf.py')
+    conf = importlib.util.module_from_spec(spec)
+    with patch.dict(os.environ, environ):
+        spec.loader.exec_module(conf)
+    return conf
+
+
+@override_settings(LOCATION_FLUSH_INTERVAL=60)
+class LocationIngestTests(TestCase):
+    def setUp(self):
+        self.addCleanup(location_buffer._take)
+        self.client = APIClient()
+        self.category = ServiceCategory.objects.create(name='plumber')
+        self.providers = []
+        for n in range(2):
+            user = User.objects.create(username=f'mobile{n}')
+            self.providers.append(ServiceProvider.objects.create(
+                user=user, category=self.category, bio='Original', phone='1', address='', latitude=0, longitude=0
+            ))
+
+    def test_pings_coalesce_to_latest_and_flush_in_one_update(self):
+        buffer = LocationBuffer()
+        self.addCleanup(buffer._take)
+        first, second = self.providers
+        buffer.add(first.pk, 31.50, 74.30, timestamp=100)
+        buffer.add(first.pk, 31.52, 74.35, timestamp=300)
+        buffer.add(first.pk, 31.51, 74.33, timestamp=200)  # arrived late, older
+        buffer.add(second.pk, 24.86, 67.01, timestamp=100)
+        self.assertEqual(len(buffer), 2)
+        # Written by another request meanwhile; the flush must not clobber it
+        ServiceProvider.objects.filter(pk=first.pk).update(bio='Edited')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(buffer.flush(), 2)
+        first.refresh_from_db()
+        self.assertEqual((first.latitude, first.longitude, first.bio), (31.52, 74.35, 'Edited'))
+        self.assertEqual(first.geohash, encode_geohash(31.52, 74.35))
+        nearby = nearest_providers(ServiceProvider.objects.all(), 31.52, 74.35, 1000)
+        self.assertEqual([p.pk for p, _ in nearby], [first.pk])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_flush_drops_deleted_providers(self):
+        buffer = LocationBuffer()
+        self.addCleanup(buffer._take)
+        gone, kept = self.providers
+        buffer.add(gone.pk, 5, 5)
+        buffer.add(kept.pk, 6, 6)
+        gone.delete()
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual((buffer.flushed, len(buffer)), (1, 0))
+        self.assertEqual(ServiceProvider.objects.get(pk=kept.pk).latitude, 6)
+
+    def test_worker_exit_flushes_the_buffer(self):
+        conf = load_gunicorn_conf()
+        location_buffer.add(self.providers[0].pk, 7, 7)
+        worker = SimpleNamespace(pid=1, log=SimpleNamespace(info=lambda *args: None))
+        conf.worker_exit(None, worker)
+        self.assertEqual(len(location_buffer), 0)
+        self.assertEqual(ServiceProvider.objects.get(pk=self.providers[0].pk).latitude, 7)
+
+    @override_settings(LOCATION_BUFFER_MAX=2)
+    def test_full_buffer_flushes_immediately(self):
+        buffer = LocationBuffer()
+        self.addCleanup(buffer._take)
+        buffer.add(self.providers[0].pk, 1, 1)
+        self.assertEqual(buffer.flushed, 0)
+        buffer.add(self.providers[1].pk, 2, 2)
+        self.assertEqual((buffer.flushed, len(buffer)), (2, 0))
+        self.assertEqual(ServiceProvider.objects.get(pk=self.providers[1].pk).latitude, 2)
+
+    def test_provider_posts_a_batch_of_pings(self):
+        provider = self.providers[0]
+        self.client.force_authenticate(user=provider.user)
+        response = self.client.post('/api/locations/', {'pings': [
+            {'latitude': 31.5, 'longitude': 74.3, 'timestamp': 1},
+            {'latitude': 31.6, 'longitude': 74.4, 'timestamp': 2},
+            {'latitude': 'north', 'longitude': 74.4},
+            {'latitude': 91, 'longitude': 0},
+            {'latitude': 1, 'longitude': 1, 'provider_id': self.providers[1].pk},  # ignored for non-staff
+        ]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertEqual([r['index'] for r in response.data['rejected']], [2, 3])
+        location_buffer.flush()
+        provider.refresh_from_db()
+        self.assertEqual((provider.latitude, provider.longitude), (1, 1))
+        self.assertEqual(ServiceProvider.objects.get(pk=self.providers[1].pk).latitude, 0)
+
+    def test_staff_relay_and_permissions(self):
+        self.client.force_authenticate(user=User.objects.create(username='customer'))
+        self.assertEqual(self.client.post('/api/locations/', {'pings': [{'latitude': 1, 'longitude': 1}]},
+                                          format='json').status_code, 403)
+        self.client.force_authenticate(user=User.objects.create(username='gateway', is_staff=True))
+        response = self.client.post('/api/locations/', {'pings': [
+            {'latitude': 5, 'longitude': 5, 'provider_id': provider.pk} for provider in self.providers
+        ] + [{'latitude': 5, 'longitude': 5}, {'latitude': 5, 'longitude': 5, 'provider_id': 10 ** 6}]},
+            format='json')
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(response.data['rejected'], [
+            {'index': 2, 'error': 'provider_id is required'}, {'index': 3, 'error': 'unknown provider_id'},
+        ])
+        self.assertEqual(location_buffer.flush(), 2)
+
+
+def _sse(chunk):
+    """Parse one server-sent event into (event name, data)"""
+    fields = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+    return fields['event'], json.loads(fields['data'])
+
+
+class ProviderFeedTests(TestCase):
+    def setUp(self):
+        reset_broker()
+        self.addCleanup(reset_broker)
+        self.category = ServiceCategory.objects.create(name='plumber')
+        self.near, self.far = (
+            ServiceProvider.objects.create(
+                user=User.objects.create(username=name), category=self.category,
+                bio='', phone='1', address='', latitude=lat, longitude=74.35
+            )
+            for name, lat in (('near', 31.521), ('far', 31.9))
+        )
+
+    async def test_feed_streams_snapshot_then_region_events(self):
+        response = await self.async_client.get('/api/feed/?service=Plumber&lat=31.52&lng=74.35&radius=2000')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n')
+        name, data = _sse(await anext(stream))
+        self.assertEqual((name, [p['provider_id'] for p in data['providers']]), ('snapshot', [self.near.pk]))
+
+        broker = get_broker()
+        cid = self.category.id
+        broker.publish([
+            location_event(self.far.pk, cid, 31.522, 74.35),   # moves into the region
+            location_event(self.far.pk + 100, cid + 1, 31.52, 74.35),  # other category
+            location_event(self.near.pk, cid, 35.0, 74.35),    # leaves
+            removed_event(self.far.pk, cid),
+        ])
+        received = [_sse(await asyncio.wait_for(anext(stream), 1)) for _ in range(3)]
+        self.assertEqual([(name, data['provider_id']) for name, data in received],
+                         [('location', self.far.pk), ('left', self.near.pk), ('removed', self.far.pk)])
+        # A client disconnect cancels the pending read, as the ASGI handler does
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(broker.has_subscribers())
+
+    async def test_keep_alive_and_resync_for_slow_clients(self):
+        with override_settings(PROVIDER_FEED={**settings.PROVIDER_FEED, 'HEARTBEAT': 0.01, 'QUEUE_SIZE': 1}):
+            reset_broker()
+            response = await self.async_client.get('/api/feed/?service=plumber&lat=31.52&lng=74.35&radius=2000')
+            stream = aiter(response.streaming_content)
+            await anext(stream), await anext(stream)
+            self.assertEqual(await anext(stream), b': keep-alive\n\n')
+            get_broker().publish([location_event(self.near.pk, self.category.id, 31.5201, 74.35 + n * 1e-5)
+                                  for n in range(3)])
+            await asyncio.sleep(0)
+            self.assertEqual(_sse(await anext(stream))[0], 'location')
+            self.assertEqual(_sse(await anext(stream))[0], 'resync')
+            await stream.aclose()
+
+    async def test_bad_parameters(self):
+        self.assertEqual((await self.async_client.get('/api/feed/?service=plumber')).status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/feed/?service=astronaut&lat=1&lng=1')).status_code, 400)
+
+    def test_wsgi_requests_are_refused(self):
+        response = self.client.get('/api/feed/?service=plumber&lat=31.52&lng=74.35')
+        self.assertEqual(response.status_code, 501)
+
+    def test_saves_deletes_and_flushes_publish_events(self):
+        published = []
+        with patch.object(InProcessBroker, 'has_subscribers', return_value=True), \
+                patch.object(InProcessBroker, 'publish', side_effect=published.extend):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.near.latitude = 31.53
+                self.near.save(update_fields=['latitude'])
+                self.near.bio = 'ignored'
+                self.near.save(update_fields=['bio'])
+            buffer = LocationBuffer()
+            self.addCleanup(buffer._take)
+            with self.captureOnCommitCallbacks(execute=True):
+                buffer.add(self.far.pk, 31.6, 74.4)
+                buffer.flush()
+            far_pk = self.far.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                self.far.delete()
+        self.assertEqual([(e['type'], e['provider_id'], e.get('latitude')) for e in published], [
+            ('location', self.near.pk, 31.53),
+            ('location', far_pk, 31.6),
+            ('removed', far_pk, None),
+        ])
+
+    def test_listener_connects_with_libpq_params_only(self):
+        params = listener_params({
+            'NAME': 'nmc', 'USER': 'app', 'PASSWORD': 'secret', 'HOST': 'db', 'PORT': 5432,
+            'OPTIONS': {'sslmode': 'require', 'pool': {'max_size': 4}, 'server_side_binding': False,
+                        'prepare_threshold': None},
+        })
+        self.assertEqual(params, {'dbname': 'nmc', 'user': 'app', 'password': 'secret', 'host': 'db',
+                                  'port': 5432, 'sslmode': 'require'})
+        self.assertEqual(listener_params({'NAME': 'nmc', 'HOST': '', 'PORT': ''}), {'dbname': 'nmc'})
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.customer = User.objects.create_user(username='customer', password='test')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.customer)}')
+        self.category = ServiceCategory.objects.create(name='plumber')
+        self.provider = ServiceProvider.objects.create(
+            user=User.objects.create(username='pat'), category=self.category,
+            bio='Pipes', phone='1', address='', latitude=31.52, longitude=74.35
+        )
+
+    def test_matching_etag_gets_304_without_queries(self):
+        first = self.client.get('/api/categories/')
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('"'))
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        with self.assertNumQueries(0):
+            third = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(third.json(), first.json())
+
+    def test_writes_change_the_etag(self):
+        url = f'/api/providers/{self.provider.pk}/'
+        first = self.client.get(url)
+        self.provider.bio = 'Drains'
+        self.provider.save()
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['bio'], 'Drains')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+        # Bulk writes skip signals and bump versions themselves
+        buffer = LocationBuffer()
+        buffer.add(self.provider.pk, 31.6, 74.4)
+        buffer.flush()
+        self.assertEqual(self.client.get(url).json()['latitude'], 31.6)
+
+    def test_only_per_provider_review_lists_are_cached(self):
+        url = f'/api/reviews/?provider_id={self.provider.pk}'
+        first = self.client.get(url)
+        self.assertIn('ETag', first)
+        self.assertNotIn('ETag', self.client.get('/api/reviews/'))
+
+        response = self.client.post('/api/reviews/', {
+            'provider': self.provider.pk, 'customer': self.customer.pk, 'rating': 5, 'comment': 'ok'
+        })
+        self.assertEqual(response.status_code, 201)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.json()['results']), 1)
+
+    def test_deactivated_and_deleted_users_are_rejected(self):
+        url = f'/api/providers/{self.provider.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.customer.delete()
+        self.assertEqual(self.client.get('/api/categories/').status_code, 401)
+
+    @override_settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com'])
+    def test_responses_are_cached_per_host(self):
+        ServiceProvider.objects.filter(pk=self.provider.pk).update(profile_image='profiles/pat.png')
+        url = f'/api/providers/{self.provider.pk}/'
+        first = self.client.get(url, HTTP_HOST='a.example.com').json()['profile_image']
+        second = self.client.get(url, HTTP_HOST='b.example.com').json()['profile_image']
+        self.assertTrue(first.startswith('http://a.example.com/'))
+        self.assertTrue(second.startswith('http://b.example.com/'))
+
+
+class WarmupTests(TestCase):
+    def test_warm_up_primes_the_registry(self):
+        ServiceCategory.objects.create(name='plumber')
+        category_registry.clear()
+        self.addCleanup(category_registry.clear)
+        with self.assertLogs('services.warmup', 'INFO'):
+            warm_up()
+        with self.assertNumQueries(0):
+            self.assertEqual(category_registry.names(), ['plumber'])
+
+    def test_per_process_state_is_reported(self):
+        self.assertEqual(len(per_process_state()), 2)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=shared, RATE_LIMIT_STORE={'BACKEND': 'services.ratelimit.CacheBucketStore'}):
+            self.assertEqual(per_process_state(), [])
+
+    def test_workers_can_require_shared_state(self):
+        warnings = []
+        worker = SimpleNamespace(pid=1, log=SimpleNamespace(warning=lambda *args: warnings.append(args)))
+        conf = load_gunicorn_conf(WEB_CONCURRENCY='2', GUNICORN_WARMUP='False')
+        conf.post_worker_init(worker)
+        self.assertEqual(len(warnings), 2)
+        conf = load_gunicorn_conf(WEB_CONCURRENCY='2', GUNICORN_WARMUP='False', GUNICORN_SHARED_STATE='require')
+        with self.assertRaises(RuntimeError):
+            conf.post_worker_init(worker)
+        conf = load_gunicorn_conf(WEB_CONCURRENCY='1', GUNICORN_SHARED_STATE='require', GUNICORN_WARMUP='False')
+        conf.post_worker_init(worker)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(TestCase):
+    def route(self, method, path):
+        seen = []
+
+        def view(request):
+            # The handler calls process_view between entering the middleware and the view
+            middleware.process_view(request, None, (), {})
+            seen.append(ReplicaRouter().db_for_read(Review))
+
+        request = RequestFactory().generic(method, path)
+        request.resolver_match = resolve(request.path)
+        middleware = ReplicaRoutingMiddleware(view)
+        middleware(request)
+        return seen[0]
+
+    def test_list_and_discover_gets_read_from_replicas(self):
+        self.assertEqual(self.route('GET', '/api/discover/?service=plumber'), 'replica_1')
+        self.assertEqual(self.route('GET', '/api/requests/'), 'replica_1')
+
+    @override_settings(REPLICA_READ_URL_NAMES=['review-list'])
+    def test_cached_responses_are_built_from_the_primary(self):
+        seen = []
+        get_queryset = ReviewListCreate.get_queryset
+
+        def recording(view):
+            seen.append(replica_reads.get())
+            return get_queryset(view)
+
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='reader', password='p'))
+        with patch.object(ReviewListCreate, 'get_queryset', recording):
+            client.get('/api/reviews/?provider_id=1')
+            client.get('/api/reviews/')  # per-user, never cached
+        self.assertEqual(seen, [False, True])
+
+    async def test_async_requests_read_from_replicas(self):
+        seen = []
+
+        async def view(request):
+            await middleware.process_view(request, None, (), {})
+            seen.append(ReplicaRouter().db_for_read(Review))
+
+        request = RequestFactory().get('/api/discover/async/?service=plumber')
+        request.resolver_match = resolve(request.path)
+        middleware = ReplicaRoutingMiddleware(view)
+        await middleware(request)
+        self.assertEqual(seen, ['replica_1'])
+        self.assertFalse(replica_reads.get())
+
+    def test_writes_and_other_reads_use_the_primary(self):
+        self.assertEqual(self.route('POST', '/api/reviews/'), 'default')
+        self.assertEqual(self.route('GET', '/api/places/stub-1/'), 'default')
+        self.assertEqual(ReplicaRouter().db_for_write(Review), 'default')
+        self.assertFalse(replica_reads.get())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.clear()
+        reset_upstreams()
+        self.client = APIClient()
+        self.server = StubServer({'/details/json': fake_place_details}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_PLACES_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_requests_are_broken_down_by_view(self):
+        self.client.get('/api/places/stub-1/')
+        body = self.client.get('/metrics').content.decode()
+        labels = '{view="place-details",method="GET"}'
+        self.assertIn(f'nmc_request_duration_seconds_count{labels} 1', body)
+        self.assertIn('nmc_requests_total{view="place-details",method="GET",status="200"} 1', body)
+        self.assertIn(f'nmc_request_db_queries_count{labels} 1', body)
+        self.assertIn('nmc_request_upstream_seconds_count{view="place-details",method="GET",upstream="google_places"} 1',
+                      body)
+        self.assertIn('nmc_upstream_call_seconds_count{upstream="google_places"} 1', body)
+
+    def test_cache_hits_and_misses_are_exported(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        get_cache('PLACES_CACHE').get('absent')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('nmc_cache_lookups_total{cache="places_cache",result="hit"} 0', body)
+        self.assertIn('nmc_cache_lookups_total{cache="places_cache",result="miss"} 1', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_protects_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_sampled_requests_are_profiled_to_disk(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=directory):
+            self.client.get('/api/places/stub-1/')
+            self.assertEqual(len([f for f in os.listdir(directory) if f.endswith('.prof')]), 1)
+
+
+class CoalescingAndRateLimitTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        reset_upstreams()
+        reset_rate_limits()
+        self.addCleanup(reset_rate_limits)
+
+        def slow_search(query):
+            time.sleep(0.2)
+            return fake_nearby_search(query)
+
+        self.server = StubServer({'/nearbysearch/json': slow_search}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(GOOGLE_PLACES_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_concurrent_identical_searches_share_one_call(self):
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda _: get_nearby_services(31.5204, 74.3587, 'plumber', 5000), range(5)))
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    async def test_concurrent_async_searches_share_one_call(self):
+        results = await asyncio.gather(*(aget_nearby_services(31.5204, 74.3587, 'plumber', 5000, '') for _ in range(3)))
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 1)
+        self.assertEqual(results[0], results[2])
+
+    @override_settings(UPSTREAM_RATE_LIMITS={'google_places': {'RATE': 0.001, 'BURST': 1}})
+    def test_upstream_bucket_rejects_calls_without_network(self):
+        get_nearby_services(31.5204, 74.3587, 'plumber', 5000)
+        with self.assertRaisesMessage(Exception, 'rate limit'):
+            get_nearby_services(31.5204, 74.3587, 'carpenter', 5000)
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 1)
+
+    @override_settings(CLIENT_RATE_LIMITS={'discover': {'RATE': 0.01, 'BURST': 2}})
+    def test_clients_are_throttled_per_bucket(self):
+        client = APIClient()
+        for _ in range(2):
+            self.assertEqual(client.get('/api/discover/').status_code, 400)
+        response = client.get('/api/discover/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        other = User.objects.create(username='other')
+        client.force_authenticate(user=other)
+        self.assertEqual(client.get('/api/discover/').status_code, 400)
+
+    @override_settings(UPSTREAM_RATE_LIMITS={'google_places': {'RATE': 0.001, 'BURST': 0}})
+    def test_throttled_places_degrades_discover_to_local_results(self):
+        category = ServiceCategory.objects.create(name='plumber')
+        ServiceProvider.objects.create(
+            user=User.objects.create_user(username='near'), category=category, bio='', phone='1',
+            address='', latitude=31.5249, longitude=74.3587
+        )
+        with patch('services.views.get_current_location', return_value=(31.5204, 74.3587)):
+            sync = APIClient().get('/api/discover/?service=plumber')
+            reset_rate_limits()
+            async_ = self.client.get('/api/discover/async/?service=plumber')
+        for response in (sync, async_):
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertTrue(data['partial'] and data['google_unavailable'])
+            self.assertEqual((data['google_results'], len(data['local_providers'])), ([], 1))
+        self.assertEqual(self.server.hits('/nearbysearch/json'), 0)
+
+    @override_settings(UPSTREAM_RATE_LIMITS={'nominatim': {'RATE': 0.1, 'BURST': 0}})
+    def test_throttled_geocoding_is_not_blamed_on_the_address(self):
+        ServiceCategory.objects.create(name='plumber')
+        response = APIClient().get('/api/discover/', {'service': 'plumber', 'address': '123 Main St, Lahore'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+        reset_rate_limits()
+        response = self.client.get('/api/discover/async/', {'service': 'plumber', 'address': '123 Main St, Lahore'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_place_details_reports_an_open_circuit_as_unavailable(self):
+        with patch('services.places.get_place_details', side_effect=CircuitOpenError('google_places circuit is open', 12.2)):
+            response = APIClient().get('/api/places/stub-1/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '13')
+
+    def test_buckets_refill_at_the_configured_rate(self):
+        buckets = LocalBucketStore()
+        self.assertEqual(buckets.take('k', rate=2, burst=1, now=0), 0)
+        self.assertAlmostEqual(buckets.take('k', rate=2, burst=1, now=0.25), 0.25)
+        self.assertEqual(buckets.take('k', rate=2, burst=1, now=0.5), 0)
+
+
+class ProviderSnapshotTests(TestCase):
+    def setUp(self):
+        self.category = ServiceCategory.objects.create(name='plumber')
+        other = ServiceCategory.objects.create(name='electrician')
+        # Roughly 0.5km, 3km and 20km north of the search point, plus another category's provider
+        for i, (lat, category) in enumerate(((31.5249, self.category), (31.5474, self.category),
+                                             (31.7004, self.category), (31.5250, other))):
+            user = User.objects.create_user(username=f'p{i}', first_name='Ali' if i == 1 else '', password='test')
+            provider = ServiceProvider.objects.create(
+                user=user, category=category, bio='', phone=f'0300{i}', address=f'Street {i}, Lahore',
+                latitude=lat, longitude=74.3587
+            )
+            ServiceProvider.objects.filter(pk=provider.pk).update(bayesian_rating=float(i))
+        ServiceProvider.objects.create(
+            user=User.objects.create_user(username='unlocated'), category=self.category, bio='', phone='1', address=''
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'providers.snap')
+        override = override_settings(PROVIDER_SNAPSHOT_PATH=self.path, PROVIDER_SNAPSHOT_CHECK_INTERVAL=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        provider_snapshot.clear()
+        self.addCleanup(provider_snapshot.clear)
+
+    def build(self):
+        out = io.StringIO()
+        call_command('build_provider_snapshot', stdout=out)
+        return out.getvalue()
+
+    def test_snapshot_results_match_the_database(self):
+        with override_settings(PROVIDER_SNAPSHOT_PATH=''):
+            expected = {sort: find_local_providers(self.category, 31.5204, 74.3587, 10000, sort=sort)
+                        for sort in ('distance', 'rating')}
+        self.assertIn('Wrote 4 providers', self.build())
+        # One primary key lookup per search instead of a range scan
+        with self.assertNumQueries(2):
+            for sort, results in expected.items():
+                self.assertEqual(find_local_providers(self.category, 31.5204, 74.3587, 10000, sort=sort), results)
+        self.assertEqual([r['provider_id'] for r in expected['distance']],
+                         list(ServiceProvider.objects.filter(user__username__in=['p0', 'p1']).values_list('pk', flat=True)))
+        self.assertEqual(expected['rating'][0]['name'], 'Ali (NearMeConnect)')
+
+    def test_published_snapshot_is_picked_up(self):
+        self.build()
+        self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 50000)), 3)
+        old = provider_snapshot.get()
+        ServiceProvider.objects.filter(latitude__gt=31.6).delete()
+        # Deleted providers are dropped before the snapshot is rebuilt
+        self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 50000)), 2)
+        self.build()
+        self.assertIsNot(provider_snapshot.get(), old)
+        self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 50000)), 2)
+        # Callers still holding the replaced mapping keep reading it
+        self.assertEqual(len(old.nearest(self.category.id, 31.5204, 74.3587, 50000)), 3)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['providers.snap'])
+
+    def test_moved_providers_are_ranked_where_they_are_now(self):
+        self.build()
+        far = ServiceProvider.objects.get(user__username='p1')
+        ServiceProvider.objects.filter(pk=far.pk).update(latitude=31.5205)
+        results = find_local_providers(self.category, 31.5204, 74.3587, 10000)
+        self.assertEqual(results[0]['provider_id'], far.pk)
+        self.assertEqual(results[0]['location']['lat'], 31.5205)
+
+    def test_provider_writes_queue_one_rebuild(self):
+        provider = ServiceProvider.objects.get(user__username='p2')
+        provider.latitude = 31.53
+        provider.save()
+        provider.save()
+        self.assertEqual(Job.objects.filter(name='build_provider_snapshot', status=Job.QUEUED).count(), 1)
+        Job.objects.update(run_after=timezone.now())
+        run_pending()
+        self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 10000)), 3)
+
+    def test_stale_snapshot_falls_back_to_the_database(self):
+        self.build()
+        with override_settings(PROVIDER_SNAPSHOT_MAX_AGE=-1), self.assertLogs('services.snapshot', 'WARNING'):
+            self.assertIsNone(provider_snapshot.get())
+            self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 10000)), 2)
+
+    def test_missing_or_corrupt_snapshot_falls_back_to_the_database(self):
+        self.assertIsNone(provider_snapshot.get())
+        self.assertEqual(len(find_local_providers(self.category, 31.5204, 74.3587, 10000)), 2)
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        with self.assertLogs('services.snapshot', 'ERROR'):
+            self.assertIsNone(provider_snapshot.get())
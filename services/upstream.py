@@ -0,0 +1,232 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .instrumentation import record_upstream
+from .metrics import Histogram
+from .ratelimit import acquire_upstream
+# services/upstream.py
+
+# Responses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network while an upstream's breaker is open"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls
+    for `reset_timeout` seconds, then lets one trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def retry_after(self):
+        """Seconds until the breaker lets a trial call through"""
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a trial slot taken by allow() for a call that never reached the upstream"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class Upstream:
+    """
+    Outbound client for one upstream host: a pooled keep-alive session,
+    connect/read timeouts, bounded retries with jittered exponential backoff,
+    a circuit breaker and a latency histogram covering every attempt.
+    Each call takes a token from the upstream's UPSTREAM_RATE_LIMITS bucket first.
+    """
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.2,
+                 failure_threshold=5, reset_timeout=30, pool_size=20):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = Histogram()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _sleep_for(self, attempt):
+        # Full jitter keeps retrying workers from hitting the upstream in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def observe(self, seconds):
+        self.latency.observe(seconds)
+        record_upstream(self.name, seconds)
+
+    def _admit(self):
+        """Pass the breaker and take a rate-limit token, or raise without calling the upstream"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open", self.breaker.retry_after())
+        try:
+            acquire_upstream(self.name)
+        except BaseException:
+            self.breaker.release()
+            raise
+
+    def _settle(self, response):
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        """GET with retries; returns the final response or raises the last error"""
+        self._admit()
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self._get_with_retries(url, kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        return self._settle(response)
+
+    def _get_with_retries(self, url, kwargs):
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+                response = None
+            finally:
+                self.observe(time.perf_counter() - start)
+            if response is not None and (response.status_code not in RETRY_STATUSES or attempt == self.retries):
+                return response
+            time.sleep(self._sleep_for(attempt))
+
+    def get_async_client(self):
+        """
+        Return the httpx client for the running event loop.
+        Clients are pooled per loop, so under ASGI every request shares one pool.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = self.timeout
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aget(self, url, **kwargs):
+        """Async counterpart of get() over the per-loop httpx pool"""
+        self._admit()
+        try:
+            response = await self._aget_with_retries(url, kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by the caller's deadline: no verdict on the upstream
+            self.breaker.release()
+            raise
+        return self._settle(response)
+
+    async def _aget_with_retries(self, url, kwargs):
+        client = self.get_async_client()
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await client.get(url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                response = None
+            finally:
+                self.observe(time.perf_counter() - start)
+            if response is not None and (response.status_code not in RETRY_STATUSES or attempt == self.retries):
+                return response
+            await asyncio.sleep(self._sleep_for(attempt))
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name):
+    """Return the shared client for an upstream configured in settings.UPSTREAMS"""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            config = {**settings.UPSTREAM_DEFAULTS, **settings.UPSTREAMS.get(name, {})}
+            _upstreams[name] = Upstream(name, **{k.lower(): v for k, v in config.items()})
+        return _upstreams[name]
+
+
+def all_upstreams():
+    with _upstreams_lock:
+        return dict(_upstreams)
+
+
+def reset_upstreams():
+    """Drop shared clients so they are rebuilt from current settings"""
+    with _upstreams_lock:
+        for upstream in _upstreams.values():
+            upstream.session.close()
+        _upstreams.clear()
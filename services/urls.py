@@ -1,12 +1,13 @@
 from django.urls import path
 from .views import (
     UserCreateView, CustomTokenObtainPairView,
-    discover_services, place_details, update_provider_location,
+    discover_services, discover_services_async, provider_feed, place_details, update_provider_location, ingest_locations,
     create_service_request,
     ServiceCategoryListCreate, ServiceCategoryRetrieveUpdateDestroy,
     ServiceProviderListCreate, ServiceProviderRetrieveUpdateDestroy,
     ServiceRequestListCreate, ServiceRequestRetrieveUpdateDestroy,
-    ReviewListCreate, ReviewRetrieveUpdateDestroy, admin_login 
+    ReviewListCreate, ReviewRetrieveUpdateDestroy, admin_login,
+    provider_import, provider_export,
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -18,8 +19,11 @@ urlpatterns = [
     
     # Special function endpoints
     path('discover/', discover_services, name='discover-services'),
+    path('discover/async/', discover_services_async, name='discover-services-async'),
+    path('feed/', provider_feed, name='provider-feed'),
     path('places/<str:place_id>/', place_details, name='place-details'),
     path('update-location/', update_provider_location, name='update-location'),
+    path('locations/', ingest_locations, name='location-ingest'),
     path('providers/<int:provider_id>/request/', create_service_request, name='create-request'),
     
     # CRUD endpoints
@@ -32,4 +36,6 @@ urlpatterns = [
     path('reviews/', ReviewListCreate.as_view(), name='review-list'),
     path('reviews/<int:pk>/', ReviewRetrieveUpdateDestroy.as_view(), name='review-detail'),
     path('auth/admin/login/', admin_login, name='admin-login'),
+    path('admin/providers/import/', provider_import, name='provider-import'),
+    path('admin/providers/export/', provider_export, name='provider-export'),
 ]
\ No newline at end of file
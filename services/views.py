@@ -1,12 +1,36 @@
-from rest_framework.decorators import api_view, permission_classes
+import asyncio
+import codecs
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser,AllowAny
-from .models import ServiceCategory, ServiceProvider, ServiceRequest, Review
-
-from .google_api import get_nearby_services, get_current_location, geocode_address, get_place_details, validate_coordinates
-from django.db.models import F, ExpressionWrapper, FloatField
-from django.db.models.functions import Sqrt, Power
+from .models import ServiceCategory, ServiceProvider, ServiceRequest, Review, PlaceDetails, UserProfile
+
+from .google_api import UNAVAILABLE_ERRORS, get_nearby_services, aget_nearby_services, get_current_location, validate_coordinates
+from .places import get_cached_place_details, parse_fields
+from .geocoding import geocode_address
+from .discovery import find_local_providers, parse_radius, parse_sort, region_snapshot, resolve_category, valid_service_types
+from .feed import format_sse, get_broker
+from .ratings import apply_review_change
+from .bulk import FORMATS, detect_format, export_providers, import_providers, read_rows
+from .pagination import KeysetPagination, ProviderPagination, RecentFirstPagination
+from .streaming import StreamingListMixin
+from .httpcache import ConditionalGetMixin
+from .ratelimit import DiscoverThrottle, PlaceDetailsThrottle, client_wait
+from .tasks import queue_geocoding
+from .locations import location_buffer, parse_ping
+from .distance import distance_m
+from .metrics import registry as metrics_registry
+from .upstream import all_upstreams
+from .cache import all_caches
+from django.db import close_old_connections, transaction
 from django.shortcuts import get_object_or_404
 import requests
 from rest_framework import generics, status
@@ -18,6 +42,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import (
     ServiceCategorySerializer, 
     ServiceProviderSerializer,
+    ProviderReadSerializer,
     ServiceRequestSerializer,
     ReviewSerializer
 )
@@ -62,7 +87,6 @@ def admin_login(request):
     username = request.data.get('username')
     
     password = request.data.get('password')
-    print(username,password)
     user = authenticate(username=username, password=password)
     
     if user is not None and user.is_staff:
@@ -75,6 +99,50 @@ def admin_login(request):
         })
     return Response({"error": "Invalid admin credentials"}, status=400)
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def provider_import(request):
+    """
+    Bulk-create providers from an uploaded CSV or JSONL file
+    POST /api/admin/providers/import/ (multipart: file, optional file_format and start_after)
+    Pass the returned last_line as start_after to resume an interrupted upload.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'A file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.data.get('file_format') or detect_format(upload.name)
+    if fmt not in FORMATS:
+        return Response({'error': f'Format must be one of: {", ".join(FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start_after = int(request.data.get('start_after', 0))
+    except ValueError:
+        return Response({'error': 'start_after must be a line number'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Uploads iterate line by line from memory or a temp file, never as one string
+    result = import_providers(read_rows(codecs.iterdecode(upload, 'utf-8-sig'), fmt), start_after=start_after)
+    return Response({
+        'created': result.created,
+        'last_line': result.last_line,
+        'errors': [{'line': line, 'error': message} for line, message in result.errors],
+    }, status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def provider_export(request):
+    """
+    Stream every provider as CSV or JSONL
+    GET /api/admin/providers/export/?file_format=jsonl
+    ('format' is taken by DRF's renderer override)
+    """
+    fmt = request.GET.get('file_format', 'csv')
+    if fmt not in FORMATS:
+        return Response({'error': f'Format must be one of: {", ".join(FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_providers(fmt=fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="providers.{fmt}"'
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_service_requests(request):
@@ -94,26 +162,39 @@ def user_service_requests(request):
 # ------------------------- Provider List -------------------------
 @api_view(['GET'])
 def provider_list(request):
-    providers = ServiceProvider.objects.all().select_related('user', 'category')
-    serializer = ServiceProviderSerializer(providers, many=True)
+    providers = ServiceProvider.objects.values(*ProviderReadSerializer.values)
+    serializer = ProviderReadSerializer(providers, many=True, context={'request': request})
     return Response(serializer.data)
 
 # ------------------------- Provider Detail -------------------------
 @api_view(['GET'])
 def provider_detail(request, pk):
     try:
-        provider = ServiceProvider.objects.get(pk=pk)
-        serializer = ServiceProviderSerializer(provider)
+        provider = ServiceProvider.objects.values(*ProviderReadSerializer.values).get(pk=pk)
+        serializer = ProviderReadSerializer(provider, context={'request': request})
         return Response(serializer.data)
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider not found'}, status=status.HTTP_404_NOT_FOUND)
 
 # ------------------------- Discover Services -------------------------
+def upstream_unavailable(error, response_class=Response):
+    """503 with Retry-After for an upstream that is rate limited or behind an open circuit"""
+    response = response_class(
+        {'error': 'A location service is temporarily unavailable, please retry shortly'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(max(1, math.ceil(error.retry_after or 0)))
+    return response
+
+
 @api_view(['GET'])
+@throttle_classes([DiscoverThrottle])
 def discover_services(request):
     """
     Discover services near user with distance-based sorting
-    Example: /api/discover/?service=electrician&address=123+Main+St&radius=3000
+    Example: /api/discover/?service=electrician&address=123+Main+St&radius=3000&sort=rating
+    While Google Places is rate limited or its circuit is open, local providers are
+    returned alone with `partial` and `google_unavailable` set.
     """
     service_type = request.GET.get('service')
     address = request.GET.get('address')
@@ -122,13 +203,16 @@ def discover_services(request):
     # Validate service type
     if not service_type:
         return Response({'error': 'Service type is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        sort = parse_sort(request.GET.get('sort'))
+    except ValueError:
+        return Response({'error': 'Sort must be one of: distance, rating'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        valid_services = ServiceCategory.objects.values_list('name', flat=True)
-        valid_services = [s.lower() for s in valid_services]
-        if service_type.lower() not in valid_services:
+        category = resolve_category(service_type)
+        if category is None:
             return Response(
-                {'error': f'Invalid service type. Valid options: {", ".join(valid_services)}'},
+                {'error': f'Invalid service type. Valid options: {", ".join(valid_service_types())}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
     except Exception:
@@ -141,44 +225,26 @@ def discover_services(request):
             return Response({'error': 'Could not determine valid location.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate radius
-        radius = int(radius)
-        if radius <= 0 or radius > 50000:
-            raise ValueError
+        radius = parse_radius(radius)
 
         # Get Google Places results
-        results = get_nearby_services(lat, lng, service_type.lower(), radius)
-
-        # Get local providers sorted by distance
-        local_providers = ServiceProvider.objects.filter(
-            category__name__iexact=service_type
-        ).annotate(
-            distance=ExpressionWrapper(
-                Sqrt(
-                    Power(F('latitude') - lat, 2) + 
-                    Power(F('longitude') - lng, 2)
-                ),
-                output_field=FloatField()
-            )
-        ).order_by('distance')[:10]  # Get 10 nearest providers
-
-        local_results = [{
-            'name': f"{p.user.get_full_name() or p.user.username} (NearMeConnect)",
-            'address': p.address,
-            'location': {'lat': p.latitude, 'lng': p.longitude},
-            'distance_km': round(p.distance * 111, 2),  # Convert to approximate km
-            'maps_link': f"https://www.google.com/maps/search/?api=1&query={p.latitude},{p.longitude}",
-            'phone': p.phone,
-            'rating': p.rating,
-            'is_local': True,
-            'provider_id': p.id
-        } for p in local_providers]
+        google_unavailable = False
+        try:
+            results = get_nearby_services(lat, lng, service_type.lower(), radius, category.google_type or '')
+        except UNAVAILABLE_ERRORS:
+            results, google_unavailable = {}, True
+
+        # Get local providers within the radius, sorted by distance
+        local_results = find_local_providers(category, lat, lng, radius, sort=sort)
 
         return Response({
             'service_type': service_type,
             'user_location': {'lat': lat, 'lng': lng},
             'radius': radius,
             'google_results': results.get('results', []),
-            'local_providers': local_results
+            'local_providers': local_results,
+            'partial': google_unavailable,
+            'google_unavailable': google_unavailable
         })
 
     except ValueError:
@@ -186,6 +252,9 @@ def discover_services(request):
             {'error': 'Radius must be a positive number (max 50000)'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    except UNAVAILABLE_ERRORS as e:
+        # Geocoding was throttled; the address itself may be fine
+        return upstream_unavailable(e)
     except requests.exceptions.RequestException as e:
         return Response(
             {'error': f'Google API request failed: {str(e)}'},
@@ -197,6 +266,190 @@ def discover_services(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+
+def off_shared_thread(func):
+    """
+    sync_to_async for calls that mostly wait on the network (Nominatim, ipinfo). They run
+    in the executor pool rather than the one thread shared by every request's ORM work,
+    so a slow lookup left behind by a timeout does not hold up other requests.
+    """
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Geocode cache reads open a connection in the pool thread
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+@require_GET
+async def discover_services_async(request):
+    """
+    Async discover with per-upstream timeouts
+    Example: /api/discover/async/?service=electrician&address=123+Main+St&radius=3000
+    Category validation runs alongside geocoding, then the Google Places call runs
+    alongside the local provider query. An upstream that exceeds its timeout in
+    DISCOVER_TIMEOUTS is listed in `timed_out` and the rest is returned as partial results,
+    as is a rate limited or circuit-broken Google Places (`google_unavailable`).
+    Shares the 'discover' client rate limit, keyed by remote address here.
+    """
+    wait = client_wait(request, 'discover')
+    if wait:
+        response = JsonResponse({'error': 'Too many requests'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+
+    service_type = request.GET.get('service')
+    address = request.GET.get('address')
+
+    if not service_type:
+        return JsonResponse({'error': 'Service type is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        radius = parse_radius(request.GET.get('radius', 5000))
+    except ValueError:
+        return JsonResponse({'error': 'Radius must be a positive number (max 50000)'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        sort = parse_sort(request.GET.get('sort'))
+    except ValueError:
+        return JsonResponse({'error': 'Sort must be one of: distance, rating'}, status=status.HTTP_400_BAD_REQUEST)
+
+    timeouts = settings.DISCOVER_TIMEOUTS
+    locate = off_shared_thread(geocode_address)(address) if address else off_shared_thread(get_current_location)()
+    try:
+        category, (lat, lng) = await asyncio.gather(
+            sync_to_async(resolve_category)(service_type),
+            asyncio.wait_for(locate, timeouts['geocode']),
+        )
+    except asyncio.TimeoutError:
+        return JsonResponse({'error': 'Location lookup timed out'}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+    except UNAVAILABLE_ERRORS as e:
+        return upstream_unavailable(e, JsonResponse)
+
+    if category is None:
+        valid_services = await sync_to_async(valid_service_types)()
+        return JsonResponse(
+            {'error': f'Invalid service type. Valid options: {", ".join(valid_services)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not lat or not lng or not validate_coordinates(lat, lng):
+        return JsonResponse({'error': 'Could not determine valid location.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, local_results = await asyncio.gather(
+        asyncio.wait_for(aget_nearby_services(lat, lng, service_type.lower(), radius, category.google_type or ''), timeouts['google']),
+        asyncio.wait_for(sync_to_async(find_local_providers)(category, lat, lng, radius, sort=sort), timeouts['local']),
+        return_exceptions=True,
+    )
+
+    timed_out = []
+    google_unavailable = isinstance(results, UNAVAILABLE_ERRORS)
+    if isinstance(results, asyncio.TimeoutError):
+        timed_out.append('google')
+        results = {}
+    elif google_unavailable:
+        results = {}
+    elif isinstance(results, Exception):
+        return JsonResponse({'error': str(results)}, status=status.HTTP_502_BAD_GATEWAY)
+    if isinstance(local_results, asyncio.TimeoutError):
+        timed_out.append('local')
+        local_results = []
+    elif isinstance(local_results, Exception):
+        return JsonResponse({'error': str(local_results)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return JsonResponse({
+        'service_type': service_type,
+        'user_location': {'lat': lat, 'lng': lng},
+        'radius': radius,
+        'google_results': results.get('results', []),
+        'local_providers': local_results,
+        'partial': bool(timed_out) or google_unavailable,
+        'timed_out': timed_out,
+        'google_unavailable': google_unavailable
+    })
+
+@require_GET
+async def provider_feed(request):
+    """
+    Server-sent events for provider movement in a region
+    Example: /api/feed/?service=electrician&lat=31.52&lng=74.35&radius=3000
+    Opens with a `snapshot` event of the providers currently in the region, then sends
+    `location`, `left` and `removed` events as providers move, plus keep-alive comments.
+    `resync` means events were dropped for a slow client and the region should be reloaded.
+    Needs ASGI (nearmeconnect.asgi, GUNICORN_WORKER_CLASS=uvicorn). WSGI buffers the whole
+    endless stream before sending a byte while holding a worker thread, so it gets a 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The provider feed is only served over ASGI'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    service_type = request.GET.get('service')
+    if not service_type:
+        return JsonResponse({'error': 'Service type is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        radius = parse_radius(request.GET.get('radius', 5000))
+    except ValueError:
+        return JsonResponse({'error': 'Radius must be a positive number (max 50000)'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat and lng are required numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not validate_coordinates(lat, lng):
+        return JsonResponse({'error': 'Invalid coordinates - out of valid range'}, status=status.HTTP_400_BAD_REQUEST)
+    category = await sync_to_async(resolve_category)(service_type)
+    if category is None:
+        valid_services = await sync_to_async(valid_service_types)()
+        return JsonResponse(
+            {'error': f'Invalid service type. Valid options: {", ".join(valid_services)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    config = settings.PROVIDER_FEED
+    broker = get_broker()
+    # Subscribe before the snapshot so no movement falls between the two
+    subscription = broker.subscribe(category.id, lat, lng, radius)
+    try:
+        snapshot = await sync_to_async(region_snapshot)(category, lat, lng, radius, config['SNAPSHOT_LIMIT'])
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    subscription.known.update(event['provider_id'] for event in snapshot)
+
+    async def events():
+        try:
+            yield f"retry: {config['RETRY_MS']}\n"
+            yield format_sse({'type': 'snapshot', 'providers': snapshot})
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), config['HEARTBEAT'])
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus scrape endpoint: per-view request, database and upstream histograms,
+    plus per-call latency of each upstream client and response cache hits and misses.
+    Figures cover this worker process only.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    upstream_calls = ('nmc_upstream_call_seconds', 'Latency of each upstream call attempt',
+                      {(('upstream', name),): upstream.latency for name, upstream in all_upstreams().items()})
+    cache_lookups = ('nmc_cache_lookups_total', 'Response cache lookups by result', {
+        (('cache', name.lower()), ('result', result)): count
+        for name, cache in all_caches().items()
+        for result, count in (('hit', cache.hits), ('miss', cache.misses))
+    })
+    return HttpResponse(metrics_registry.render([upstream_calls], [cache_lookups]),
+                        content_type='text/plain; version=0.0.4')
+
 # ------------------------- Update Provider Location -------------------------
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -221,7 +474,7 @@ def update_provider_location(request):
         provider = request.user.serviceprovider
         provider.latitude = lat
         provider.longitude = lng
-        provider.save()
+        provider.save(update_fields=['latitude', 'longitude'])
         
         return Response({
             'message': 'Location updated successfully',
@@ -234,7 +487,58 @@ def update_provider_location(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def ingest_locations(request):
+    """
+    Accept a batch of GPS pings; positions are buffered and written in bulk
+    POST /api/locations/ {"pings": [{"latitude": .., "longitude": .., "timestamp": ..}, ...]}
+    Staff may set "provider_id" per ping to relay pings for many providers.
+    """
+    pings = request.data.get('pings')
+    if not isinstance(pings, list) or not pings:
+        return Response({'error': 'pings must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(pings) > settings.LOCATION_MAX_PINGS:
+        return Response({'error': f'At most {settings.LOCATION_MAX_PINGS} pings per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    own_id = getattr(getattr(request.user, 'serviceprovider', None), 'pk', None)
+    if own_id is None and not request.user.is_staff:
+        return Response({'error': 'Only service providers can update location'}, status=status.HTTP_403_FORBIDDEN)
+
+    accepted, rejected, parsed = 0, [], []
+    for index, ping in enumerate(pings):
+        try:
+            if not isinstance(ping, dict):
+                raise ValueError('ping must be an object')
+            lat, lng, timestamp = parse_ping(ping)
+            provider_id = own_id
+            if request.user.is_staff and ping.get('provider_id') is not None:
+                try:
+                    provider_id = int(ping['provider_id'])
+                except (TypeError, ValueError):
+                    raise ValueError('provider_id must be an integer')
+            if provider_id is None:
+                raise ValueError('provider_id is required')
+        except ValueError as e:
+            rejected.append({'index': index, 'error': str(e)})
+            continue
+        parsed.append((index, provider_id, lat, lng, timestamp))
+
+    # Relayed ids are checked in one query so pings for unknown providers never reach the buffer
+    relayed = {provider_id for _, provider_id, *_ in parsed} - {own_id}
+    known = set(ServiceProvider.objects.filter(pk__in=relayed).values_list('pk', flat=True)) if relayed else set()
+    for index, provider_id, lat, lng, timestamp in parsed:
+        if provider_id != own_id and provider_id not in known:
+            rejected.append({'index': index, 'error': 'unknown provider_id'})
+            continue
+        location_buffer.add(provider_id, lat, lng, timestamp)
+        accepted += 1
+    rejected.sort(key=lambda r: r['index'])
+    return Response({'accepted': accepted, 'rejected': rejected}, status=status.HTTP_202_ACCEPTED)
+
 # ------------------------- Create Service Request -------------------------
+MAX_REQUEST_DISTANCE_M = 11000
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_service_request(request, provider_id):
@@ -249,9 +553,15 @@ def create_service_request(request, provider_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Calculate distance (simplified haversine)
-    distance = ((lat - provider.latitude)**2 + (lng - provider.longitude)**2)**0.5
-    if distance > 0.1:  # ~11km threshold
+    if not provider.has_location:
+        return Response(
+            {'error': 'Provider location is not known yet'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Calculate great-circle distance to the provider
+    distance = distance_m(lat, lng, provider.latitude, provider.longitude)
+    if distance > MAX_REQUEST_DISTANCE_M:
         return Response(
             {'error': 'Provider is too far from your location'},
             status=status.HTTP_400_BAD_REQUEST
@@ -264,37 +574,58 @@ def create_service_request(request, provider_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-    # In views.py - update the function name
-@api_view(['GET'])
-def place_details(request, place_id):  # Changed from get_place_details
-    if not place_id:
-        return Response({'error': 'Place ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+# Columns behind ProviderReadSerializer output
+PROVIDER_READ_DEPENDENCIES = (ServiceProvider, User, UserProfile, ServiceCategory)
+
+
+class PlaceDetailsView(ConditionalGetMixin, generics.RetrieveAPIView):
+    """Local provider (numeric id) or Google place details, optionally limited by ?fields="""
+    cache_dependencies = (PlaceDetails,) + PROVIDER_READ_DEPENDENCIES
+    throttle_classes = [PlaceDetailsThrottle]
+
+    def retrieve(self, request, place_id):
+        if not place_id:
+            return Response({'error': 'Place ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if place_id.isdigit():
+            try:
+                provider = ServiceProvider.objects.values(*ProviderReadSerializer.values).get(pk=int(place_id))
+                serializer = ProviderReadSerializer(provider, context={'request': request})
+                return Response({'is_local': True, 'result': serializer.data})
+            except ServiceProvider.DoesNotExist:
+                pass
 
-    if place_id.isdigit():
         try:
-            provider = ServiceProvider.objects.get(pk=int(place_id))
-            serializer = ServiceProviderSerializer(provider)
-            return Response({'is_local': True, 'result': serializer.data})
-        except ServiceProvider.DoesNotExist:
-            pass
+            fields = parse_fields(request.GET.get('fields'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result, error = get_cached_place_details(place_id, fields)  # Served from the place details store when fresh
+        except UNAVAILABLE_ERRORS as e:
+            return upstream_unavailable(e)
+        except requests.exceptions.RequestException as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        if error:
+            return Response({'error': error.get('error_message', 'Place not found')}, 
+                           status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'is_local': False, 'result': result})
 
-    results = get_place_details(place_id)  # This calls the google_api function
-    if results.get('status') != 'OK':
-        return Response({'error': results.get('error_message', 'Place not found')}, 
-                       status=status.HTTP_404_NOT_FOUND)
 
-    return Response({'is_local': False, 'result': results.get('result')})
+place_details = PlaceDetailsView.as_view()
 
 
 #   CRUD
-class ServiceCategoryListCreate(generics.ListCreateAPIView):
+class ServiceCategoryListCreate(ConditionalGetMixin, generics.ListCreateAPIView):
+    cache_dependencies = (ServiceCategory,)
     queryset = ServiceCategory.objects.all()
     serializer_class = ServiceCategorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         if self.request.method == 'POST':
-            print("apicalled")
             return [IsAdminUser()]
         return super().get_permissions()
 
@@ -304,17 +635,44 @@ class ServiceCategoryRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView
     permission_classes = [IsAuthenticated,IsAdminUser]
 
 # ServiceProvider CRUD
-class ServiceProviderListCreate(generics.ListCreateAPIView):
-    queryset = ServiceProvider.objects.all()
+class ProviderReadMixin:
+    """Serve GET/HEAD from .values() rows through ProviderReadSerializer; writes use the model serializer"""
+
+    def get_queryset(self):
+        if self.request.method in ('GET', 'HEAD'):
+            return ServiceProvider.objects.values(*ProviderReadSerializer.values)
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if self.request.method in ('GET', 'HEAD'):
+            return ProviderReadSerializer
+        return super().get_serializer_class()
+
+
+class ServiceProviderListCreate(ProviderReadMixin, StreamingListMixin, generics.ListCreateAPIView):
+    # ?ordering=rating sorts on the precomputed Bayesian score, no join needed
+    queryset = ServiceProvider.objects.select_related('user__userprofile', 'category')
     serializer_class = ServiceProviderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ProviderPagination
+    stream_fields = {
+        'id': 'id', 'user_id': 'user_id', 'username': 'user__username',
+        'first_name': 'user__first_name', 'last_name': 'user__last_name',
+        'category_id': 'category_id', 'category': 'category__name',
+        'bio': 'bio', 'phone': 'phone', 'address': 'address',
+        'latitude': 'latitude', 'longitude': 'longitude',
+        'rating': 'rating', 'review_count': 'review_count', 'bayesian_rating': 'bayesian_rating',
+    }
 
     def perform_create(self, serializer):
         if self.request.user.userprofile.is_service_provider:
-            serializer.save(user=self.request.user)
+            provider = serializer.save(user=self.request.user)
+            if provider.address and not provider.has_location:
+                queue_geocoding(provider)
 
-class ServiceProviderRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
-    queryset = ServiceProvider.objects.all()
+class ServiceProviderRetrieveUpdateDestroy(ConditionalGetMixin, ProviderReadMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_dependencies = PROVIDER_READ_DEPENDENCIES
+    queryset = ServiceProvider.objects.select_related('user__userprofile', 'category')
     serializer_class = ServiceProviderSerializer
     permission_classes = [IsAuthenticated]
 
@@ -324,9 +682,14 @@ class ServiceProviderRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView
         return super().get_permissions()
 
 # ServiceRequest CRUD
-class ServiceRequestListCreate(generics.ListCreateAPIView):
+class ServiceRequestListCreate(StreamingListMixin, generics.ListCreateAPIView):
     serializer_class = ServiceRequestSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = RecentFirstPagination
+    stream_fields = {
+        'id': 'id', 'customer': 'customer_id', 'provider': 'provider_id', 'message': 'message',
+        'created_at': 'created_at', 'is_accepted': 'is_accepted', 'is_completed': 'is_completed',
+    }
 
     def get_queryset(self):
         user = self.request.user
@@ -344,21 +707,49 @@ class ServiceRequestRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView)
     permission_classes = [IsAuthenticated]
 
 # Review CRUD
-class ReviewListCreate(generics.ListCreateAPIView):
+class ReviewListCreate(ConditionalGetMixin, StreamingListMixin, generics.ListCreateAPIView):
+    cache_dependencies = (Review,)
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = RecentFirstPagination
+    stream_fields = {
+        'id': 'id', 'customer': 'customer_id', 'provider': 'provider_id',
+        'rating': 'rating', 'comment': 'comment', 'created_at': 'created_at',
+    }
 
     def get_queryset(self):
         provider_id = self.request.query_params.get('provider_id')
         if provider_id:
             return Review.objects.filter(provider_id=provider_id)
-        return Review.objects.filter(customer=self.request.user)
+        return Review.objects.filter(customer_id=self.request.user.id)
 
+    def is_cacheable(self, request):
+        # A user's own reviews are per-user; only the public per-provider lists are shared
+        return bool(request.query_params.get('provider_id')) and super().is_cacheable(request)
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(customer=self.request.user)
+        review = serializer.save(customer=self.request.user)
+        apply_review_change(review.provider_id, 1, review.rating)
 
 class ReviewRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_provider_id, old_rating = serializer.instance.provider_id, serializer.instance.rating
+        review = serializer.save()
+        if review.provider_id != old_provider_id:
+            apply_review_change(old_provider_id, -1, -old_rating)
+            apply_review_change(review.provider_id, 1, review.rating)
+        elif review.rating != old_rating:
+            apply_review_change(review.provider_id, 0, review.rating - old_rating)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        provider_id, rating = instance.provider_id, instance.rating
+        instance.delete()
+        apply_review_change(provider_id, -1, -rating)
     
\ No newline at end of file
@@ -0,0 +1,76 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.urls import get_resolver
+from .cache import get_cache
+from .feed import get_broker
+from .registry import category_registry
+from .snapshot import provider_snapshot
+# services/warmup.py
+
+logger = logging.getLogger(__name__)
+
+
+# Cache backends whose entries never leave the process that wrote them
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def per_process_state():
+    """
+    Describe state meant to be shared between server workers that the settings
+    keep in each process instead; empty when every worker sees the same state.
+    """
+    problems = []
+    default_cache = settings.CACHES['default']['BACKEND']
+    if default_cache in LOCAL_CACHE_BACKENDS:
+        problems.append(
+            f"CACHES['default'] uses {default_cache}: model versions, the category registry version and "
+            f"is_active flags stay in each worker, so other workers serve stale cached responses after a write"
+        )
+    store = settings.RATE_LIMIT_STORE
+    backend = store.get('BACKEND', 'services.ratelimit.LocalBucketStore')
+    if backend == 'services.ratelimit.LocalBucketStore' or (
+        backend == 'services.ratelimit.CacheBucketStore'
+        and settings.CACHES[store.get('CACHE_ALIAS', 'default')]['BACKEND'] in LOCAL_CACHE_BACKENDS
+    ):
+        problems.append("RATE_LIMIT_STORE keeps token buckets in each worker, so limits apply once per worker")
+    return problems
+
+
+def _warmup_host():
+    host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+    return host or 'localhost'
+
+
+def warm_up():
+    """
+    Do a first request's one-off work before the worker takes traffic: import every
+    view through the URL resolver, run WARMUP_PATHS through the middleware and DRF
+    stack, open database connections and load the category registry, provider
+    snapshot and caches. Returns the seconds spent.
+    """
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    # Anonymous requests that are answered before reaching the database or an upstream
+    client = Client(HTTP_HOST=_warmup_host(), raise_request_exception=False)
+    for path in settings.WARMUP_PATHS:
+        try:
+            client.get(path)
+        except Exception:
+            logger.exception("Warmup request to %s failed", path)
+    for alias in connections:
+        connections[alias].ensure_connection()
+    category_registry.load()
+    provider_snapshot.load()
+    for name in ('PLACES_CACHE', 'RESPONSE_CACHE'):
+        get_cache(name)
+    get_broker()
+    elapsed = time.perf_counter() - start
+    logger.info("Warmed up in %.0fms", elapsed * 1000)
+    return elapsed